@@ -116,7 +116,7 @@ def parse_args(docopt_args, require_features=False, predict_script=False):
     booleans = [
         '--abs', '--induce', '--verbose', '--retrain',
         '--binary', '--clear_cache', '--cost_sensitive',
-        '--gene_names', '--chain', '--save'
+        '--gene_names', '--chain', '--save', '--remote_map'
     ]
     for arg in booleans:
         if _query_doctop_dict(docopt_args, arg) is not None:
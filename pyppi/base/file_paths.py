@@ -10,6 +10,7 @@ __all__ = [
     "uniprot_sprot_dat",
     "default_db_path",
     "obo_file",
+    "go_snapshot_path",
     "psimi_obo_file",
     "ipr_names_path",
     "pfam_names_path",
@@ -28,7 +29,10 @@ __all__ = [
     "innate_i_mitab_path",
     "pina2_sif_path",
     "feature_cache_path",
+    "design_matrix_cache_path",
     "uniprot_map_path",
+    "uniprot_map_cache_path",
+    "uniprot_index_path",
     "classifier_path",
 ]
 
@@ -40,6 +44,7 @@ uniprot_trembl_dat = os.path.join(PATH, 'uniprot_trembl_human.dat.gz')
 uniprot_sprot_dat = os.path.join(PATH, 'uniprot_sprot_human.dat.gz')
 default_db_path = os.path.join(PATH, 'pyppi.db')
 obo_file = os.path.join(PATH, 'go.obo.gz')
+go_snapshot_path = os.path.join(PATH, 'go_snapshots/')
 psimi_obo_file = os.path.join(PATH, 'mi.obo.gz')
 ipr_names_path = os.path.join(PATH, 'entry.list')
 pfam_names_path = os.path.join(PATH, 'Pfam-A.clans.tsv.gz')
@@ -67,8 +72,11 @@ innate_i_mitab_path = os.path.join(PATH, 'networks/all.mitab.gz')
 pina2_sif_path = os.path.join(PATH, 'networks/Homo-sapiens-20140521.tsv.gz')
 pina2_mitab_path = os.path.join(PATH, 'networks/Homo-sapiens-20140521.tsv.gz')
 
-feature_cache_path = os.path.join(PATH, 'features.json.gz')
+feature_cache_path = os.path.join(PATH, 'features.db')
+design_matrix_cache_path = os.path.join(PATH, 'design_matrices/')
 uniprot_map_path = os.path.join(PATH, 'accession_map.json')
+uniprot_map_cache_path = os.path.join(PATH, 'accession_map_cache.jsonl')
+uniprot_index_path = os.path.join(PATH, 'uniprot_index/')
 classifier_path = os.path.join(PATH, 'classifier.pkl')
 
 
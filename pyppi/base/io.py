@@ -19,6 +19,8 @@ __all__ = [
     "pfam_name_map",
     "load_uniprot_accession_map",
     "save_uniprot_accession_map",
+    "load_uniprot_map_cache",
+    "append_uniprot_map_cache",
     "load_network_from_path",
     "save_network_to_path",
     "save_classifier",
@@ -31,10 +33,12 @@ __all__ = [
 import json
 import os
 import sys
+import time
 import gzip
 import pandas as pd
 import joblib
 import logging
+from collections import OrderedDict
 from urllib.request import urlretrieve
 
 from .file_paths import (
@@ -47,7 +51,7 @@ from .file_paths import (
     interpro_names_url, pfam_clans_url, uniprot_sp_human_url,
     uniprot_tr_human_url, mi_obo_url, go_obo_url, bioplex_url, pina2_mitab_url,
     innate_imported_url, innate_curated_url, innate_i_mitab_path,
-    pina2_sif_path, uniprot_map_path, classifier_path
+    pina2_sif_path, uniprot_map_path, uniprot_map_cache_path, classifier_path
 )
 
 
@@ -163,6 +167,72 @@ def save_uniprot_accession_map(mapping):
         return json.dump(mapping, fp)
 
 
+def load_uniprot_map_cache(path=uniprot_map_cache_path, fr='ACC+ID',
+                           ttl=None, negative_ttl=None):
+    """
+    Loads the UniProt mapping service results for accessions of database
+    `fr` saved with :func:`append_uniprot_map_cache`. Accessions the service
+    could not map have an empty list. Results older than `ttl` seconds, or
+    `negative_ttl` seconds for empty results, are left out. The file is
+    rewritten without them and without results replaced by newer ones.
+
+    Returns
+    -------
+    `dict[str, list]`
+        Dictionary mapping accessions to UniProt accessions.
+    """
+    if not os.path.isfile(path):
+        return {}
+    now = time.time()
+    entries = OrderedDict()
+    compact = False
+    with open(path, 'rt') as fp:
+        for line in fp:
+            try:
+                entry = json.loads(line)
+                source, saved = entry['fr'], entry['time']
+                mapping = entry['mapping']
+            except (ValueError, KeyError):
+                # Line left incomplete by an interrupted run.
+                compact = True
+                continue
+            for accession, to in mapping.items():
+                key = (source, accession)
+                limit = ttl if to else negative_ttl
+                compact |= key in entries
+                entries.pop(key, None)
+                if limit is None or now - saved <= limit:
+                    entries[key] = (saved, to)
+                else:
+                    compact = True
+
+    if compact:
+        lines = OrderedDict()
+        for (source, accession), (saved, to) in entries.items():
+            lines.setdefault((source, saved), {})[accession] = to
+        with open(path + '.tmp', 'wt') as fp:
+            for (source, saved), mapping in lines.items():
+                fp.write(json.dumps(
+                    {'time': saved, 'fr': source, 'mapping': mapping}))
+                fp.write('\n')
+        os.replace(path + '.tmp', path)
+    return {
+        a: to for ((source, a), (_, to)) in entries.items() if source == fr
+    }
+
+
+def append_uniprot_map_cache(mapping, path=uniprot_map_cache_path,
+                             fr='ACC+ID'):
+    """Appends a timestamped line of mapping service results for accessions
+    of database `fr` to the cache read by :func:`load_uniprot_map_cache`."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'at') as fp:
+        fp.write(json.dumps(
+            {'time': time.time(), 'fr': fr, 'mapping': mapping}))
+        fp.write('\n')
+
+
 def load_network_from_path(path):
     """Load a tab separated-file into a dataframe."""
     from .constants import NULL_VALUES
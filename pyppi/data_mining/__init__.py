@@ -13,7 +13,9 @@ with several utility functions that operate on those dataframe to perform
 tasks such as removing invalid rows, null rows, merging rows etc. The 
 `ontology` module contains methods to parse a `Gene Ontology` obo file into
 a dictionary of entries. The `psimi` module does that same, except with
-`Psi-Mi` obo files.
+`Psi-Mi` obo files. Both are built on the OBO tokenizer in the `obo` module.
+The `similarity` module computes information content and semantic
+similarity features over the GO dag.
 """
 
 
@@ -22,8 +24,10 @@ __all__ = [
     "generic",
     "hprd",
     "kegg",
+    "obo",
     "ontology",
     "psimi",
+    "similarity",
     "tools",
     "uniprot"
 ]
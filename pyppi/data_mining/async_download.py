@@ -0,0 +1,478 @@
+"""
+This module contains an asyncio downloader of UniProt flat-file records.
+Requests share a pool of persistent HTTP/1.1 connections, run under a
+global concurrency limit and a token-bucket rate limit, and are retried
+with jittered exponential backoff on timeouts and retryable status codes.
+Redirects to the same host are followed.
+Response bodies are parsed into :class:`Bio.SwissProt.Record` instances
+as they are received. Records can also be requested many at a time, with
+accessions missing from a response requested one by one.
+"""
+
+import io
+import ssl
+import codecs
+import time
+import random
+import asyncio
+import logging
+from urllib.parse import urlsplit, urljoin, quote
+
+from Bio import SwissProt
+
+__all__ = [
+    'UNIPROT_RECORD_URL',
+    'UNIPROT_BATCH_URL',
+    'TokenBucket',
+    'HTTPConnectionPool',
+    'download_records_async',
+    'async_download'
+]
+
+logger = logging.getLogger("pyppi")
+
+UNIPROT_RECORD_URL = "https://rest.uniprot.org/uniprotkb/{}.txt"
+UNIPROT_BATCH_URL = (
+    "https://rest.uniprot.org/uniprotkb/accessions?accessions={}&format=txt"
+)
+
+# Status codes and exceptions a request is retried on.
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+RETRY_ERRORS = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+# Status codes of redirects followed to the same host, such as those of
+# merged or secondary accessions, and the most followed per request.
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class TokenBucket(object):
+    """Token-bucket rate limiter refilled at `rate` tokens per second up to
+    `capacity` tokens.
+
+    Parameters
+    ----------
+    rate : float
+        Number of tokens added per second.
+
+    capacity : int, optional, default: None
+        Maximum number of tokens, the largest burst allowed. If None, one
+        second worth of tokens.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive.")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity or rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        """Waits until a token is available and removes it."""
+        if self._lock is None:
+            # Created here to bind to the running event loop.
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HTTPConnectionPool(object):
+    """Pool of keep-alive HTTP/1.1 connections to the host of `url`.
+
+    Parameters
+    ----------
+    url : str
+        Any `http` or `https` URL of the host.
+
+    timeout : float, optional, default: 30
+        Seconds to wait for a connection or for each read.
+    """
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL scheme '{}'.".format(
+                parts.scheme))
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() \
+            if parts.scheme == 'https' else None
+        self.timeout = timeout
+        self.connections = 0
+        self._idle = []
+
+    async def _connect(self):
+        self.connections += 1
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+            self.timeout
+        )
+
+    async def _readline(self, reader):
+        return await asyncio.wait_for(reader.readline(), self.timeout)
+
+    async def _read_blocks(self, reader, headers):
+        # Yields the body in blocks, decoding chunked transfer encoding.
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self._readline(reader)).split(b';')[0], 16)
+                if size == 0:
+                    while (await self._readline(reader)).strip():
+                        pass
+                    return
+                yield await asyncio.wait_for(
+                    reader.readexactly(size), self.timeout)
+                await self._readline(reader)
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining > 0:
+                block = await asyncio.wait_for(
+                    reader.read(min(remaining, 1 << 16)), self.timeout)
+                if not block:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(block)
+                yield block
+        else:
+            while True:
+                block = await asyncio.wait_for(
+                    reader.read(1 << 16), self.timeout)
+                if not block:
+                    return
+                yield block
+
+    async def get(self, path, consumer):
+        """Sends a GET request for `path` and passes each block of the
+        response body to `consumer`, a callable taking `bytes`. Idle
+        connections are reused, and a reused connection closed by the
+        server is replaced once.
+
+        Returns
+        -------
+        `tuple`
+            The status code and the `dict` of lower-cased response headers.
+        """
+        reused = bool(self._idle)
+        connection = self._idle.pop() if reused else await self._connect()
+        reader, writer = connection
+        status = None
+        keep_alive = False
+        try:
+            request = (
+                "GET {} HTTP/1.1\r\nHost: {}\r\nAccept: text/plain\r\n"
+                "Connection: keep-alive\r\n\r\n".format(path, self.host)
+            )
+            writer.write(request.encode('ascii'))
+            await writer.drain()
+
+            status_line = await self._readline(reader)
+            if not status_line:
+                raise asyncio.IncompleteReadError(b'', None)
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = (await self._readline(reader)).decode('latin-1')
+                if not line.strip():
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            async for block in self._read_blocks(reader, headers):
+                consumer(block)
+            keep_alive = headers.get('connection', '').lower() != 'close' \
+                and ('content-length' in headers or
+                     'transfer-encoding' in headers)
+            return status, headers
+        except RETRY_ERRORS:
+            if reused and status is None:
+                # The server closed the idle connection, retry once on a
+                # new one.
+                writer.close()
+                connection = None
+                return await self.get(path, consumer)
+            raise
+        finally:
+            if connection is not None:
+                if keep_alive:
+                    self._idle.append(connection)
+                else:
+                    writer.close()
+
+    def close(self):
+        """Closes every idle connection."""
+        for (_, writer) in self._idle:
+            writer.close()
+        self._idle = []
+
+
+class _RecordStream(object):
+    # Splits a streamed flat-file body into records as blocks arrive.
+
+    def __init__(self):
+        self.records = []
+        self._buffer = ''
+        self._decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder('utf-8')(), translate=True)
+
+    def __call__(self, block):
+        self._buffer += self._decoder.decode(block)
+        end = self._buffer.rfind('\n//\n')
+        if end >= 0:
+            self._parse(self._buffer[:end + 4])
+            self._buffer = self._buffer[end + 4:]
+
+    def _parse(self, text):
+        if text.strip():
+            self.records.extend(SwissProt.parse(io.StringIO(text)))
+
+    def close(self):
+        self._buffer += self._decoder.decode(b'', final=True)
+        self._parse(self._buffer)
+        self._buffer = ''
+        return self.records
+
+
+def _backoff(attempt, backoff, max_backoff):
+    # Full exponential delay scaled by a random factor in [0.5, 1.5).
+    delay = min(max_backoff, backoff * (2 ** attempt))
+    return delay * (0.5 + random.random())
+
+
+def _path(url, accessions):
+    parts = urlsplit(url.format(
+        ','.join(quote(a, safe='') for a in accessions)))
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+def _matches_taxon(record, accession, taxon_id, verbose):
+    if (taxon_id is None) or int(record.taxonomy_id[0]) == taxon_id:
+        return True
+    if verbose:
+        logger.warning(
+            "Taxonomy IDs do not match for record {}. "
+            "Expected '{}' but found '{}'.".format(
+                accession, taxon_id, int(record.taxonomy_id[0]))
+        )
+    return False
+
+
+def _redirect_path(pool, path, location):
+    # Path of a redirect to the host of the pool, or None for another host.
+    scheme = 'https' if pool.ssl is not None else 'http'
+    parts = urlsplit(urljoin(
+        '{}://{}:{}{}'.format(scheme, pool.host, pool.port, path), location))
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    if (parts.scheme, parts.hostname, port) != (scheme, pool.host, pool.port):
+        return None
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+async def _get_records(path, name, client):
+    # Returns the records of one request, an empty list if the server
+    # answered with a status that is not retried or the body could not be
+    # parsed, or None if every attempt failed. Redirects to the same host
+    # are followed.
+    pool, semaphore, bucket, retries, backoff, max_backoff, verbose = client
+    attempt = 0
+    redirects = 0
+    while True:
+        stream = _RecordStream()
+        error = None
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            async with semaphore:
+                status, headers = await pool.get(path, stream)
+            if status == 200:
+                return stream.close()
+        except RETRY_ERRORS as e:
+            status, headers, error = None, {}, e
+        except ValueError:
+            if verbose:
+                logger.exception("Could not parse records of '{}'.".format(
+                    name))
+            return []
+
+        if status in REDIRECT_STATUS and redirects < MAX_REDIRECTS:
+            location = _redirect_path(
+                pool, path, headers.get('location', ''))
+            if location is not None:
+                redirects += 1
+                path = location
+                continue
+        if status is not None and status not in RETRY_STATUS:
+            if verbose:
+                logger.warning("No record found for '{}' (HTTP {}).".format(
+                    name, status))
+            return []
+        if attempt == retries:
+            break
+        delay = _backoff(attempt, backoff, max_backoff)
+        retry_after = headers.get('retry-after', '')
+        if retry_after.isdigit():
+            delay = max(delay, min(max_backoff, int(retry_after)))
+        attempt += 1
+        if verbose:
+            logger.info(
+                "Retrying '{}' in {:.2f}s after {}. Attempt {}/{}.".format(
+                    name, delay,
+                    error if status is None else 'HTTP {}'.format(status),
+                    attempt, retries)
+            )
+        await asyncio.sleep(delay)
+
+    if verbose:
+        logger.warning("Failed to download records for '{}'".format(name))
+    return None
+
+
+async def _fetch(accession, url, client, taxon_id, verbose):
+    records = await _get_records(_path(url, [accession]), accession, client)
+    record = records[0] if records else None
+    if record is not None and \
+            not _matches_taxon(record, accession, taxon_id, verbose):
+        return None
+    return record
+
+
+async def _fetch_batch(accessions, url, batch_url, client, taxon_id,
+                       verbose):
+    name = '{} ... {}'.format(accessions[0], accessions[-1])
+    records = await _get_records(_path(batch_url, accessions), name, client)
+    if records is None:
+        # Requesting each accession would only repeat the failed retries.
+        return [None] * len(accessions)
+
+    # Records are matched to the requested primary or secondary accession
+    # they list, the rest are fetched one at a time.
+    requested = set(accessions)
+    found = {}
+    for record in records:
+        for accession in record.accessions:
+            if accession in requested:
+                found.setdefault(accession, record)
+    missing = [a for a in accessions if a not in found]
+    if missing and verbose:
+        logger.info("Fetching {} records of '{}' one at a time.".format(
+            len(missing), name))
+    fallback = await asyncio.gather(*[
+        _fetch(a, url, client, taxon_id, verbose) for a in missing
+    ])
+    found.update(zip(missing, fallback))
+
+    return [
+        None if found[a] is None or
+        not _matches_taxon(found[a], a, taxon_id, verbose) else found[a]
+        for a in accessions
+    ]
+
+
+async def download_records_async(accessions, url=UNIPROT_RECORD_URL,
+                                 max_concurrency=10, rate=None, burst=None,
+                                 retries=3, backoff=0.5, max_backoff=30,
+                                 timeout=30, taxon_id=9606, batch_size=None,
+                                 batch_url=UNIPROT_BATCH_URL, verbose=False):
+    """Downloads the record of each UniProt accession concurrently over a
+    shared pool of connections.
+
+    Parameters
+    ----------
+    accessions : list
+        List of UniProt accessions.
+
+    url : str, optional, default: `UNIPROT_RECORD_URL`
+        URL template of a flat-file record, formatted with the accession.
+
+    max_concurrency : int, optional, default: 10
+        Maximum number of requests in flight, and of open connections.
+
+    rate : float or None, optional, default: None
+        Maximum number of requests started per second. None for no limit.
+
+    burst : int or None, optional, default: None
+        Number of requests that can start at once before `rate` applies.
+        If None, one second worth of requests.
+
+    retries : int, optional, default: 3
+        Number of times to retry a request after a timeout, a connection
+        error or a response with a status in `RETRY_STATUS`.
+
+    backoff : float, optional, default: 0.5
+        Seconds to wait before the first retry, doubled for each further
+        retry and scaled by a random factor between 0.5 and 1.5.
+
+    max_backoff : float, optional, default: 30
+        Maximum number of seconds to wait before a retry.
+
+    timeout : float, optional, default: 30
+        Seconds to wait for a connection or for each read.
+
+    taxon_id : int, optional
+        The taxonomy id to download the accession for. No record is returned
+        if the downloaded record does not match this id.
+
+    batch_size : int or None, optional, default: None
+        If set, accessions are requested in groups of this size from
+        `batch_url`, and records missing from a successful group's response
+        are then requested one at a time from `url`.
+
+    batch_url : str, optional, default: `UNIPROT_BATCH_URL`
+        URL template returning the concatenated flat-file records of many
+        accessions, formatted with the comma separated accessions.
+
+    verbose : bool, optional
+        If True, log informational and warning messages to the console.
+
+    Returns
+    -------
+    `list`
+        A list of :class:`Bio.SwissProt.Record` record instances, or None
+        for accessions that could not be downloaded, in the order of
+        `accessions`.
+    """
+    accessions = list(accessions)
+    if not accessions:
+        return []
+    pool = HTTPConnectionPool(url.format('x'), timeout=timeout)
+    client = (
+        pool, asyncio.Semaphore(max(1, max_concurrency)),
+        TokenBucket(rate, burst) if rate else None,
+        retries, backoff, max_backoff, verbose
+    )
+    try:
+        if not batch_size:
+            return await asyncio.gather(*[
+                _fetch(a, url, client, taxon_id, verbose) for a in accessions
+            ])
+        batches = await asyncio.gather(*[
+            _fetch_batch(accessions[i:i + batch_size], url, batch_url,
+                         client, taxon_id, verbose)
+            for i in range(0, len(accessions), batch_size)
+        ])
+        return [record for batch in batches for record in batch]
+    finally:
+        pool.close()
+
+
+def async_download(accessions, **kwargs):
+    """Runs :func:`download_records_async` in a new event loop. See
+    :func:`download_records_async` for the keyword arguments.
+
+    Returns
+    -------
+    `list`
+        A list of :class:`Bio.SwissProt.Record` record instances, or None
+        for accessions that could not be downloaded.
+    """
+    return asyncio.run(download_records_async(accessions, **kwargs))
@@ -0,0 +1,598 @@
+"""
+This module contains a random-access index over the local UniProt `.dat`
+dumps. Each dump is copied once into a BGZF file, a gzip variant made of
+independently compressed blocks, and the BGZF virtual offset and length of
+every record is saved to an SQLite table keyed by each primary and
+secondary accession of the record. A record can then be read by seeking to
+its block instead of downloading it or scanning the whole dump. The same
+table maps secondary accessions to their primary accessions, so accessions
+can be updated without the UniProt mapping service.
+"""
+
+import io
+import os
+import sqlite3
+import logging
+
+from Bio import bgzf
+from Bio import SwissProt
+
+from ..base.file_paths import (
+    uniprot_index_path, uniprot_sprot_dat, uniprot_trembl_dat
+)
+from ..base.utilities import remove_duplicates
+from ..database.models import Protein
+from ..database.utilities import protein_status_map
+from .uniprot import (
+    open_dat, taxonid, parallel_download, parse_record_into_protein,
+    batch_map, filter_mapped_accessions
+)
+
+__all__ = [
+    'DatIndex',
+    'get_default_index',
+    'index_records',
+    'fetch_records',
+    'save_missing_proteins',
+    'map_accessions'
+]
+
+logger = logging.getLogger("pyppi")
+
+DAT_INDEX_VERSION = 1
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS dump (id INTEGER PRIMARY KEY, "
+    "source TEXT UNIQUE, path TEXT, size INTEGER, mtime REAL)",
+    "CREATE TABLE IF NOT EXISTS entry (accession TEXT, primary_accession "
+    "TEXT, dump INTEGER, offset INTEGER, length INTEGER)",
+    "CREATE INDEX IF NOT EXISTS entry_accession ON entry (accession)",
+)
+
+
+class DatIndex(object):
+    """Index of the records in one or more UniProt `.dat` dumps by primary
+    and secondary accession.
+
+    Parameters
+    ----------
+    directory : str, optional, default: `uniprot_index_path`
+        Directory holding the SQLite index `index.db` and the BGZF copy of
+        each dump.
+    """
+
+    def __init__(self, directory=uniprot_index_path):
+        self.directory = directory
+        self.path = os.path.join(directory, 'index.db')
+        self._connection = None
+        self._readers = {}
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False
+            )
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+            version = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if version is not None and int(version[0]) != DAT_INDEX_VERSION:
+                logger.warning(
+                    "Rebuilding dat index '{}' of version {}.".format(
+                        self.path, version[0])
+                )
+                self._connection.execute("DELETE FROM entry")
+                self._connection.execute("DELETE FROM dump")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                (str(DAT_INDEX_VERSION),)
+            )
+            self._connection.commit()
+        return self._connection
+
+    def __len__(self):
+        query = "SELECT COUNT(*) FROM entry WHERE accession = " \
+                "primary_accession"
+        return self.connection.execute(query).fetchone()[0]
+
+    def __contains__(self, accession):
+        return self._locate(accession) is not None
+
+    def close(self):
+        """Closes the index database and any open BGZF file."""
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def is_current(self, source):
+        """Returns True if the dump at `source` is indexed and has not been
+        modified since."""
+        stat = os.stat(source)
+        row = self.connection.execute(
+            "SELECT size, mtime FROM dump WHERE source = ?",
+            (os.path.abspath(source),)
+        ).fetchone()
+        return row is not None and tuple(row) == (stat.st_size, stat.st_mtime)
+
+    def build(self, sources=None, force=False, verbose=False):
+        """Indexes each dump in `sources` that is not indexed yet or has
+        been modified since it was indexed, replacing its old entries.
+
+        Parameters
+        ----------
+        sources : list, optional, default: None
+            Paths of `.dat` or `.dat.gz` files. If None, the SwissProt and
+            TrEMBL dumps in the home cache directory ~/.pyppi/ that exist
+            are indexed.
+
+        force : bool, optional, default: False
+            Re-index the dumps even if they have not been modified.
+
+        verbose : bool, default: False
+            Log the number of records indexed per dump.
+
+        Returns
+        -------
+        int
+            Number of records indexed.
+        """
+        if sources is None:
+            sources = [
+                path for path in (uniprot_sprot_dat, uniprot_trembl_dat)
+                if os.path.isfile(path)
+            ]
+        total = 0
+        for source in sources:
+            if not force and self.is_current(source):
+                continue
+            count = self._build_dump(source)
+            if verbose:
+                logger.info("Indexed {} records of '{}'.".format(
+                    count, source))
+            total += count
+        return total
+
+    def _build_dump(self, source):
+        source = os.path.abspath(source)
+        stat = os.stat(source)
+        name = os.path.basename(source)
+        if name.endswith('.gz'):
+            name = name[:-3]
+        path = os.path.join(self.directory, '{}.bgz'.format(name))
+
+        connection = self.connection
+        row = connection.execute(
+            "SELECT id FROM dump WHERE source = ?", (source,)).fetchone()
+        if row is not None:
+            reader = self._readers.pop(row[0], None)
+            if reader is not None:
+                reader.close()
+            connection.execute("DELETE FROM entry WHERE dump = ?", row)
+            connection.execute("DELETE FROM dump WHERE id = ?", row)
+        dump_id = connection.execute(
+            "INSERT INTO dump (source, path, size, mtime) VALUES "
+            "(?, ?, ?, ?)", (source, path, stat.st_size, stat.st_mtime)
+        ).lastrowid
+
+        count = 0
+        entries = []
+        lines = []
+        accessions = []
+        tmp_path = '{}.tmp'.format(path)
+        writer = bgzf.BgzfWriter(tmp_path, 'wb')
+        try:
+            with open_dat(source) as handle, writer:
+                for line in handle:
+                    lines.append(line)
+                    if line.startswith('AC'):
+                        accessions.extend(
+                            line[5:].rstrip().rstrip(';').split('; '))
+                    elif line.startswith('//'):
+                        data = ''.join(lines).encode('utf-8')
+                        offset = writer.tell()
+                        writer.write(data)
+                        if accessions:
+                            primary = accessions[0]
+                            entries.extend(
+                                (a, primary, dump_id, offset, len(data))
+                                for a in accessions
+                            )
+                            count += 1
+                        lines = []
+                        accessions = []
+                        if len(entries) >= 100000:
+                            connection.executemany(
+                                "INSERT INTO entry VALUES (?, ?, ?, ?, ?)",
+                                entries
+                            )
+                            entries = []
+            if entries:
+                connection.executemany(
+                    "INSERT INTO entry VALUES (?, ?, ?, ?, ?)", entries)
+            os.replace(tmp_path, path)
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        return count
+
+    def _locate(self, accession):
+        # Prefer the record the accession is the primary accession of.
+        return self.connection.execute(
+            "SELECT dump, offset, length FROM entry WHERE accession = ? "
+            "ORDER BY accession != primary_accession LIMIT 1",
+            (accession.strip().upper(),)
+        ).fetchone()
+
+    def primary_accessions(self, accession):
+        """Returns the sorted primary accessions of the records listing
+        `accession` as their primary or a secondary accession. Merged
+        entries can list the same secondary accession."""
+        rows = self.connection.execute(
+            "SELECT DISTINCT primary_accession FROM entry WHERE "
+            "accession = ?", (accession.strip().upper(),)
+        )
+        return list(sorted(row[0] for row in rows))
+
+    def resolve(self, accessions, chunk_size=900):
+        """Maps each accession to the primary accessions of the records
+        listing it, using one query per `chunk_size` accessions. A primary
+        accession maps only to itself, a secondary accession to every
+        record it was merged into.
+
+        Parameters
+        ----------
+        accessions : list
+            List of UniProt accessions.
+
+        chunk_size : int, optional, default: 900
+            Number of accessions per query, below the SQLite limit on bound
+            parameters.
+
+        Returns
+        -------
+        `dict`
+            Mapping from each indexed accession, as given, to a sorted list
+            of primary accessions. Accessions not indexed are left out.
+        """
+        keys = list(set(a.strip().upper() for a in accessions))
+        primaries = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            rows = self.connection.execute(
+                "SELECT accession, primary_accession FROM entry WHERE "
+                "accession IN ({})".format(', '.join('?' * len(chunk))),
+                chunk
+            )
+            for (accession, primary) in rows:
+                primaries.setdefault(accession, set()).add(primary)
+
+        mapping = {}
+        for accession in accessions:
+            key = accession.strip().upper()
+            if key not in primaries:
+                continue
+            if key in primaries[key]:
+                mapping[accession] = [key]
+            else:
+                mapping[accession] = list(sorted(primaries[key]))
+        return mapping
+
+    def get_text(self, accession):
+        """Returns the flat-file text of the record of `accession`, or None
+        if it is not indexed."""
+        location = self._locate(accession)
+        if location is None:
+            return None
+        dump_id, offset, length = location
+        reader = self._readers.get(dump_id, None)
+        if reader is None:
+            path = self.connection.execute(
+                "SELECT path FROM dump WHERE id = ?", (dump_id,)
+            ).fetchone()[0]
+            reader = self._readers[dump_id] = bgzf.BgzfReader(path, 'rb')
+        reader.seek(offset)
+        return reader.read(length).decode('utf-8')
+
+    def get_record(self, accession):
+        """Returns the :class:`Bio.SwissProt.Record` of `accession`, or None
+        if it is not indexed."""
+        text = self.get_text(accession)
+        if text is None:
+            return None
+        return SwissProt.read(io.StringIO(text))
+
+
+def get_default_index():
+    """Returns a :class:`DatIndex` over the default index directory, or None
+    if no index has been built there yet."""
+    if not os.path.isfile(os.path.join(uniprot_index_path, 'index.db')):
+        return None
+    return DatIndex(uniprot_index_path)
+
+
+def index_records(accessions, index=None, taxon_id=9606, verbose=False):
+    """Looks up the record of each accession in a local index.
+
+    Parameters
+    ----------
+    accessions : list
+        List of UniProt accessions.
+
+    index : :class:`DatIndex`, optional, default: None
+        The index to read from. If None, the default index is used if it
+        has been built.
+
+    taxon_id : int, optional
+        No record is returned if the indexed record does not match this id.
+
+    verbose : bool, optional
+        If True, log informational and warning messages to the console.
+
+    Returns
+    -------
+    `tuple`
+        A list of :class:`Bio.SwissProt.Record` instances, or None for
+        accessions not indexed or not matching `taxon_id`, and the list of
+        accessions that are not indexed.
+    """
+    accessions = list(accessions)
+    if index is None:
+        index = get_default_index()
+    if index is None:
+        return [None] * len(accessions), accessions
+
+    records = []
+    missing = []
+    for accession in accessions:
+        record = index.get_record(accession)
+        if record is None:
+            missing.append(accession)
+        elif (taxon_id is not None) and taxonid(record) != taxon_id:
+            if verbose:
+                logger.warning(
+                    "Taxonomy IDs do not match for record {}. "
+                    "Expected '{}' but found '{}'.".format(
+                        accession, taxon_id, taxonid(record)
+                    )
+                )
+            record = None
+        records.append(record)
+    return records, missing
+
+
+def fetch_records(accessions, index=None, n_jobs=1, verbose=False,
+                  taxon_id=9606, batch_size=100):
+    """Reads the record of each accession from a local index, downloading
+    only the records that are not indexed with the 'asyncio' backend of
+    :func:`.uniprot.parallel_download`.
+
+    Parameters
+    ----------
+    accessions : list
+        List of UniProt accessions.
+
+    index : :class:`DatIndex`, optional, default: None
+        The index to read from. If None, the default index is used if it
+        has been built.
+
+    n_jobs : int, optional, default: 1
+        Number of concurrent downloads.
+
+    verbose : bool, optional
+        If True, log informational and warning messages to the console.
+
+    taxon_id : int, optional
+        No record is returned if a record does not match this id.
+
+    batch_size : int or None, optional, default: 100
+        Number of accessions requested per download. None to request one
+        record at a time.
+
+    Returns
+    -------
+    `list`
+        A list of :class:`Bio.SwissProt.Record` record instances, or None
+        for accessions without a matching record.
+    """
+    accessions = list(accessions)
+    records, missing = index_records(
+        accessions, index, taxon_id=taxon_id, verbose=verbose
+    )
+    if verbose:
+        logger.info("Read {} records from the local dat index.".format(
+            len(accessions) - len(missing)))
+    if not missing:
+        return records
+
+    downloaded = dict(zip(missing, parallel_download(
+        missing, backend='asyncio', n_jobs=n_jobs, verbose=verbose,
+        taxon_id=taxon_id, batch_size=batch_size
+    )))
+    return [
+        downloaded[a] if a in downloaded else r
+        for (a, r) in zip(accessions, records)
+    ]
+
+
+def save_missing_proteins(accessions, index=None, session=None,
+                          taxon_id=9606, batch_size=500, verbose=False):
+    """Reads or downloads the records of accessions without a database entry
+    with :func:`fetch_records` and saves them, with one commit per
+    `batch_size` accessions.
+
+    Parameters
+    ----------
+    accessions : list
+        List of UniProt accessions without a database entry.
+
+    index : :class:`DatIndex`, optional, default: None
+        The index to read records from. If None, the default index is used
+        if it has been built.
+
+    session : `scoped_session`, optional
+        Session to save protein instances to. Leave as None to use the
+        session `Protein.query` is bound to.
+
+    taxon_id : int, optional
+        No protein is saved for a record that does not match this id.
+
+    batch_size : int, optional, default: 500
+        Number of accessions fetched and saved per commit.
+
+    verbose : bool, optional
+        If True, log informational and warning messages to the console.
+
+    Returns
+    -------
+    `dict`
+        Mapping from the UniProt accession of each saved protein to its
+        `(reviewed, taxon_id)`, as returned by
+        :func:`..database.utilities.protein_status_map`.
+    """
+    if session is None:
+        session = Protein.query.session
+    accessions = list(accessions)
+    status = {}
+    for i in range(0, len(accessions), batch_size):
+        records = fetch_records(
+            accessions[i:i + batch_size], index=index, verbose=verbose,
+            taxon_id=taxon_id
+        )
+        proteins = [
+            parse_record_into_protein(r) for r in records if r is not None
+        ]
+        try:
+            session.add_all(proteins)
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        status.update(
+            (p.uniprot_id, (p.reviewed, p.taxon_id)) for p in proteins
+        )
+    return status
+
+
+def map_accessions(accessions, index=None, session=None, keep_unreviewed=True,
+                   match_taxon_id=9606, allow_download=False, remote=False,
+                   cache=False, map_cache_path=None, verbose=False):
+    """Maps accessions to their most recent UniProt accessions from the
+    primary and secondary accessions of a local index, returning the same
+    mapping as :func:`.uniprot.batch_map`. Accessions not in the index but
+    with a database entry map to themselves. Review status and taxonomy id
+    of the targets are read with one query per chunk of accessions.
+
+    Parameters
+    ----------
+    accessions : list
+        List of accessions.
+
+    index : :class:`DatIndex`, optional, default: None
+        The index to resolve accessions with. If None, the default index is
+        used if it has been built.
+
+    session : `scoped_session`, optional
+        Session to query and to save downloaded protein instances to. Leave
+        as None to use the session `Protein.query` is bound to.
+
+    keep_unreviewed : bool, optional
+        If True, keep the unreviewed accession in mapping.
+
+    match_taxon_id : int, optional
+        Ignores mappings to proteins that do not match this id.
+
+    allow_download : bool, optional
+        If True, targets without a database entry are read from the index,
+        or downloaded, and saved to the database with
+        :func:`save_missing_proteins`.
+
+    remote : bool, optional
+        If True, accessions found in neither the index nor the database are
+        mapped with :func:`.uniprot.batch_map`. Otherwise they are left out.
+        Always True when no index has been built.
+
+    cache : bool, optional
+        Use the `bioservices` cache when mapping remotely.
+
+    map_cache_path : str, optional, default: None
+        File remote mapping results are cached in, see
+        :func:`.uniprot.batch_map`.
+
+    verbose :  bool, optional
+        Log info/warning/error messages to the console.
+
+    Returns
+    -------
+    `dict`
+        A dictionary of mappings from accessions to the most up-to-date
+        UniProt accessions. Dictionary values are lists.
+    """
+    if session is None:
+        session = Protein.query.session
+    if index is None:
+        index = get_default_index()
+    accessions = remove_duplicates(
+        a for a in accessions if isinstance(a, str)
+    )
+    mapping = {} if index is None else index.resolve(accessions)
+    unresolved = [a for a in accessions if a not in mapping]
+    if verbose:
+        logger.info(
+            "Resolved {} of {} accessions with the local index.".format(
+                len(mapping), len(accessions))
+        )
+
+    # Accessions with a database entry that are not in the index map to
+    # themselves.
+    targets = set(a for to in mapping.values() for a in to)
+    status = protein_status_map(targets.union(unresolved), session)
+    mapping.update((a, [a]) for a in unresolved if a in status)
+    unresolved = [a for a in unresolved if a not in status]
+    missing = [a for a in targets if a not in status]
+    if allow_download and missing:
+        status.update(save_missing_proteins(
+            missing, index=index, session=session, taxon_id=match_taxon_id,
+            verbose=verbose
+        ))
+
+    mapping = filter_mapped_accessions(
+        mapping, status, keep_unreviewed=keep_unreviewed,
+        match_taxon_id=match_taxon_id
+    )
+    if index is None and unresolved and not remote:
+        logger.warning(
+            "No local UniProt index has been built. Mapping {} accessions "
+            "with the UniProt service.".format(len(unresolved))
+        )
+        remote = True
+    if remote and unresolved:
+        if verbose:
+            logger.info("Mapping {} accessions remotely.".format(
+                len(unresolved)))
+        try:
+            mapping.update(batch_map(
+                unresolved, allow_download=allow_download, cache=cache,
+                session=session, keep_unreviewed=keep_unreviewed,
+                match_taxon_id=match_taxon_id, verbose=verbose,
+                dat_index=index, map_cache_path=map_cache_path
+            ))
+        except ValueError:
+            logger.warning(
+                "Could not map {} accessions with the UniProt "
+                "service.".format(len(unresolved))
+            )
+
+    unmapped = [a for a in accessions if a not in mapping]
+    if unmapped:
+        logger.warning(
+            "Could not map {} accessions: {}.".format(
+                len(unmapped), ', '.join(unmapped))
+        )
+    return mapping
@@ -0,0 +1,367 @@
+"""
+This module contains a persistent store of computed interaction features,
+saved to an SQLite table at `feature_cache_path`. Entries are keyed by the
+UniProt identifiers of the source and target proteins, a stamp of each
+protein's last UniProt update and a fingerprint of the GO dag, so that
+rebuilding the database only recomputes features for interactions whose
+proteins or ontology have changed. Lookups and updates only read and write
+the rows of the requested keys, so the cost of a call does not grow with
+the size of the cache.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+
+from ..base.file_paths import feature_cache_path
+from ..database import MAX_IN_PARAMETERS
+from .ontology import CacheInfo, get_active_instance, _get_index
+from .features import GO_ATTRS, DOMAIN_ATTRS
+from .feature_pool import compute_interaction_features_pool
+
+__all__ = [
+    'FeatureCache',
+    'protein_stamp',
+    'compute_interaction_features_cached'
+]
+
+logger = logging.getLogger("pyppi")
+
+FEATURE_CACHE_VERSION = 2
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, features TEXT, "
+    "last_used INTEGER)",
+    "CREATE INDEX IF NOT EXISTS entry_last_used ON entry (last_used)",
+)
+
+
+def protein_stamp(protein):
+    """Returns a string identifying the version of `protein`'s annotations.
+    This is the `last_release` and `last_update` of the UniProt entry, or a
+    digest of the annotations themselves if neither has been recorded."""
+    release = getattr(protein, 'last_release', None)
+    update = getattr(protein, 'last_update', None)
+    if release is not None or update is not None:
+        if hasattr(update, 'isoformat'):
+            update = update.isoformat()
+        return '{}@{}'.format(release, update)
+
+    sha1 = hashlib.sha1()
+    for attr in GO_ATTRS + DOMAIN_ATTRS:
+        sha1.update('{}\n'.format(getattr(protein, attr)).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def _chunks(keys):
+    for i in range(0, len(keys), MAX_IN_PARAMETERS):
+        yield keys[i:i + MAX_IN_PARAMETERS]
+
+
+def _placeholders(chunk):
+    return ', '.join('?' * len(chunk))
+
+
+class FeatureCache(object):
+    """Bounded least-recently-used store of the features computed by
+    :func:`.features.compute_interaction_features`, persisted between runs
+    in an SQLite database. Every call to :meth:`get_many` and
+    :meth:`put_many` is committed, so nothing needs to be saved.
+
+    Parameters
+    ----------
+    path : str or None, optional, default: `feature_cache_path`
+        SQLite database to store entries in. Use None for a cache that only
+        lives in memory.
+
+    max_entries : int or None, optional, default: 1000000
+        Maximum number of entries kept. The least recently used entries
+        are evicted first. Use None for an unbounded cache.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        The dag features are computed with. If None, the default global
+        dag instance will be used.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from the cache.
+
+    misses : int
+        Number of lookups that had to be computed.
+    """
+
+    def __init__(self, path=feature_cache_path, max_entries=1000000,
+                 dag=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.dag = dag
+        self.hits = 0
+        self.misses = 0
+        self._fingerprint = None
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            try:
+                self._connection = self._connect()
+            except sqlite3.DatabaseError as e:
+                logger.warning("Replacing feature cache '{}': {}".format(
+                    self.path, e))
+                self.close()
+                os.remove(self.path)
+                self._connection = self._connect()
+        return self._connection
+
+    def _connect(self):
+        if self.path is None:
+            connection = sqlite3.connect(':memory:', check_same_thread=False)
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection = connection
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        version = connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is not None and int(version[0]) != FEATURE_CACHE_VERSION:
+            logger.warning(
+                "Clearing feature cache '{}' of version {}.".format(
+                    self.path, version[0])
+            )
+            connection.execute("DELETE FROM entry")
+            connection.execute("DELETE FROM meta WHERE key = 'size'")
+        connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+            (str(FEATURE_CACHE_VERSION),)
+        )
+        if self._size() is None:
+            count = connection.execute(
+                "SELECT COUNT(*) FROM entry").fetchone()[0]
+            self._set_size(count)
+        connection.commit()
+        return connection
+
+    def _size(self):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'size'").fetchone()
+        return None if row is None else int(row[0])
+
+    def _set_size(self, size):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('size', ?)", (str(size),)
+        )
+
+    def _tick(self):
+        # The last_used stamp of the current call, greater than any stored.
+        row = self.connection.execute(
+            "SELECT MAX(last_used) FROM entry").fetchone()
+        return 1 if row[0] is None else row[0] + 1
+
+    def __len__(self):
+        # The number of entries is kept in the meta table to avoid counting
+        # every row of a large cache.
+        return self._size()
+
+    def __contains__(self, pair):
+        row = self.connection.execute(
+            "SELECT 1 FROM entry WHERE key = ?", (self.key(*pair),)
+        ).fetchone()
+        return row is not None
+
+    def close(self):
+        """Closes the cache database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def cache_info(self):
+        """Returns a `CacheInfo` tuple of hits, misses, max_entries and the
+        current number of entries."""
+        return CacheInfo(self.hits, self.misses, self.max_entries, len(self))
+
+    def fingerprint(self):
+        """Returns the fingerprint of the dag features are computed with."""
+        if self._fingerprint is None:
+            dag = self.dag if self.dag is not None else get_active_instance()
+            self._fingerprint = _get_index(dag).fingerprint()
+        return self._fingerprint
+
+    def key(self, source, target):
+        """Returns the key of the interaction between the
+        :class:`..database.models.Protein` instances `source` and
+        `target`."""
+        return '|'.join([
+            source.uniprot_id, target.uniprot_id,
+            protein_stamp(source), protein_stamp(target), self.fingerprint()
+        ])
+
+    def get_many(self, pairs):
+        """Looks up the features of each `(source, target)` pair, with one
+        query per `MAX_IN_PARAMETERS` keys, and marks the entries found as
+        recently used.
+
+        Returns
+        -------
+        list
+            A copy of the cached features of each pair, or None for pairs
+            that are not cached or where either protein is None.
+        """
+        keys = [
+            None if (source is None or target is None)
+            else self.key(source, target)
+            for (source, target) in pairs
+        ]
+        unique = list(set(k for k in keys if k is not None))
+        connection = self.connection
+        found = {}
+        for chunk in _chunks(unique):
+            rows = connection.execute(
+                "SELECT key, features FROM entry WHERE key IN ({})".format(
+                    _placeholders(chunk)),
+                chunk
+            )
+            found.update(rows)
+
+        if found:
+            tick = self._tick()
+            for chunk in _chunks(list(found.keys())):
+                connection.execute(
+                    "UPDATE entry SET last_used = ? WHERE key IN ({})".format(
+                        _placeholders(chunk)),
+                    [tick] + chunk
+                )
+            connection.commit()
+
+        features = []
+        for key in keys:
+            value = found.get(key, None)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                value = json.loads(value)
+            features.append(value)
+        return features
+
+    def put_many(self, pairs, features):
+        """Stores the `features` computed for each `(source, target)` pair,
+        skipping pairs without features, and evicts the least recently used
+        entries if the cache is now too large."""
+        rows = {}
+        for (source, target), values in zip(pairs, features):
+            if source is None or target is None or values is None:
+                continue
+            rows[self.key(source, target)] = json.dumps(values)
+        if not rows:
+            return
+
+        connection = self.connection
+        tick = self._tick()
+        try:
+            replaced = 0
+            for chunk in _chunks(list(rows.keys())):
+                replaced += connection.execute(
+                    "DELETE FROM entry WHERE key IN ({})".format(
+                        _placeholders(chunk)),
+                    chunk
+                ).rowcount
+            connection.executemany(
+                "INSERT INTO entry VALUES (?, ?, ?)",
+                ((key, value, tick) for (key, value) in rows.items())
+            )
+            self._set_size(self._size() + len(rows) - replaced)
+            self._evict()
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+
+    def _evict(self):
+        size = self._size()
+        if self.max_entries is None or size <= self.max_entries:
+            return 0
+        evicted = self.connection.execute(
+            "DELETE FROM entry WHERE key IN (SELECT key FROM entry "
+            "ORDER BY last_used LIMIT ?)", (size - self.max_entries,)
+        ).rowcount
+        self._set_size(size - evicted)
+        return evicted
+
+    def evict(self):
+        """Evicts the least recently used entries until there are at most
+        `max_entries`. Returns the number of entries evicted."""
+        evicted = self._evict()
+        self.connection.commit()
+        return evicted
+
+    def clear(self):
+        """Removes all entries and resets the hit and miss counters."""
+        connection = self.connection
+        connection.execute("DELETE FROM entry")
+        self._set_size(0)
+        connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+
+def compute_interaction_features_cached(pairs, cache=None, n_jobs=1,
+                                        pool=None):
+    """Computes the textual features of many interactions, looking them up
+    in `cache` first. Missing features are computed with
+    :func:`.feature_pool.compute_interaction_features_pool` and added to
+    `cache`.
+
+    Parameters:
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    cache : :class:`FeatureCache`, optional, default: None
+        The cache to consult. If None, all features are computed.
+
+    n_jobs : int, optional, default: 1
+        Number of processes to compute missing features with.
+
+    pool : :class:`.feature_pool.FeaturePool`, optional, default: None
+        An open pool to compute missing features with instead of starting
+        one for this call. `n_jobs` is then ignored.
+
+    Returns
+    -------
+    list
+        Features of each pair as returned by
+        :func:`.features.compute_interaction_features_batch`.
+    """
+    pairs = list(pairs)
+    if cache is None:
+        features = [None] * len(pairs)
+    else:
+        features = cache.get_many(pairs)
+
+    missing = [
+        i for (i, (values, (source, target))) in
+        enumerate(zip(features, pairs))
+        if values is None and source is not None and target is not None
+    ]
+    if not missing:
+        return features
+
+    to_compute = [pairs[i] for i in missing]
+    computed = compute_interaction_features_pool(
+        to_compute, n_jobs=n_jobs,
+        dag=None if cache is None else cache.dag, pool=pool
+    )
+    for i, values in zip(missing, computed):
+        features[i] = values
+
+    if cache is not None:
+        cache.put_many(to_compute, computed)
+    return features
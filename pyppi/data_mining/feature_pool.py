@@ -0,0 +1,247 @@
+"""
+This module contains a process pool computing interaction features in
+parallel. The annotations of every protein are copied into a read-only
+table once, each worker receives the table and loads the GO dag once when
+it starts, from a memory mapped snapshot when available, and tasks then
+only carry pairs of integer ids into the table. A pool can be kept open
+and reused for many batches of pairs.
+"""
+
+import multiprocessing
+from collections import namedtuple
+from joblib import effective_n_jobs
+
+from .ontology import get_active_instance, load_go_snapshot
+from .features import (
+    GO_ATTRS, DOMAIN_ATTRS, compute_interaction_features_batch
+)
+
+__all__ = [
+    'AnnotatedProtein',
+    'annotation_table',
+    'FeaturePool',
+    'compute_interaction_features_pool'
+]
+
+# Plain copy of the annotation columns of a Protein, cheap to pickle and
+# detached from any database session.
+AnnotatedProtein = namedtuple(
+    'AnnotatedProtein', ('uniprot_id',) + GO_ATTRS + DOMAIN_ATTRS
+)
+
+# The annotation table and dag of the current worker process.
+__WORKER__ = None
+
+
+def _annotations(protein):
+    return AnnotatedProtein(*(
+        getattr(protein, attr) for attr in AnnotatedProtein._fields
+    ))
+
+
+def annotation_table(pairs):
+    """Copies the annotations of each distinct protein in `pairs` into a
+    table of :class:`AnnotatedProtein`.
+
+    Parameters
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    Returns
+    -------
+    `tuple`
+        The table and a list of `(source, target)` tuples of the integer
+        position of each protein in the table, or -1 for None.
+    """
+    table = []
+    positions = {}
+    id_pairs = []
+    for pair in pairs:
+        ids = []
+        for protein in pair:
+            if protein is None:
+                ids.append(-1)
+                continue
+            i = positions.get(id(protein), None)
+            if i is None:
+                i = positions[id(protein)] = len(table)
+                table.append(_annotations(protein))
+            ids.append(i)
+        id_pairs.append(tuple(ids))
+    return table, id_pairs
+
+
+def _initialize_worker(table, snapshot, dag):
+    global __WORKER__
+    if snapshot is not None:
+        # Forked workers inherit the parent's dag, only load when spawned.
+        dag = get_active_instance(namespaces=())
+        if getattr(getattr(dag, 'index', None), 'path', None) != snapshot:
+            dag = load_go_snapshot(snapshot)
+    __WORKER__ = (table, dag)
+
+
+def _compute_chunk(task):
+    # Positions past the shared table index the rows sent with the task.
+    table, dag = __WORKER__
+    extra, id_pairs = task
+    n = len(table)
+    pairs = [
+        tuple(
+            None if i < 0 else (table[i] if i < n else extra[i - n])
+            for i in pair
+        )
+        for pair in id_pairs
+    ]
+    return compute_interaction_features_batch(pairs, dag)
+
+
+class FeaturePool(object):
+    """Process pool computing interaction features, started once and
+    reused across calls. The annotations of `proteins` are copied into each
+    worker when it starts, so that tasks only carry integer ids for them.
+    The annotations of other proteins are sent only with the tasks whose
+    pairs reference them. Proteins are identified by UniProt accession, and their
+    annotations must not change while the pool is open.
+
+    Use as a context manager, or call :meth:`close` when done.
+
+    Parameters
+    ----------
+    proteins : iterable, optional
+        :class:`..database.models.Protein` instances whose annotations are
+        copied to each worker.
+
+    n_jobs : int, optional, default: 1
+        Number of processes to use. Negative values are interpreted as in
+        `joblib`, for example -1 uses all processors. With one process,
+        features are computed in the calling process.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used. Workers
+        load a dag backed by a snapshot from its memory mapped files,
+        other dags are copied to each worker.
+
+    chunks_per_job : int, optional, default: 4
+        Number of tasks to split the pairs of each call into per process.
+    """
+
+    def __init__(self, proteins=(), n_jobs=1, dag=None, chunks_per_job=4):
+        self.dag = dag if dag is not None else get_active_instance()
+        self.n_jobs = effective_n_jobs(n_jobs)
+        self.chunks_per_job = chunks_per_job
+        self.table = []
+        self._positions = {}
+        self._pool = None
+        if self.n_jobs == 1:
+            return
+
+        for protein in proteins:
+            if protein.uniprot_id not in self._positions:
+                self._positions[protein.uniprot_id] = len(self.table)
+                self.table.append(_annotations(protein))
+        snapshot = getattr(getattr(self.dag, 'index', None), 'path', None)
+        self._pool = multiprocessing.Pool(
+            processes=self.n_jobs, initializer=_initialize_worker,
+            initargs=(self.table, snapshot, None if snapshot else self.dag)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def compute(self, pairs):
+        """Computes the features of each `(source, target)` pair of
+        :class:`..database.models.Protein` instances. The result is
+        identical to :func:`.features.compute_interaction_features_batch`.
+        """
+        pairs = list(pairs)
+        if self._pool is None or len(pairs) == 0:
+            return compute_interaction_features_batch(pairs, self.dag)
+
+        chunk_size = max(
+            1, -(-len(pairs) // (self.n_jobs * self.chunks_per_job)))
+        tasks = [
+            self._task(pairs[i:i + chunk_size])
+            for i in range(0, len(pairs), chunk_size)
+        ]
+        features = self._pool.map(_compute_chunk, tasks)
+        return [values for chunk in features for values in chunk]
+
+    def _task(self, pairs):
+        # Proteins outside the shared table are numbered after it, in the
+        # order they appear in this task only.
+        extra = []
+        positions = {}
+        id_pairs = []
+        for pair in pairs:
+            ids = []
+            for protein in pair:
+                if protein is None:
+                    ids.append(-1)
+                    continue
+                i = self._positions.get(protein.uniprot_id, None)
+                if i is None:
+                    i = positions.get(protein.uniprot_id, None)
+                if i is None:
+                    i = positions[protein.uniprot_id] = \
+                        len(self.table) + len(extra)
+                    extra.append(_annotations(protein))
+                ids.append(i)
+            id_pairs.append(tuple(ids))
+        return extra, id_pairs
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def compute_interaction_features_pool(pairs, n_jobs=1, dag=None,
+                                      chunks_per_job=4, pool=None):
+    """Computes the textual features of many interactions over a pool of
+    `n_jobs` processes. The result is identical to
+    :func:`.features.compute_interaction_features_batch`.
+
+    Parameters:
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    n_jobs : int, optional, default: 1
+        Number of processes to use. Negative values are interpreted as in
+        `joblib`, for example -1 uses all processors.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used. Workers
+        load a dag backed by a snapshot from its memory mapped files,
+        other dags are copied to each worker.
+
+    chunks_per_job : int, optional, default: 4
+        Number of tasks to split `pairs` into per process.
+
+    pool : :class:`FeaturePool`, optional, default: None
+        An open pool to compute with, reused across calls. `n_jobs`,
+        `dag` and `chunks_per_job` are then ignored. If None, a pool is
+        started for this call only.
+
+    Returns
+    -------
+    list
+        Features of each pair as returned by
+        :func:`.features.compute_interaction_features_batch`.
+    """
+    if pool is not None:
+        return pool.compute(pairs)
+    pairs = list(pairs)
+    proteins = (p for pair in pairs for p in pair if p is not None)
+    with FeaturePool(proteins, n_jobs=n_jobs, dag=dag,
+                     chunks_per_job=chunks_per_job) as pool:
+        return pool.compute(pairs)
@@ -1,16 +1,46 @@
 """
 This module contains a method to compute features of a Protein-Protein
-interaction based on two protein inputs.
+interaction based on two protein inputs, and a transformer projecting the
+GO terms of textual features onto a smaller vocabulary.
 """
 
-__all__ = ['compute_interaction_features']
+__all__ = [
+    'compute_interaction_features', 'compute_interaction_features_batch',
+    'compute_ulca_features_many', 'iter_interaction_features',
+    'cross_feature_indices', 'compute_cross_features_many',
+    'GOTermProjector'
+]
+
+import os
+import json
+import numpy as np
+from itertools import islice
+from collections import namedtuple
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import murmurhash3_32
 
 from .ontology import (
-    get_up_to_lca, group_terms_by_ontology_type, get_active_instance
+    get_up_to_lca, get_up_to_lca_many, group_terms_by_ontology_type,
+    get_active_instance
 )
 
 DAG = None
 
+GO_ATTRS = ('go_mf', 'go_bp', 'go_cc')
+DOMAIN_ATTRS = ('interpro', 'pfam', 'keywords')
+
+# Annotations of a protein parsed once per batch. GO annotations are stored
+# as integer ids into the dag index, or as accessions for dags without an
+# index, and the remaining annotations as tuples.
+ProteinRecord = namedtuple('ProteinRecord', GO_ATTRS + DOMAIN_ATTRS)
+
+# Name of the hashed source term x target term feature group and the
+# annotations crossed within it.
+CROSS_FEATURE = 'cross'
+CROSS_ATTRS = GO_ATTRS + ('interpro', 'pfam')
+N_CROSS_FEATURES = 2 ** 20
+
 
 def _split_string(value, sep=','):
     """Safe split a string removing empty/falsey strings resulting from
@@ -29,7 +59,45 @@ def _split_string(value, sep=','):
         return None
 
 
-def compute_interaction_features(source, target, dag=None):
+def cross_feature_indices(source_terms, target_terms,
+                          n_features=N_CROSS_FEATURES):
+    """Hashes each cross of a source term and a target term of the same
+    annotation type into a column index of a space with `n_features`
+    columns. Crosses are unordered, so swapping `source_terms` and
+    `target_terms` gives the same indices.
+
+    Parameters
+    ----------
+    source_terms : list
+        One list of terms for each annotation in `CROSS_ATTRS`.
+
+    target_terms : list
+        One list of terms for each annotation in `CROSS_ATTRS`.
+
+    n_features : int, optional, default: 2 ** 20
+        The number of columns to hash into.
+
+    Returns
+    -------
+    list
+        Sorted column indices, one for each distinct cross.
+    """
+    indices = []
+    for attr, a_terms, b_terms in zip(CROSS_ATTRS, source_terms, target_terms):
+        crosses = set(
+            (a, b) if a <= b else (b, a)
+            for a in set(a_terms) for b in set(b_terms)
+        )
+        indices.extend(
+            murmurhash3_32(
+                '{}:{}|{}'.format(attr, a, b), positive=True
+            ) % n_features
+            for (a, b) in crosses
+        )
+    return sorted(indices)
+
+
+def compute_interaction_features(source, target, dag=None, crosses=False):
     """Computes the textual features for an interaction between `source` and
     `target`.
 
@@ -47,6 +115,11 @@ def compute_interaction_features(source, target, dag=None):
         dag instance will be loaded, which is loaded from the `~./pyppi`
         directory.
 
+    crosses : bool, optional, default: False
+        If True, also compute the `cross` feature, the hashed column
+        indices of :func:`cross_feature_indices` for the GO, InterPro and
+        Pfam annotations.
+
     Returns
     -------
     dict[str, str] or None
@@ -104,15 +177,15 @@ def compute_interaction_features(source, target, dag=None):
     keywords_target = keywords_target if keywords_target is not None else []
 
     # Prepare the ulca terms and combined lists
-    terms = get_up_to_lca(go_mf_source, go_mf_target) + \
-        get_up_to_lca(go_bp_source, go_bp_target) + \
-        get_up_to_lca(go_cc_source, go_cc_target)
+    terms = get_up_to_lca(go_mf_source, go_mf_target, dag) + \
+        get_up_to_lca(go_bp_source, go_bp_target, dag) + \
+        get_up_to_lca(go_cc_source, go_cc_target, dag)
 
     # The ulca inducer will mix up the ontology types since the part_of
     # relationship can cross-link between ontologies. This may result
     # in some terms being induced more than twice so re-group them
     # and apply a filter.
-    grouped = group_terms_by_ontology_type(terms, max_count=2)
+    grouped = group_terms_by_ontology_type(terms, max_count=2, dag=dag)
     ulca_go_mf = [dag[tid].id for tid in grouped['mf']]
     ulca_go_bp = [dag[tid].id for tid in grouped['bp']]
     ulca_go_cc = [dag[tid].id for tid in grouped['cc']]
@@ -129,4 +202,536 @@ def compute_interaction_features(source, target, dag=None):
         ulca_go_mf=ulca_go_mf, ulca_go_bp=ulca_go_bp, ulca_go_cc=ulca_go_cc,
         interpro=interpro, pfam=pfam, keywords=keywords
     )
+    if crosses:
+        features[CROSS_FEATURE] = cross_feature_indices(
+            [go_mf_source, go_bp_source, go_cc_source, interpro_source,
+             pfam_source],
+            [go_mf_target, go_bp_target, go_cc_target, interpro_target,
+             pfam_target]
+        )
     return features
+
+
+def _accession_lookup(dag):
+    """Returns a function mapping the GO term ids of a
+    :class:`ProteinRecord` back to accessions."""
+    index = getattr(dag, 'index', None)
+    if index is None:
+        return lambda tid: tid
+    return index.ids.__getitem__
+
+
+def _parse_protein(protein, dag, skip_missing=False):
+    """Parses the annotations of `protein` into a :class:`ProteinRecord`.
+    GO accessions are resolved to the integer id of their primary term.
+    Accessions missing from `dag` raise a `KeyError` unless `skip_missing`
+    is True, in which case they are ignored."""
+    index = getattr(dag, 'index', None)
+    go = []
+    for attr in GO_ATTRS:
+        terms = _split_string(getattr(protein, attr)) or []
+        if skip_missing:
+            terms = [t for t in terms if t in dag]
+        if index is None:
+            go.append(tuple(dag[t].id for t in terms))
+        else:
+            go.append(tuple(index.index_of(dag[t].id) for t in terms))
+    domains = [
+        tuple(_split_string(getattr(protein, attr)) or [])
+        for attr in DOMAIN_ATTRS
+    ]
+    return ProteinRecord(*(go + domains))
+
+
+def _parse_proteins(pairs, dag, skip_missing=False):
+    """Parses every distinct protein in `pairs` once. Returns a list with a
+    `(source, target)` tuple of :class:`ProteinRecord` for each pair, or
+    None if either protein is `None`."""
+    cache = {}
+    records = []
+    for (source, target) in pairs:
+        if source is None or target is None:
+            records.append(None)
+            continue
+        pair = []
+        for protein in (source, target):
+            record = cache.get(id(protein), None)
+            if record is None:
+                record = _parse_protein(protein, dag, skip_missing)
+                cache[id(protein)] = (protein, record)
+            else:
+                record = record[1]
+            pair.append(record)
+        records.append(tuple(pair))
+    return records
+
+
+def _induce_many(records, dag):
+    """Computes the grouped ULCA features of each pair of records with a
+    single call to :func:`.ontology.get_up_to_lca_many`."""
+    accession = _accession_lookup(dag)
+
+    go_pairs = []
+    for pair in records:
+        if pair is None:
+            continue
+        source, target = pair
+        for attr in GO_ATTRS:
+            go_pairs.append((
+                [accession(t) for t in getattr(source, attr)],
+                [accession(t) for t in getattr(target, attr)]
+            ))
+
+    induced = get_up_to_lca_many(go_pairs, dag)
+    if getattr(dag, 'index', None) is not None:
+        return _group_many(records, induced, dag.index)
+
+    features = []
+    j = 0
+    for pair in records:
+        if pair is None:
+            features.append(None)
+            continue
+        terms = [
+            t for ts in induced[j * len(GO_ATTRS):(j + 1) * len(GO_ATTRS)]
+            for t in ts
+        ]
+        j += 1
+        grouped = group_terms_by_ontology_type(terms, max_count=2, dag=dag)
+        features.append(dict(
+            ulca_go_mf=[dag[tid].id for tid in grouped['mf']],
+            ulca_go_bp=[dag[tid].id for tid in grouped['bp']],
+            ulca_go_cc=[dag[tid].id for tid in grouped['cc']]
+        ))
+    return features
+
+
+def _group_many(records, induced, index, max_count=2):
+    """Vectorised :func:`.ontology.group_terms_by_ontology_type` over the
+    concatenated ULCA terms of every pair of records, keeping at most
+    `max_count` copies of a term per pair in order of appearance."""
+    width = len(GO_ATTRS)
+    n_pairs = len(induced) // width
+    lengths = np.asarray([
+        sum(len(ts) for ts in induced[j * width:(j + 1) * width])
+        for j in range(n_pairs)
+    ], dtype=np.int64)
+    term_index = index.term_index
+    terms = np.fromiter(
+        (term_index[t] for ts in induced for t in ts),
+        dtype=np.int64, count=int(lengths.sum())
+    )
+    rows = np.repeat(np.arange(n_pairs, dtype=np.int64), lengths)
+    positions = np.arange(len(terms))
+
+    # Rank each occurrence of a term within its pair.
+    order = np.lexsort((positions, terms, rows))
+    changed = np.ones(len(order), dtype=bool)
+    changed[1:] = (rows[order][1:] != rows[order][:-1]) | \
+        (terms[order][1:] != terms[order][:-1])
+    starts = np.maximum.accumulate(np.where(changed, positions, 0))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = positions - starts
+
+    slots = {'molecular_function': 0, 'biological_process': 1,
+             'cellular_component': 2}
+    slot_of_code = np.asarray(
+        [slots.get(name, -1) for name in index.namespace_names],
+        dtype=np.int64
+    )
+    slot = slot_of_code[index.namespace[terms]]
+    if len(slot) and slot.min() < 0:
+        term = index.ids[terms[np.argmin(slot)]]
+        raise ValueError("Term %s doesn't belong to any ontology." % term)
+
+    keep = rank < max_count
+    rows, slot, terms = rows[keep], slot[keep], terms[keep]
+    order = np.lexsort((np.arange(len(terms)), slot, rows))
+    groups = np.split(
+        terms[order],
+        np.cumsum(np.bincount(rows * 3 + slot, minlength=n_pairs * 3))[:-1]
+    )
+
+    ids = index.ids
+    features = []
+    j = 0
+    for pair in records:
+        if pair is None:
+            features.append(None)
+            continue
+        mf, bp, cc = groups[j * 3:(j + 1) * 3]
+        j += 1
+        features.append(dict(
+            ulca_go_mf=[ids[i] for i in mf.tolist()],
+            ulca_go_bp=[ids[i] for i in bp.tolist()],
+            ulca_go_cc=[ids[i] for i in cc.tolist()]
+        ))
+    return features
+
+
+def _record_cross_terms(record, accession):
+    return [
+        [accession(t) for t in getattr(record, attr)]
+        if attr in GO_ATTRS else getattr(record, attr)
+        for attr in CROSS_ATTRS
+    ]
+
+
+def compute_cross_features_many(pairs, n_features=N_CROSS_FEATURES,
+                                dag=None):
+    """Computes the hashed `cross` feature of many interactions as a sparse
+    matrix with `n_features` columns, so it can be combined with other
+    feature matrices without growing a vocabulary.
+
+    Parameters:
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    n_features : int, optional, default: 2 ** 20
+        The number of columns to hash into.
+
+    dag : dict, optional, default: None
+        If None, the default global dag instance will be used.
+
+    Returns
+    -------
+    :class:`sparse.csr_matrix`
+        Matrix of shape `(len(pairs), n_features)` counting the crosses
+        hashed to each column. Rows of pairs where either protein is `None`
+        are empty.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    records = _parse_proteins(pairs, dag)
+    accession = _accession_lookup(dag)
+
+    indptr = [0]
+    indices = []
+    for pair in records:
+        if pair is not None:
+            source, target = pair
+            indices.extend(cross_feature_indices(
+                _record_cross_terms(source, accession),
+                _record_cross_terms(target, accession),
+                n_features
+            ))
+        indptr.append(len(indices))
+
+    X = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int64), indices, indptr),
+        shape=(len(records), n_features)
+    )
+    X.sum_duplicates()
+    return X
+
+
+def compute_interaction_features_batch(pairs, dag=None, crosses=False):
+    """Computes the textual features of many interactions. Each distinct
+    protein is parsed once and the ULCA induction of all pairs is computed
+    in batch, so the result is identical to calling
+    :func:`compute_interaction_features` on each pair but much faster when
+    proteins take part in many interactions.
+
+    Parameters:
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    dag : dict, optional, default: None
+        A dag represented by a dictionary of str accessions pointing 
+        :class:`.ontology.GOTerm` instances. If None, the default global
+        dag instance will be loaded, which is loaded from the `~./pyppi`
+        directory.
+
+    crosses : bool, optional, default: False
+        If True, also compute the hashed `cross` feature.
+
+    Returns
+    -------
+    list
+        List containing `None` for each pair where either protein is `None`,
+        otherwise a `dict` mapping feature names to a list of computed
+        annotations as returned by :func:`compute_interaction_features`.
+    """
+    if dag is None:
+        dag = get_active_instance()
+
+    pairs = list(pairs)
+    records = _parse_proteins(pairs, dag)
+    induced = _induce_many(records, dag)
+    accession = _accession_lookup(dag)
+
+    features = []
+    for pair, ulca in zip(records, induced):
+        if pair is None:
+            features.append(None)
+            continue
+        source, target = pair
+        values = dict(ulca)
+        for attr in GO_ATTRS:
+            values[attr] = [
+                accession(t)
+                for t in getattr(source, attr) + getattr(target, attr)
+            ]
+        for attr in DOMAIN_ATTRS:
+            values[attr] = list(getattr(source, attr) + getattr(target, attr))
+        if crosses:
+            values[CROSS_FEATURE] = cross_feature_indices(
+                _record_cross_terms(source, accession),
+                _record_cross_terms(target, accession)
+            )
+        features.append(values)
+    return features
+
+
+def compute_ulca_features_many(pairs, dag=None):
+    """Computes only the ULCA induced GO features for many interactions. The
+    induction is computed in batch with
+    :func:`.ontology.get_up_to_lca_many` and the results are identical to
+    the `ulca_go_*` features of :func:`compute_interaction_features`.
+    Annotations missing from `dag`, for example terms removed in a newer
+    GO release, are ignored.
+
+    Parameters:
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    dag : dict, optional, default: None
+        A dag represented by a dictionary of str accessions pointing 
+        :class:`.ontology.GOTerm` instances. If None, the default global
+        dag instance will be loaded, which is loaded from the `~./pyppi`
+        directory.
+
+    Returns
+    -------
+    list
+        List containing `None` for each pair where either protein is `None`,
+        otherwise a `dict` with the keys `ulca_go_mf`, `ulca_go_bp` and
+        `ulca_go_cc`.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    records = _parse_proteins(pairs, dag, skip_missing=True)
+    return _induce_many(records, dag)
+
+
+def _read_checkpoint(path):
+    if path is None or not os.path.isfile(path):
+        return 0
+    with open(path, 'rt') as fp:
+        return json.load(fp)['completed']
+
+
+def _write_checkpoint(path, completed):
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wt') as fp:
+        json.dump({'completed': completed}, fp)
+    os.replace(tmp_path, path)
+
+
+def iter_interaction_features(pairs, chunk_size=10000, checkpoint=None,
+                              compute=None, dag=None):
+    """Computes the textual features of interactions in chunks of
+    `chunk_size` pairs, so that callers can persist and release the
+    features of each chunk before the next is computed. `pairs` is only
+    consumed one chunk at a time, so memory is bounded by `chunk_size`
+    when it is a generator.
+
+    Parameters:
+    ----------
+    pairs : iterable
+        Iterable of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    chunk_size : int, optional, default: 10000
+        Number of pairs per chunk.
+
+    checkpoint : str, optional, default: None
+        Path of a file recording the number of pairs in completed chunks.
+        A chunk is complete once the next chunk is requested. If the file
+        exists, that many pairs are skipped so that an interrupted run
+        resumes after its last completed chunk. The file is removed once
+        all chunks are complete.
+
+    compute : callable, optional, default: None
+        Function computing the features of a list of pairs. Defaults to
+        :func:`compute_interaction_features_batch`.
+
+    dag : dict, optional, default: None
+        The dag passed to :func:`compute_interaction_features_batch` if
+        `compute` is None.
+
+    Returns
+    -------
+    generator
+        Generator of `(start, chunk, features)` tuples, where `start` is
+        the position of the first pair of `chunk` in `pairs` and
+        `features` the list of features of each pair in `chunk`.
+    """
+    if chunk_size < 1:
+        raise ValueError("`chunk_size` must be positive.")
+    if compute is None:
+        def compute(chunk):
+            return compute_interaction_features_batch(chunk, dag)
+
+    start = _read_checkpoint(checkpoint)
+    pairs = iter(pairs)
+    if start:
+        next(islice(pairs, start, start), None)
+
+    while True:
+        chunk = list(islice(pairs, chunk_size))
+        if not chunk:
+            break
+        yield start, chunk, compute(chunk)
+        start += len(chunk)
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, start)
+
+    if checkpoint is not None and os.path.isfile(checkpoint):
+        os.remove(checkpoint)
+
+
+class GOTermProjector(BaseEstimator, TransformerMixin):
+    """Projects the GO terms in comma delimited feature strings, as returned
+    by :func:`..predict.utilities.interactions_to_Xy_format`, onto a smaller
+    vocabulary before vectorisation. Each term deeper than `max_depth` is
+    replaced by its ancestors at depth `max_depth`, or each term is replaced
+    by the terms of the GO slim `slim` it is annotated to. Terms are
+    accepted with or without the ':' separator and non-GO features are
+    left unchanged. Use as the first step of a `Pipeline` so the same
+    projection is applied when fitting and predicting.
+
+    Parameters
+    ----------
+    max_depth : int, optional, default: None
+        The maximum depth of projected terms, where the roots of each
+        ontology have depth 0.
+
+    slim : iterable, optional, default: None
+        GO accessions of a GO slim. Terms without an ancestor in the slim
+        are removed. Exactly one of `max_depth` or `slim` must be given.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used. Leave as
+        None to avoid storing the dag when pickling a fitted model.
+
+    namespaces : iterable, optional, default: None
+        The GO namespaces to load when `dag` is None, usually
+        :func:`.ontology.namespaces_for_selection` of the features the
+        model is trained on. If empty, no dag is loaded and features are
+        left unchanged.
+    """
+
+    def __init__(self, max_depth=None, slim=None, dag=None, namespaces=None):
+        self.max_depth = max_depth
+        self.slim = slim
+        self.dag = dag
+        self.namespaces = namespaces
+
+    def _check_params(self):
+        if (self.max_depth is None) == (self.slim is None):
+            raise ValueError("Exactly one of max_depth or slim must be set.")
+        if self.max_depth is not None and self.max_depth < 0:
+            raise ValueError("max_depth must be a non-negative integer.")
+
+    def _project_term(self, token, index, slim_ids):
+        has_colon = ':' in token
+        accession = token if has_colon else 'GO:' + token[2:]
+        i = index.term_index.get(accession, None)
+        if i is None:
+            return [token]
+
+        candidates = [i] + index.ancestors(i).tolist()
+        if slim_ids is None:
+            if index.depth[i] <= self.max_depth:
+                return [token]
+            projected = [
+                j for j in candidates if index.depth[j] == self.max_depth
+            ]
+        else:
+            projected = [j for j in candidates if j in slim_ids]
+
+        ids = [index.ids[j] for j in sorted(projected)]
+        return ids if has_colon else [tid.replace(':', '') for tid in ids]
+
+    def _project(self, x, mapping, index, slim_ids):
+        features = []
+        for token in _split_string(x) or []:
+            if index is None or not token.startswith('GO'):
+                features.append(token)
+                continue
+            projected = mapping.get(token, None)
+            if projected is None:
+                projected = self._project_term(token, index, slim_ids)
+                mapping[token] = projected
+            features.extend(projected)
+        return ','.join(features)
+
+    def __getstate__(self):
+        # The projection of each term is cheap to recompute, so the memo
+        # is not pickled along with the model.
+        state = self.__dict__.copy()
+        state.pop('_mapping', None)
+        return state
+
+    def _context(self):
+        self._check_params()
+        dag = self.dag
+        if dag is None and self.namespaces is None:
+            dag = get_active_instance()
+        elif dag is None:
+            dag = get_active_instance(namespaces=self.namespaces)
+        if dag is None:
+            return None, None
+        index = dag.index
+        slim_ids = None
+        if self.slim is not None:
+            slim_ids = set(
+                index.term_index[t] for t in self.slim
+                if t in index.term_index
+            )
+        return index, slim_ids
+
+    def fit(self, X, y=None):
+        """Validates the parameters. The projection does not depend on the
+        training data.
+
+        Parameters
+        ----------
+        X : array-like
+            Comma delimited feature strings.
+
+        Returns
+        -------
+        self
+        """
+        self._check_params()
+        return self
+
+    def transform(self, X):
+        """Projects the GO features of each string in `X`.
+
+        Parameters
+        ----------
+        X : array-like
+            Comma delimited feature strings.
+
+        Returns
+        -------
+        :class:`np.ndarray`
+            Array of the projected comma delimited feature strings.
+        """
+        index, slim_ids = self._context()
+        key = (self.max_depth, self.slim, id(index))
+        if getattr(self, '_mapping', (None,))[0] != key:
+            self._mapping = (key, {})
+        mapping = self._mapping[1]
+        return np.asarray(
+            [self._project(x, mapping, index, slim_ids) for x in X]
+        )
@@ -0,0 +1,121 @@
+"""
+This module contains a streaming tokenizer for OBO 1.2 files which is shared
+by the `ontology` and `psimi` parsers. The tokenizer works directly on the
+bytes of a (gzipped) obo file and only extracts the tags requested by the
+caller from each `[Term]` stanza.
+"""
+
+__all__ = [
+    'TERM_FIELDS',
+    'iter_obo_terms'
+]
+
+TERM_FIELDS = (
+    'id', 'alt_id', 'name', 'namespace', 'is_a', 'part_of', 'is_obsolete'
+)
+
+_TEXT = 0
+_LIST = 1
+_PART_OF = 2
+_FLAG = 3
+
+_FIELD_TAGS = {
+    'id': (b'id', _TEXT),
+    'alt_id': (b'alt_id', _LIST),
+    'name': (b'name', _TEXT),
+    'namespace': (b'namespace', _TEXT),
+    'is_a': (b'is_a', _LIST),
+    'part_of': (b'relationship', _PART_OF),
+    'is_obsolete': (b'is_obsolete', _FLAG),
+}
+
+
+def _new_entry(fields):
+    entry = {}
+    for field, (_, kind) in fields.items():
+        if kind == _TEXT:
+            entry[field] = None
+        elif kind == _FLAG:
+            entry[field] = False
+        else:
+            entry[field] = []
+    return entry
+
+
+def _iter_lines(fp, size=1 << 20):
+    """Iterates over the lines of a binary file by reading it in blocks of
+    `size` bytes, which is much faster than `readline` on gzip streams."""
+    remainder = b''
+    while True:
+        block = fp.read(size)
+        if not block:
+            break
+        lines = (remainder + block).split(b'\n')
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def iter_obo_terms(fp, fields=TERM_FIELDS):
+    """Iterates over the `[Term]` stanzas of an OBO 1.2 file.
+
+    Parameters
+    ----------
+    fp : file object
+        A file opened in binary mode, for example the handle returned by
+        `gzip.open(filename, 'rb')`.
+
+    fields : iterable, optional, default: `TERM_FIELDS`
+        The fields to extract from each stanza. Must be a subset of
+        `TERM_FIELDS`. `alt_id`, `is_a` and `part_of` are returned as lists
+        of accessions, `is_obsolete` as a bool and the remaining fields as
+        str or None if missing.
+
+    Returns
+    -------
+    generator
+        Generator of `dict` mapping each requested field to its value.
+    """
+    fields = {f: _FIELD_TAGS[f] for f in fields}
+    tags = {}
+    for field, (tag, kind) in fields.items():
+        tags[tag] = (field, kind)
+
+    entry = None
+    in_header = True
+    for line in _iter_lines(fp):
+        if line[:1] == b'[':
+            if entry is not None:
+                yield entry
+            in_header = False
+            entry = _new_entry(fields) if line.startswith(b'[Term]') else None
+            continue
+
+        if entry is None:
+            if in_header and line.startswith(b'format-version:'):
+                version = float(line.partition(b':')[2])
+                if version != 1.2:
+                    raise ValueError("Parser only supports version 1.2.")
+            continue
+
+        tag, _, value = line.partition(b':')
+        target = tags.get(tag, None)
+        if target is None:
+            continue
+
+        field, kind = target
+        if kind == _TEXT:
+            entry[field] = value.strip().decode('utf-8')
+        elif kind == _LIST:
+            # Drop trailing qualifiers and '! comment' text.
+            entry[field].append(value.split(None, 1)[0].decode('utf-8'))
+        elif kind == _PART_OF:
+            relationship = value.split(None, 2)
+            if relationship[0] == b'part_of':
+                entry[field].append(relationship[1].decode('utf-8'))
+        else:
+            entry[field] = value.strip() == b'true'
+
+    if entry is not None:
+        yield entry
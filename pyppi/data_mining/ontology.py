@@ -8,29 +8,548 @@ Bioinformatics, 28(1), 69-75.
 """
 
 
+import os
 import gzip
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from scipy import sparse
 from functools import reduce
 from operator import itemgetter
 
-from ..base.file_paths import obo_file
+from ..base.file_paths import obo_file, go_snapshot_path
+from .obo import iter_obo_terms
 
 __GODAG__ = None
 
+logger = logging.getLogger("pyppi")
+
+IS_A = 0
+PART_OF = 1
+GO_TERM_FIELDS = (
+    'id', 'alt_id', 'name', 'namespace', 'is_a', 'part_of', 'is_obsolete'
+)
+SNAPSHOT_VERSION = 1
+SNAPSHOT_ARRAYS = (
+    'ids', 'names_data', 'names_indptr', 'namespace', 'namespace_names',
+    'is_obsolete', 'parent_indptr', 'parent_indices', 'parent_kinds',
+    'depth', 'ancestor_indptr', 'ancestor_indices', 'alt_ids', 'alt_targets'
+)
+GO_NAMESPACES = OrderedDict([
+    ('mf', 'molecular_function'),
+    ('bp', 'biological_process'),
+    ('cc', 'cellular_component'),
+])
+
 
 def get_active_instance(**kwargs):
-    global __GODAG__
-    if __GODAG__ is None:
-        filename = kwargs.get("filename", obo_file)
-        __GODAG__ = parse_obo12_file(filename)
+    """Returns the global GO dag, loading it on first use. The dag is loaded
+    from a compiled snapshot of the obo file if one exists, otherwise the
+    obo file is parsed and a snapshot is saved for the next process.
+
+    Parameters
+    ----------
+    filename : str, optional
+        Path for the gzipped obo file. Defaults to `~/.pyppi/go.obo.gz`.
+
+    use_snapshot : bool, optional, default: True
+        If False, always parse the obo file and do not save a snapshot.
+
+    namespaces : iterable, optional
+        The GO namespaces required by the caller, for example from
+        :func:`namespaces_for_selection`. Only these namespaces and their
+        ancestors are loaded. The global dag is reloaded if it does not
+        cover them. If empty, nothing is loaded and the current global dag,
+        possibly None, is returned. If not supplied, a dag covering every
+        namespace is returned.
+    """
+    required = kwargs.get("namespaces", None)
+    if required is not None:
+        required = frozenset(required)
+        if not required:
+            return __GODAG__
+    if __GODAG__ is not None and _covers(__GODAG__, required):
+        return __GODAG__
+
+    if __GODAG__ is not None and required is not None:
+        # Keep the namespaces already loaded for other callers.
+        required = required | __GODAG__.namespaces
+    filename = kwargs.get("filename", obo_file)
+    if kwargs.get("use_snapshot", True):
+        dag = load_or_compile_snapshot(filename, namespaces=required)
+    else:
+        dag = parse_obo12_file(filename, namespaces=required)
+    set_active_instance(dag)
     return __GODAG__
 
 
+def _covers(dag, namespaces):
+    loaded = getattr(dag, 'namespaces', None)
+    if loaded is None:
+        return True
+    return namespaces is not None and namespaces <= loaded
+
+
+def namespaces_for_selection(selection):
+    """Returns the GO namespaces needed to compute the features in
+    `selection`, for example `molecular_function` for `go_mf` or
+    `ulca_go_mf`.
+
+    Parameters
+    ----------
+    selection : list
+        List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
+        'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam'.
+
+    Returns
+    -------
+    `frozenset`
+        The namespace names. Empty if `selection` has no GO features.
+    """
+    namespaces = set()
+    for attr in selection:
+        attr = getattr(attr, 'value', attr)
+        prefix, _, code = attr.rpartition('_')
+        if prefix in ('go', 'ulca_go') and code in GO_NAMESPACES:
+            namespaces.add(GO_NAMESPACES[code])
+    return frozenset(namespaces)
+
+
+def set_active_instance(dag):
+    """Sets the global GO dag returned by :func:`get_active_instance`.
+    The ULCA cache is cleared if `dag` is a different instance."""
+    global __GODAG__
+    if dag is not __GODAG__:
+        __GODAG__ = dag
+        get_ulca_cache().bind(getattr(dag, 'index', None))
+
+
 # ------------------------------------------------------ #
 #
 #                         OBO PARSER
 #
 # ------------------------------------------------------ #
-GODag = dict
+class GODag(MutableMapping):
+    """A dictionary mapping GO accessions, including alternate accessions,
+    to :class:`GOTerm` instances. Dags returned by :func:`parse_obo12_file`
+    and :func:`load_go_snapshot` also carry a :class:`GODagIndex` over their
+    terms in `index`. Terms of these dags are only created from the index
+    when they are first accessed.
+
+    Parameters
+    ----------
+    index : :class:`GODagIndex`, optional, default: None
+        Index to create terms from.
+
+    namespaces : frozenset, optional, default: None
+        The namespaces the dag was restricted to when loaded, or None if it
+        contains every namespace. A restricted dag also contains the
+        ancestors of its terms in other namespaces.
+    """
+
+    def __init__(self, index=None, namespaces=None):
+        self._terms = {}
+        self.index = index
+        self.namespaces = namespaces
+
+    def __getitem__(self, key):
+        term = self._terms.get(key, None)
+        if term is not None:
+            return term
+        if self.index is None:
+            raise KeyError(key)
+        return self.index.term(self.index.term_index[key])
+
+    def __setitem__(self, key, term):
+        self._terms[key] = term
+
+    def __delitem__(self, key):
+        del self._terms[key]
+
+    def __contains__(self, key):
+        if key in self._terms:
+            return True
+        return self.index is not None and key in self.index.term_index
+
+    def __iter__(self):
+        if self.index is None:
+            return iter(self._terms)
+        return iter(self.index.term_index)
+
+    def __len__(self):
+        if self.index is None:
+            return len(self._terms)
+        return len(self.index.term_index)
+
+
+class GODagIndex(object):
+    """Integer encoding of a GO dag. Each primary term is assigned a dense
+    integer id and its ancestor closure is precomputed once and stored as
+    a CSR array, so that ancestor, depth and LCA queries do not need to
+    traverse the dag. All arrays can be backed by memory mapped files,
+    see :func:`save_go_snapshot`.
+
+    Parameters
+    ----------
+    ids : list
+        Primary accessions of the terms. The position of each accession
+        is the integer id of the term.
+
+    names : list
+        Text description of each term.
+
+    namespaces : list
+        The namespace of each term.
+
+    is_obsolete : list
+        Boolean obsolete flag for each term.
+
+    parent_indptr : array-like
+        CSR row pointer for the immediate parents of each term.
+
+    parent_indices : array-like
+        CSR column indices for the immediate parents of each term.
+
+    parent_kinds : array-like
+        The relationship of each parent edge, either `IS_A` or `PART_OF`.
+
+    alt_ids : dict, optional, default: None
+        Mapping of alternate accessions to the integer id of their
+        primary term.
+
+    Attributes
+    ----------
+    term_index : dict
+        Mapping from primary and alternate accessions to integer ids.
+
+    depth : :class:`np.ndarray`
+        Longest path from each term to the top of its ontology.
+
+    ancestor_indptr : :class:`np.ndarray`
+        CSR row pointer for the ancestor closure of each term.
+
+    ancestor_indices : :class:`np.ndarray`
+        CSR column indices for the ancestor closure of each term. The
+        ancestors of each term are sorted.
+
+    path : str or None
+        Directory of the snapshot the index was loaded from, if any.
+    """
+
+    def __init__(self, ids, names, namespaces, is_obsolete, parent_indptr,
+                 parent_indices, parent_kinds, alt_ids=None):
+        alt_ids = alt_ids or {}
+        names = [n.encode('utf-8') for n in names]
+        namespace_names = sorted(set(namespaces))
+        codes = {ns: i for (i, ns) in enumerate(namespace_names)}
+
+        arrays = dict(
+            ids=np.asarray(ids, dtype=bytes),
+            names_data=np.frombuffer(b''.join(names), dtype=np.uint8),
+            names_indptr=np.cumsum(
+                [0] + [len(n) for n in names], dtype=np.int64),
+            namespace=np.asarray(
+                [codes[ns] for ns in namespaces], dtype=np.int8),
+            namespace_names=np.asarray(namespace_names, dtype=bytes),
+            is_obsolete=np.asarray(is_obsolete, dtype=bool),
+            parent_indptr=np.asarray(parent_indptr, dtype=np.int64),
+            parent_indices=np.asarray(parent_indices, dtype=np.int32),
+            parent_kinds=np.asarray(parent_kinds, dtype=np.int8),
+            alt_ids=np.asarray(list(alt_ids.keys()), dtype=bytes),
+            alt_targets=np.asarray(list(alt_ids.values()), dtype=np.int32),
+        )
+        arrays.update(self._compute_closure(
+            arrays['parent_indptr'], arrays['parent_indices']
+        ))
+        self._set_arrays(arrays)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Creates an index from a dictionary of precomputed arrays keyed by
+        the names in `SNAPSHOT_ARRAYS`, as written by
+        :func:`save_go_snapshot`."""
+        index = cls.__new__(cls)
+        index._set_arrays(arrays)
+        return index
+
+    @classmethod
+    def from_dag(cls, dag):
+        """Builds an index over the :class:`GOTerm` instances in `dag`."""
+        terms = []
+        alt_ids = {}
+        for tid, term in dag.items():
+            if tid == term.id:
+                terms.append(term)
+        positions = {term.id: i for (i, term) in enumerate(terms)}
+        for tid, term in dag.items():
+            if tid != term.id:
+                alt_ids[tid] = positions[term.id]
+
+        indptr = [0]
+        indices = []
+        kinds = []
+        for term in terms:
+            edges = sorted(
+                [(positions[p.id], IS_A) for p in term.is_a] +
+                [(positions[p.id], PART_OF) for p in term.part_of]
+            )
+            indices.extend(p for (p, _) in edges)
+            kinds.extend(k for (_, k) in edges)
+            indptr.append(len(indices))
+
+        index = cls(
+            ids=[t.id for t in terms],
+            names=[t.name for t in terms],
+            namespaces=[t.namespace for t in terms],
+            is_obsolete=[t.is_obsolete for t in terms],
+            parent_indptr=indptr, parent_indices=indices,
+            parent_kinds=kinds, alt_ids=alt_ids
+        )
+        index._terms = terms
+        return index
+
+    def _set_arrays(self, arrays):
+        self.arrays = arrays
+        for key in SNAPSHOT_ARRAYS:
+            setattr(self, key, arrays[key])
+
+        self.ids = arrays['ids'].astype(str).tolist()
+        self.namespace_names = tuple(
+            arrays['namespace_names'].astype(str).tolist()
+        )
+        self.term_index = {tid: i for (i, tid) in enumerate(self.ids)}
+        self.term_index.update(zip(
+            arrays['alt_ids'].astype(str).tolist(),
+            arrays['alt_targets'].tolist()
+        ))
+        self._terms = [None] * len(self.ids)
+        self._ancestor_sets = [None] * len(self.ids)
+        self._ancestor_matrix = None
+        self._reflexive_ancestor_matrix = None
+        self._ancestor_keys = None
+        self._child_indptr = None
+        self._namespace_list = None
+        self._fingerprint = None
+        self.path = None
+
+    @staticmethod
+    def _compute_closure(parent_indptr, parent_indices):
+        # Visit terms in topological order so that the closure of every
+        # parent is complete before it is merged into its children.
+        n = len(parent_indptr) - 1
+        indptr = parent_indptr.tolist()
+        indices = parent_indices.tolist()
+        parents = [indices[indptr[i]:indptr[i + 1]] for i in range(n)]
+        children = [[] for _ in range(n)]
+        n_parents = [len(ps) for ps in parents]
+        for i, ps in enumerate(parents):
+            for p in ps:
+                children[p].append(i)
+
+        depth = [0] * n
+        closure = [None] * n
+        queue = [i for i in range(n) if n_parents[i] == 0]
+        visited = 0
+        while queue:
+            i = queue.pop()
+            visited += 1
+            ancestors = set(parents[i])
+            for p in parents[i]:
+                ancestors |= closure[p]
+                depth[i] = max(depth[i], depth[p] + 1)
+            closure[i] = ancestors
+            for c in children[i]:
+                n_parents[c] -= 1
+                if n_parents[c] == 0:
+                    queue.append(c)
+
+        if visited != n:
+            raise ValueError("Ontology contains a cycle.")
+
+        ancestor_indptr = np.zeros(n + 1, dtype=np.int64)
+        ancestor_indptr[1:] = np.cumsum([len(a) for a in closure])
+        ancestor_indices = np.asarray(
+            [j for a in closure for j in sorted(a)], dtype=np.int32
+        )
+        return dict(
+            depth=np.asarray(depth, dtype=np.int32),
+            ancestor_indptr=ancestor_indptr,
+            ancestor_indices=ancestor_indices
+        )
+
+    def fingerprint(self):
+        """Returns a hex SHA-1 digest of the terms, alternate accessions,
+        obsolete flags and parent edges of the index. Two indices with the
+        same fingerprint induce the same features."""
+        if self._fingerprint is None:
+            sha1 = hashlib.sha1()
+            sha1.update('\n'.join(self.ids).encode('utf-8'))
+            sha1.update('\n'.join(self.namespace_names).encode('utf-8'))
+            sha1.update('\n'.join(
+                self.arrays['alt_ids'].astype(str).tolist()
+            ).encode('utf-8'))
+            for key in ('alt_targets', 'namespace', 'is_obsolete',
+                        'parent_indptr', 'parent_indices', 'parent_kinds'):
+                sha1.update(np.ascontiguousarray(
+                    self.arrays[key], dtype=np.int64).tobytes())
+            self._fingerprint = sha1.hexdigest()
+        return self._fingerprint
+
+    def index_of(self, accession):
+        """Returns the integer id of a primary or alternate accession."""
+        return self.term_index[accession]
+
+    def name(self, i):
+        """Returns the text description of term `i`."""
+        data = self.names_data[self.names_indptr[i]:self.names_indptr[i + 1]]
+        return data.tobytes().decode('utf-8')
+
+    def namespace_of(self, i):
+        """Returns the namespace of term `i`."""
+        return self.namespace_names[self.namespace[i]]
+
+    def namespace_list(self):
+        """Returns a list with the namespace of each term, for fast lookups
+        from Python code."""
+        if self._namespace_list is None:
+            self._namespace_list = [
+                self.namespace_names[c] for c in self.namespace.tolist()
+            ]
+        return self._namespace_list
+
+    def parents(self, i, kind=None):
+        """Returns the ids of the immediate parents of term `i`, optionally
+        restricted to the relationship `kind`."""
+        start, end = self.parent_indptr[i], self.parent_indptr[i + 1]
+        parents = self.parent_indices[start:end]
+        if kind is not None:
+            parents = parents[self.parent_kinds[start:end] == kind]
+        return parents
+
+    def children(self, i, kind=None):
+        """Returns the ids of the immediate children of term `i`, optionally
+        restricted to the relationship `kind`."""
+        if self._child_indptr is None:
+            order = np.argsort(self.parent_indices, kind='stable')
+            rows = np.repeat(
+                np.arange(len(self.ids), dtype=np.int32),
+                np.diff(self.parent_indptr)
+            )
+            self._child_indices = rows[order]
+            self._child_kinds = self.parent_kinds[order]
+            self._child_indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            self._child_indptr[1:] = np.cumsum(
+                np.bincount(self.parent_indices, minlength=len(self.ids))
+            )
+        start, end = self._child_indptr[i], self._child_indptr[i + 1]
+        children = self._child_indices[start:end]
+        if kind is not None:
+            children = children[self._child_kinds[start:end] == kind]
+        return children
+
+    def term(self, i):
+        """Returns the :class:`GOTerm` for integer id `i`, creating it from
+        the index arrays if it has not been accessed before."""
+        term = self._terms[i]
+        if term is None:
+            term = GOTerm.from_index(self, i)
+            self._terms[i] = term
+        return term
+
+    def ancestors(self, i):
+        """Returns the sorted ancestor ids of term `i` as an array."""
+        return self.ancestor_indices[
+            self.ancestor_indptr[i]:self.ancestor_indptr[i + 1]
+        ]
+
+    def ancestor_set(self, i):
+        """Returns the ancestor ids of term `i` as a `frozenset`."""
+        ancestors = self._ancestor_sets[i]
+        if ancestors is None:
+            ancestors = frozenset(self.ancestors(i).tolist())
+            self._ancestor_sets[i] = ancestors
+        return ancestors
+
+    def ancestor_matrix(self, reflexive=False):
+        """Returns the ancestor closure as a sparse matrix where entry
+        (i, j) is 1 if term `j` is an ancestor of term `i`. If `reflexive`
+        is True, each term is also considered an ancestor of itself."""
+        if reflexive:
+            if self._reflexive_ancestor_matrix is None:
+                self._reflexive_ancestor_matrix = (
+                    self.ancestor_matrix() +
+                    sparse.identity(len(self.ids), dtype=np.int32)
+                ).tocsr()
+            return self._reflexive_ancestor_matrix
+        if self._ancestor_matrix is None:
+            n = len(self.ids)
+            self._ancestor_matrix = sparse.csr_matrix(
+                (
+                    np.ones(len(self.ancestor_indices), dtype=np.int32),
+                    self.ancestor_indices, self.ancestor_indptr
+                ),
+                shape=(n, n)
+            )
+        return self._ancestor_matrix
+
+    def ancestor_keys(self):
+        """Returns the sorted array of `i * len(self) + j` for every term
+        `i` with ancestor `j`, for vectorised ancestor lookups."""
+        if self._ancestor_keys is None:
+            rows = np.repeat(
+                np.arange(len(self.ids), dtype=np.int64),
+                np.diff(self.ancestor_indptr)
+            )
+            self._ancestor_keys = rows * len(self.ids) + self.ancestor_indices
+        return self._ancestor_keys
+
+    def descendants(self, indices):
+        """Returns the sorted ids of all terms having at least one of the
+        terms in `indices` as an ancestor."""
+        selected = np.zeros(len(self.ids), dtype=bool)
+        selected[np.asarray(list(indices), dtype=np.int64)] = True
+        rows = np.repeat(
+            np.arange(len(self.ids), dtype=np.int32),
+            np.diff(self.ancestor_indptr)
+        )
+        return np.unique(rows[selected[self.ancestor_indices]])
+
+    def has_ancestor(self, i, j):
+        """Returns True if term `j` is an ancestor of term `i`."""
+        return j in self.ancestor_set(i)
+
+    def common_ancestors(self, indices):
+        """Returns the ids of the ancestors shared by all terms in
+        `indices` as a `set`."""
+        return set.intersection(
+            *[set(self.ancestor_set(i)) for i in indices]
+        )
+
+    def lowest_common_ancestors(self, indices):
+        """Computes the deepest common ancestors of the terms in `indices`.
+
+        Returns
+        -------
+        list or None
+            Sorted list of integer ids, or None if `indices` is empty or the
+            terms share no ancestors.
+        """
+        if not len(indices):
+            return None
+        common = self.common_ancestors(indices)
+        if not common:
+            return None
+        common = np.fromiter(common, dtype=np.int32, count=len(common))
+        depths = self.depth[common]
+        return sorted(common[depths == depths.max()].tolist())
 
 
 class GOTerm(object):
@@ -68,18 +587,98 @@ class GOTerm(object):
     _depth : int
         Depth in the tree computed as the longest path to the top.
 
+    Notes
+    -----
+    Terms use `__slots__` and terms created by :meth:`from_index` are thin
+    views over a :class:`GODagIndex`. Their name is decoded on access and
+    their relationships and depth are read from the index arrays each time
+    rather than stored on the term, unless they are explicitly assigned.
     """
 
+    __slots__ = (
+        'id', '_name', 'namespace', '_is_a', '_part_of', '_has_part',
+        '_has_a', 'is_obsolete', '_depth', '_index', '_idx'
+    )
+
     def __init__(self, id, name, namespace, is_a, part_of, is_obsolete):
         self.id = id
-        self.name = name
+        self._name = name
         self.namespace = namespace
-        self.is_a = set(is_a)
-        self.part_of = set(part_of)
-        self.has_part = set()
-        self.has_a = set()
+        self._is_a = set(is_a)
+        self._part_of = set(part_of)
+        self._has_part = set()
+        self._has_a = set()
         self.is_obsolete = is_obsolete
         self._depth = None
+        self._index = None
+        self._idx = None
+
+    @classmethod
+    def from_index(cls, index, i):
+        """Creates a view of term `i` of the :class:`GODagIndex` `index`."""
+        term = cls.__new__(cls)
+        term.id = index.ids[i]
+        term._name = None
+        term.namespace = index.namespace_of(i)
+        term._is_a = term._part_of = term._has_part = term._has_a = None
+        term.is_obsolete = bool(index.is_obsolete[i])
+        term._depth = None
+        term._index = index
+        term._idx = i
+        return term
+
+    def _related(self, attr, lookup, kind):
+        # Terms created from an index resolve their relationships from the
+        # CSR arrays of the index unless they have been assigned.
+        value = getattr(self, attr)
+        if value is None:
+            index = self._index
+            value = set(
+                index.term(j) for j in lookup(index, self._idx, kind).tolist()
+            )
+        return value
+
+    @property
+    def name(self):
+        if self._name is None and self._index is not None:
+            return self._index.name(self._idx)
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+
+    @property
+    def is_a(self):
+        return self._related('_is_a', GODagIndex.parents, IS_A)
+
+    @is_a.setter
+    def is_a(self, value):
+        self._is_a = value
+
+    @property
+    def part_of(self):
+        return self._related('_part_of', GODagIndex.parents, PART_OF)
+
+    @part_of.setter
+    def part_of(self, value):
+        self._part_of = value
+
+    @property
+    def has_a(self):
+        return self._related('_has_a', GODagIndex.children, IS_A)
+
+    @has_a.setter
+    def has_a(self, value):
+        self._has_a = value
+
+    @property
+    def has_part(self):
+        return self._related('_has_part', GODagIndex.children, PART_OF)
+
+    @has_part.setter
+    def has_part(self, value):
+        self._has_part = value
 
     def __str__(self):
         return str({
@@ -115,6 +714,8 @@ class GOTerm(object):
 
     def has_ancestor(self, a):
         """Returns True if a is an ancestor of this node."""
+        if self._index is not None and a._index is self._index:
+            return self._index.has_ancestor(self._idx, a._idx)
         return a in self.all_parents
 
     @property
@@ -125,12 +726,17 @@ class GOTerm(object):
     @property
     def all_parents(self):
         """Computes all acnestor nodes of this nodes."""
+        if self._index is not None:
+            index = self._index
+            return set(index.term(i) for i in index.ancestor_set(self._idx))
+
         all_parents = set()
         queue = list(self.parents)
         while queue:
             node = queue.pop()
-            all_parents.add(node)
-            queue += list(node.parents)
+            if node not in all_parents:
+                all_parents.add(node)
+                queue.extend(node.parents)
         return all_parents
 
     @property
@@ -138,6 +744,8 @@ class GOTerm(object):
         """Computes the depth as the longest path to the root node."""
         if self._depth is not None:
             return self._depth
+        elif self._index is not None:
+            return int(self._index.depth[self._idx])
         else:
             if not self.parents:
                 return 0
@@ -145,114 +753,265 @@ class GOTerm(object):
             return self._depth
 
 
-def process_go_term(fp):
-    """Parse obo entry into a :class:`GOTerm` instance."""
-    id_ = None
-    term = None
-    part_of = []
-    is_a = []
-    line = "[Term]"
-    is_obsolete = False
-    alt_ids = []
-
-    while line.strip() != "":
-        line = fp.readline().strip()
-        if line.startswith("id:"):
-            _, id_ = [x.strip() for x in line.split('id: ')]
+def parse_obo12_file(filename, namespaces=None):
+    """
+    Parses all Term objects into a dictionary of :class:`GOTerm`s. Each term
+    contains a small subset of the possible keys: id, name, namespace, is_a,
+    part_of and is_obsolete.
 
-        elif line.startswith("alt_id:"):
-            _, alt_id = [x.strip() for x in line.split('alt_id: ')]
-            alt_ids += [alt_id]
+    Parameters
+    ----------
+    filename : str
+        Path for obo file. Must be gzipped.
 
-        elif line.startswith("name:"):
-            _, name = [x.strip() for x in line.split('name: ')]
+    namespaces : iterable, optional, default: None
+        Only keep the terms of these namespaces, along with all of their
+        `is_a` and `part_of` ancestors, which may belong to other
+        namespaces. All terms are kept if None. Full namespace names are
+        expected, such as 'cellular_component'.
 
-        elif line.startswith("namespace:"):
-            _, namespace = [x.strip() for x in line.split('namespace: ')]
+    Returns
+    -------
+    `dict`
+        Mapping from accession to :class:`GOTerm`
 
-        elif line.startswith("is_a:"):
-            _, is_a_term = [x.strip() for x in line.split('is_a: ')]
-            is_a_term, _ = [x.strip() for x in is_a_term.split(' ! ')]
-            is_a.append(is_a_term)
+    Raises
+    ------
+    `ValueError`
+        If a namespace is neither a GO namespace nor used in the file.
+    """
+    entries = []
+    with gzip.open(filename, 'rb') as fp:
+        for entry in iter_obo_terms(fp, GO_TERM_FIELDS):
+            entries.append(entry)
+
+    if namespaces is not None:
+        namespaces = frozenset(namespaces)
+        known = set(GO_NAMESPACES.values()) | set(
+            e['namespace'] for e in entries)
+        unknown = namespaces - known
+        if unknown:
+            raise ValueError("Unknown GO namespaces {}. Expected any of "
+                             "{}.".format(sorted(unknown), sorted(known)))
+        entries = _restrict_to_namespaces(entries, namespaces)
+
+    # Encode the terms and parent references as integer ids. Terms are
+    # created from the index when they are first accessed.
+    positions = {e['id']: i for (i, e) in enumerate(entries)}
+    alt_ids = {}
+    indptr = [0]
+    indices = []
+    kinds = []
+    for i, entry in enumerate(entries):
+        for alt_tid in entry['alt_id']:
+            alt_ids[alt_tid] = i
+        edges = sorted(
+            [(positions[t_id], IS_A) for t_id in set(entry['is_a'])] +
+            [(positions[t_id], PART_OF) for t_id in set(entry['part_of'])]
+        )
+        indices.extend(p for (p, _) in edges)
+        kinds.extend(k for (_, k) in edges)
+        indptr.append(len(indices))
+
+    index = GODagIndex(
+        ids=[e['id'] for e in entries],
+        names=[e['name'] for e in entries],
+        namespaces=[e['namespace'] for e in entries],
+        is_obsolete=[e['is_obsolete'] for e in entries],
+        parent_indptr=indptr, parent_indices=indices,
+        parent_kinds=kinds, alt_ids=alt_ids
+    )
+    return GODag(index=index, namespaces=namespaces)
+
+
+def _restrict_to_namespaces(entries, namespaces):
+    """Filters parsed obo entries to those in `namespaces` and their
+    ancestors, keeping the file order."""
+    by_id = {e['id']: e for e in entries}
+    keep = set()
+    stack = [e['id'] for e in entries if e['namespace'] in namespaces]
+    while stack:
+        tid = stack.pop()
+        if tid in keep:
+            continue
+        keep.add(tid)
+        entry = by_id[tid]
+        stack.extend(entry['is_a'])
+        stack.extend(entry['part_of'])
+    return [e for e in entries if e['id'] in keep]
 
-        elif line.startswith("relationship: part_of"):
-            _, part_of_term = [
-                x.strip() for x in line.split('relationship: part_of ')
-            ]
-            part_of_term, _ = [x.strip() for x in part_of_term.split(' ! ')]
-            part_of.append(part_of_term)
 
-        elif line.startswith("is_obsolete"):
-            _, is_obsolete = [x.strip() for x in line.split('is_obsolete: ')]
-            is_obsolete = bool(is_obsolete)
+def parse_go_slim(filename):
+    """Parses the accessions of the non-obsolete terms in a GO slim obo
+    file, such as `goslim_generic.obo`.
 
-        else:
-            continue
+    Parameters
+    ----------
+    filename : str
+        Path for the obo file. Files ending in '.gz' are read as gzipped.
 
-    term = GOTerm(id_, name, namespace, is_a, part_of, is_obsolete)
-    return id_, alt_ids, term
+    Returns
+    -------
+    `list`
+        List of str GO accessions.
+    """
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as fp:
+        return [
+            entry['id'] for entry in iter_obo_terms(fp, ('id', 'is_obsolete'))
+            if not entry['is_obsolete']
+        ]
+
+
+def file_sha1(filename, blocksize=1 << 20):
+    """Returns the hex SHA-1 digest of the contents of `filename`."""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def snapshot_directory(filename, directory=None, namespaces=None):
+    """Returns the snapshot directory for the obo file `filename`. Snapshots
+    are keyed by the SHA-1 of the obo file so that a new GO release is
+    always compiled into a new snapshot, and by `namespaces` if the dag is
+    restricted to a subset of namespaces."""
+    if directory is None:
+        directory = go_snapshot_path
+    name = file_sha1(filename)
+    if namespaces is not None:
+        name = '{}-{}'.format(name, '+'.join(sorted(namespaces)) or 'none')
+    return os.path.join(directory, name)
+
+
+def save_go_snapshot(dag, path):
+    """Writes the :class:`GODagIndex` of `dag` to the directory `path` as
+    a set of `.npy` files which can be memory mapped by
+    :func:`load_go_snapshot`. The snapshot is written to a temporary
+    directory first and then moved into place, so readers never see a
+    partially written snapshot.
 
+    Parameters
+    ----------
+    dag : :class:`GODag`
+        A dag with an index, as returned by :func:`parse_obo12_file`.
 
-def parse_obo12_file(filename):
+    path : str
+        Directory to write the snapshot to.
     """
-    Parses all Term objects into a dictionary of :class:`GOTerm`s. Each term
-    contains a small subset of the possible keys: id, name, namespace, is_a,
-    part_of and is_obsolete.
+    if dag.index is None:
+        raise ValueError("Dag does not have an index to save.")
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    try:
+        for key in SNAPSHOT_ARRAYS:
+            np.save(
+                os.path.join(tmp_dir, '{}.npy'.format(key)),
+                np.asarray(dag.index.arrays[key])
+            )
+        with open(os.path.join(tmp_dir, 'meta.json'), 'wt') as fp:
+            json.dump({
+                'version': SNAPSHOT_VERSION,
+                'n_terms': len(dag.index),
+                'namespaces': (
+                    None if getattr(dag, 'namespaces', None) is None
+                    else sorted(dag.namespaces)
+                )
+            }, fp)
+        os.rename(tmp_dir, path)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+
+def load_go_snapshot(path, mmap_mode='r'):
+    """Loads a dag written by :func:`save_go_snapshot`. The index arrays
+    are memory mapped and :class:`GOTerm` instances are only created when
+    they are accessed.
 
     Parameters
     ----------
-    filename : str
-        Path for obo file.
+    path : str
+        Snapshot directory.
+
+    mmap_mode : str, optional, default: 'r'
+        Passed to :func:`np.load`. Use None to read the arrays into memory.
 
     Returns
     -------
-    `dict`
+    :class:`GODag`
         Mapping from accession to :class:`GOTerm`
     """
-    dag = GODag()
-    alt_id_map = {}
-    with gzip.open(filename, 'rt') as fp:
-        for line in fp:
-            line = line.strip()
-            if "format-version" in line:
-                _, version = [x.strip() for x in line.split(":")]
-                version = float(version)
-                if version != 1.2:
-                    raise ValueError("Parser only supports version 1.2.")
-            elif "[Term]" in line:
-                tid, alt, term = process_go_term(fp)
-                alt_id_map[tid] = alt
-                dag[tid] = term
-            else:
-                continue
-
-    # Turn the string ids into object references.
-    for _, item in dag.items():
-        is_a_term_ids = item.is_a
-        is_a_terms = []
-        part_of_term_ids = item.part_of
-        part_of_terms = []
+    with open(os.path.join(path, 'meta.json'), 'rt') as fp:
+        meta = json.load(fp)
+    if meta.get('version', None) != SNAPSHOT_VERSION:
+        raise ValueError(
+            "Snapshot version {} is not supported.".format(
+                meta.get('version', None))
+        )
+    arrays = {
+        key: np.load(
+            os.path.join(path, '{}.npy'.format(key)), mmap_mode=mmap_mode
+        )
+        for key in SNAPSHOT_ARRAYS
+    }
+    index = GODagIndex.from_arrays(arrays)
+    index.path = path
+    namespaces = meta.get('namespaces', None)
+    if namespaces is not None:
+        namespaces = frozenset(namespaces)
+    return GODag(index=index, namespaces=namespaces)
+
+
+def load_or_compile_snapshot(filename, directory=None, namespaces=None):
+    """Loads the snapshot of the obo file `filename`, compiling it first if
+    it does not exist. Failure to write the snapshot is logged and the
+    parsed dag is returned instead.
 
-        for t_id in is_a_term_ids:
-            is_a_terms.append(dag[t_id])
-            dag[t_id].has_a.add(item)
-
-        for t_id in part_of_term_ids:
-            part_of_terms.append(dag[t_id])
-            dag[t_id].has_part.add(item)
+    Parameters
+    ----------
+    filename : str
+        Path for the gzipped obo file.
 
-        item.is_a = set(is_a_terms)
-        item.part_of = set(part_of_terms)
+    directory : str, optional, default: None
+        Directory containing snapshots. Defaults to
+        `~/.pyppi/go_snapshots/`.
 
-    for tid, alts in alt_id_map.items():
-        term = dag[tid]
-        for alt_tid in alts:
-            dag[alt_tid] = term
+    namespaces : iterable, optional, default: None
+        Restrict the dag to these namespaces and their ancestors, see
+        :func:`parse_obo12_file`. Each restriction has its own snapshot.
 
+    Returns
+    -------
+    :class:`GODag`
+        Mapping from accession to :class:`GOTerm`
+    """
+    if namespaces is not None:
+        namespaces = frozenset(namespaces)
+    path = snapshot_directory(filename, directory, namespaces)
+    if os.path.isdir(path):
+        try:
+            return load_go_snapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Could not load GO snapshot '{}': {}".format(path, e))
+
+    dag = parse_obo12_file(filename, namespaces)
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        save_go_snapshot(dag, path)
+        dag.index.path = path
+    except OSError as e:
+        logger.warning("Could not save GO snapshot '{}': {}".format(path, e))
     return dag
 
 
-def group_terms_by_ontology_type(term_ids, max_count=None):
+def group_terms_by_ontology_type(term_ids, max_count=None, dag=None):
     """Groups GO terms by their ontology type.
 
     Parameters:
@@ -264,37 +1023,48 @@ def group_terms_by_ontology_type(term_ids, max_count=None):
         Caps the duplicate count of terms in each ontology to `max_count`. 
         Ignored if None.
 
+    dag : dict, optional, default: None
+        Dag dictionary containing :class:`GOTerm` instances. If None,
+        loads the default dag located at `~/.pyppi/go.obo.gz`
+
     Returns
     -------
     `dict`
         Dictionary of each ontology type and their terms as values.
     """
+    if dag is None:
+        dag = get_active_instance()
 
-    dag = get_active_instance()
-    cc_terms = []
-    bp_terms = []
-    mf_terms = []
-
+    groups = {
+        "biological_process": [],
+        "cellular_component": [],
+        "molecular_function": []
+    }
+    index = getattr(dag, 'index', None)
+    if index is not None:
+        # Resolve namespaces from the index arrays without creating terms.
+        term_index = index.term_index
+        namespaces = index.namespace_list()
+        namespace_of = lambda t: namespaces[term_index[t]]
+    else:
+        namespace_of = lambda t: dag[t].namespace
+
+    counts = Counter()
     for t in term_ids:
-        if dag[t].namespace == "biological_process":
-            if max_count is not None and bp_terms.count(t) >= max_count:
-                continue
-            else:
-                bp_terms.append(t)
-        elif dag[t].namespace == "cellular_component":
-            if max_count is not None and cc_terms.count(t) >= max_count:
-                continue
-            else:
-                cc_terms.append(t)
-        elif dag[t].namespace == "molecular_function":
-            if max_count is not None and mf_terms.count(t) >= max_count:
-                continue
-            else:
-                mf_terms.append(t)
-        else:
+        namespace = namespace_of(t)
+        if namespace not in groups:
             raise ValueError("Term %s doesn't belong to any ontology." % t)
+        if max_count is not None:
+            if counts[t] >= max_count:
+                continue
+            counts[t] += 1
+        groups[namespace].append(t)
 
-    return {'mf': mf_terms, 'bp': bp_terms, 'cc': cc_terms}
+    return {
+        'mf': groups["molecular_function"],
+        'bp': groups["biological_process"],
+        'cc': groups["cellular_component"]
+    }
 
 
 def filter_obsolete_terms(term_ids, dag=None):
@@ -318,6 +1088,116 @@ def filter_obsolete_terms(term_ids, dag=None):
         dag = get_active_instance()
     return [tid for tid in term_ids if dag[tid].is_obsolete is False]
 
+
+def _get_index(dag):
+    index = getattr(dag, 'index', None)
+    if index is None:
+        index = GODagIndex.from_dag(dag)
+    return index
+
+
+def _parent_edges(index, i):
+    start, end = index.parent_indptr[i], index.parent_indptr[i + 1]
+    return set(zip(
+        (index.ids[p] for p in index.parent_indices[start:end].tolist()),
+        index.parent_kinds[start:end].tolist()
+    ))
+
+
+def diff_go_dags(old, new):
+    """Compares two releases of the GO dag.
+
+    Parameters
+    ----------
+    old : dict
+        Dag dictionary of the previous release.
+
+    new : dict
+        Dag dictionary of the new release.
+
+    Returns
+    -------
+    `dict`
+        Dictionary with the keys `added`, `removed`, `obsoleted` and
+        `reparented`, each a `set` of accessions. Removed terms include
+        terms merged into another term as an alternate accession.
+        Reparented terms are those whose `is_a` or `part_of` parents
+        changed.
+    """
+    old_index = _get_index(old)
+    new_index = _get_index(new)
+    old_ids = set(old_index.ids)
+    new_ids = set(new_index.ids)
+
+    removed = set()
+    obsoleted = set()
+    reparented = set()
+    for tid in old_ids:
+        j = new_index.term_index.get(tid, None)
+        if j is None or new_index.ids[j] != tid:
+            removed.add(tid)
+            continue
+        i = old_index.term_index[tid]
+        if new_index.is_obsolete[j] and not old_index.is_obsolete[i]:
+            obsoleted.add(tid)
+        if _parent_edges(old_index, i) != _parent_edges(new_index, j):
+            reparented.add(tid)
+
+    added = set(
+        tid for tid in new_ids if tid not in old_index.term_index
+    )
+    return {
+        'added': added,
+        'removed': removed,
+        'obsoleted': obsoleted,
+        'reparented': reparented
+    }
+
+
+def get_affected_terms(old, new, diff=None):
+    """Computes the accessions whose ULCA induction can differ between two
+    releases of the GO dag. These are the removed, obsoleted and
+    reparented terms and their descendants in either release, along with
+    all alternate accessions of these terms.
+
+    Parameters
+    ----------
+    old : dict
+        Dag dictionary of the previous release.
+
+    new : dict
+        Dag dictionary of the new release.
+
+    diff : dict, optional, default: None
+        The output of :func:`diff_go_dags`. Computed if None.
+
+    Returns
+    -------
+    `set`
+        Set of accessions.
+    """
+    if diff is None:
+        diff = diff_go_dags(old, new)
+    changed = diff['removed'] | diff['obsoleted'] | diff['reparented']
+
+    affected = set(changed)
+    for index in (_get_index(old), _get_index(new)):
+        # Only follow accessions that are primary terms in this release.
+        indices = [
+            index.term_index[tid] for tid in changed
+            if tid in index.term_index and
+            index.ids[index.term_index[tid]] == tid
+        ]
+        if not indices:
+            continue
+        rows = set(indices) | set(index.descendants(indices).tolist())
+        affected |= set(index.ids[i] for i in rows)
+        affected |= set(
+            tid for (tid, i) in index.term_index.items() if i in rows
+        )
+    return affected
+
+
 # ------------------------------------------------------ #
 #
 #                  ULCA Inducer
@@ -325,6 +1205,114 @@ def filter_obsolete_terms(term_ids, dag=None):
 # ------------------------------------------------------ #
 
 
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class ULCACache(object):
+    """Bounded least-recently-used cache for the ULCA inducer. Stores the
+    ancestor union of each protein's annotation set, keyed by the frozen
+    set of integer term ids, and the LCAs of each pair of annotation sets,
+    keyed by the unordered pair of sets. Proteins with identical
+    annotations therefore share entries.
+
+    The cache is bound to a single :class:`GODagIndex` and is cleared when
+    it is used with, or bound to, a different index.
+
+    Parameters
+    ----------
+    maxsize : int or None, optional, default: 100000
+        Maximum number of entries kept for each of the ancestor union and
+        LCA tables. Use None for an unbounded cache and 0 to disable it.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from the cache.
+
+    misses : int
+        Number of lookups that had to be computed.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.index = None
+        self.clear()
+
+    def __len__(self):
+        return len(self._unions) + len(self._lcas)
+
+    def clear(self):
+        """Removes all entries and resets the hit and miss counters."""
+        self._unions = OrderedDict()
+        self._lcas = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, index):
+        """Binds the cache to `index`, clearing it if `index` is not the
+        currently bound index."""
+        if index is not self.index:
+            self.clear()
+            self.index = index
+
+    def resize(self, maxsize):
+        """Sets `maxsize`, evicting the least recently used entries if the
+        cache is now too large."""
+        self.maxsize = maxsize
+        if maxsize is not None:
+            for table in (self._unions, self._lcas):
+                while len(table) > maxsize:
+                    table.popitem(last=False)
+
+    def cache_info(self):
+        """Returns a `CacheInfo` tuple of hits, misses, maxsize and the
+        current number of entries."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self))
+
+    def _lookup(self, table, key, compute):
+        try:
+            value = table[key]
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            if self.maxsize != 0:
+                table[key] = value
+                if self.maxsize is not None and len(table) > self.maxsize:
+                    table.popitem(last=False)
+            return value
+        self.hits += 1
+        table.move_to_end(key)
+        return value
+
+    def ancestor_union(self, terms):
+        """Returns the union of the ancestors of each term id in the
+        `frozenset` `terms` as a `frozenset`."""
+        index = self.index
+        return self._lookup(
+            self._unions, terms,
+            lambda: frozenset().union(*[index.ancestor_set(i) for i in terms])
+        )
+
+    def lowest_common_ancestors(self, terms_1, terms_2):
+        """Returns the sorted LCA ids of the union of the `frozenset`s
+        `terms_1` and `terms_2` as a tuple, or None if the terms share no
+        ancestors."""
+        def compute():
+            lcas = self.index.lowest_common_ancestors(list(terms_1 | terms_2))
+            return None if lcas is None else tuple(lcas)
+        return self._lookup(
+            self._lcas, frozenset((terms_1, terms_2)), compute
+        )
+
+
+__ULCA_CACHE__ = ULCACache()
+
+
+def get_ulca_cache():
+    """Returns the global :class:`ULCACache` used by :func:`get_up_to_lca`."""
+    return __ULCA_CACHE__
+
+
 def get_lca_of_terms(terms, dag=None):
     """Computes the `lowest common ancestors` (LCAs) of a list of terms.
 
@@ -348,6 +1336,13 @@ def get_lca_of_terms(terms, dag=None):
     if not terms:
         return None
 
+    index = terms[0]._index
+    if index is not None and all(t._index is index for t in terms):
+        lcas = index.lowest_common_ancestors([t._idx for t in terms])
+        if lcas is None:
+            return None
+        return [index.term(i) for i in lcas]
+
     parents = [t.all_parents for t in terms]
     common_parents = reduce(lambda x, y: x & y, parents)
     if not common_parents:
@@ -384,6 +1379,10 @@ def get_up_to_lca(p1, p2, dag=None):
 
     p1 = [dag[t] for t in p1]
     p2 = [dag[t] for t in p2]
+    index = getattr(dag, 'index', None)
+    if index is not None:
+        return _get_up_to_lca_indexed(p1, p2, index)
+
     lcas = get_lca_of_terms([t for ts in [p1, p2] for t in ts])
     if lcas is None:
         return [t.id for t in p1 + p2]
@@ -403,3 +1402,191 @@ def get_up_to_lca(p1, p2, dag=None):
     induced_terms += p1
     induced_terms += p2
     return [t.id for t in induced_terms]
+
+
+def _get_up_to_lca_indexed(p1, p2, index):
+    """Index backed implementation of :func:`get_up_to_lca` taking lists of
+    :class:`GOTerm` instances."""
+    cache = get_ulca_cache()
+    cache.bind(index)
+    s1 = frozenset(t._idx for t in p1)
+    s2 = frozenset(t._idx for t in p2)
+    lcas = cache.lowest_common_ancestors(s1, s2)
+    if lcas is None:
+        return [t.id for t in p1 + p2]
+
+    lca_set = frozenset(lcas)
+    induced = []
+    for term_set in [s1, s2]:
+        induced += sorted(
+            i for i in cache.ancestor_union(term_set)
+            if lca_set <= index.ancestor_set(i)
+        )
+
+    ids = index.ids
+    induced_terms = [ids[i] for i in induced]
+    induced_terms += [ids[i] for i in lcas] * 2
+    induced_terms += [t.id for t in p1]
+    induced_terms += [t.id for t in p2]
+    return induced_terms
+
+
+def get_up_to_lca_many(pairs, dag=None, batch_size=10000):
+    """Computes :func:`get_up_to_lca` for many pairs of annotation lists at
+    once. Pairs are processed in batches using sparse matrix operations
+    over the ancestor closure of the dag's :class:`GODagIndex`.
+
+    Parameters
+    ----------
+    pairs : iterable
+        Iterable of tuples `(p1, p2)` where `p1` and `p2` are lists of term
+        accessions from the first and second protein.
+
+    dag : dict, optional, default: None
+        Dag dictionary containing :class:`GOTerm` instances. If None,
+        loads the default dag located at `~/.pyppi/go.obo.gz`
+
+    batch_size : int, optional, default: 10000
+        Number of pairs processed together.
+
+    Returns
+    -------
+    list
+        List containing the output of :func:`get_up_to_lca` for each pair.
+    """
+    if dag is None:
+        dag = get_active_instance()
+
+    pairs = list(pairs)
+    index = getattr(dag, 'index', None)
+    if index is None:
+        return [get_up_to_lca(p1, p2, dag) for (p1, p2) in pairs]
+
+    results = []
+    for start in range(0, len(pairs), batch_size):
+        results.extend(
+            _get_up_to_lca_batch(pairs[start:start + batch_size], index)
+        )
+    return results
+
+
+def _indicator_matrix(rows, n_columns):
+    """Creates a binary sparse matrix with a row for each list of column
+    indices in `rows`."""
+    lengths = [len(r) for r in rows]
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+    indices = np.fromiter(
+        (i for r in rows for i in r), dtype=np.int32, count=indptr[-1]
+    )
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), indices, indptr),
+        shape=(len(rows), n_columns)
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def _concatenated_ranges(starts, lengths):
+    """Returns the concatenation of `range(s, s + l)` for each start and
+    length."""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + \
+        np.arange(ends[-1] if len(ends) else 0)
+
+
+def _get_up_to_lca_batch(pairs, index):
+    """Sparse matrix implementation of :func:`get_up_to_lca_many` for a
+    single batch of pairs."""
+    term_index = index.term_index
+    ids = index.ids
+    n = len(index)
+
+    results = [None] * len(pairs)
+    positions = []
+    side_1 = []
+    side_2 = []
+    for k, (p1, p2) in enumerate(pairs):
+        if not p1 or not p2:
+            results[k] = p1 + p2
+        else:
+            positions.append(k)
+            side_1.append([term_index[t] for t in p1])
+            side_2.append([term_index[t] for t in p2])
+    if not positions:
+        return results
+
+    m = len(positions)
+    rows = np.arange(m)
+    closure = index.ancestor_matrix()
+    s1 = _indicator_matrix(side_1, n)
+    s2 = _indicator_matrix(side_2, n)
+    s_all = s1 + s2
+    s_all.data[:] = 1
+
+    # Common ancestors are the ancestors counted once for every unique term
+    # of the pair. The LCAs are the common ancestors of maximum depth.
+    counts = (s_all @ closure).tocsr()
+    c_rows = np.repeat(rows, np.diff(counts.indptr))
+    is_common = counts.data == s_all.getnnz(axis=1)[c_rows]
+    c_rows = c_rows[is_common]
+    common = counts.indices[is_common]
+    depth = index.depth[common]
+    max_depth = np.full(m, -1, dtype=depth.dtype)
+    np.maximum.at(max_depth, c_rows, depth)
+    is_lca = depth == max_depth[c_rows]
+    l_rows = c_rows[is_lca]
+    lcas = common[is_lca]
+    order = np.lexsort((lcas, l_rows))
+    l_rows = l_rows[order]
+    lcas = lcas[order]
+    n_lcas = np.bincount(l_rows, minlength=m)
+    lca_starts = np.cumsum(n_lcas) - n_lcas
+
+    # Keep the ancestors of each side which have every LCA of the pair as
+    # an ancestor.
+    keys = index.ancestor_keys()
+    is_batch_lca = np.zeros(n, dtype=bool)
+    is_batch_lca[lcas] = True
+    keys = keys[is_batch_lca[index.ancestor_indices]]
+    induced = []
+    for side in (s1, s2):
+        union = (side @ closure).tocsr()
+        union.sort_indices()
+        u_rows = np.repeat(rows, np.diff(union.indptr))
+        u_terms = union.indices
+        # Only terms deeper than the LCAs can have them as ancestors.
+        deeper = index.depth[u_terms] > max_depth[u_rows]
+        u_rows = u_rows[deeper]
+        u_terms = u_terms[deeper]
+        lengths = n_lcas[u_rows]
+        if lengths.sum():
+            entry = np.repeat(np.arange(len(u_terms)), lengths)
+            query = u_terms[entry].astype(np.int64) * n + \
+                lcas[_concatenated_ranges(lca_starts[u_rows], lengths)]
+            found = np.searchsorted(keys, query)
+            found[found == len(keys)] = 0
+            hits = np.bincount(
+                entry, weights=keys[found] == query, minlength=len(u_terms)
+            )
+        else:
+            hits = np.zeros(len(u_terms))
+        keep = (hits == lengths) & (lengths > 0)
+        induced.append(np.split(
+            u_terms[keep], np.cumsum(np.bincount(u_rows[keep], minlength=m))
+        ))
+
+    lcas = np.split(lcas, np.cumsum(n_lcas))
+    for j, k in enumerate(positions):
+        given = [ids[i] for i in side_1[j]] + [ids[i] for i in side_2[j]]
+        if not n_lcas[j]:
+            results[k] = given
+            continue
+        results[k] = (
+            [ids[i] for i in induced[0][j].tolist()] +
+            [ids[i] for i in induced[1][j].tolist()] +
+            [ids[i] for i in lcas[j].tolist()] * 2 +
+            given
+        )
+    return results
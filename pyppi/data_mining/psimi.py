@@ -7,6 +7,7 @@ This module contains functions to parse MI obo files into a dictionary of
 import gzip
 
 from ..base.file_paths import psimi_obo_file
+from .obo import iter_obo_terms
 
 __PSIMI_GRAPH__ = None
 
@@ -25,6 +26,7 @@ def get_active_instance(**kwargs):
 #
 # ------------------------------------------------------ #
 MiOntology = dict
+MI_TERM_FIELDS = ('id', 'alt_id', 'name', 'is_obsolete')
 
 
 class Term(object):
@@ -49,37 +51,6 @@ class Term(object):
         self.is_obsolete = is_obsolete
 
 
-def process_term(fp):
-    """Parse obo entry into a :class:`Term` instance."""
-    id_ = None
-    term = None
-    line = "[Term]"
-    is_obsolete = False
-    alt_ids = []
-
-    while line.strip() != "":
-        line = fp.readline().strip()
-        if line.startswith("id:"):
-            _, id_ = [x.strip() for x in line.split('id: ')]
-
-        elif line.startswith("alt_id:"):
-            _, alt_id = [x.strip() for x in line.split('alt_id: ')]
-            alt_ids += [alt_id]
-
-        elif line.startswith("name:"):
-            _, name = [x.strip() for x in line.split('name: ')]
-
-        elif line.startswith("is_obsolete"):
-            _, is_obsolete = [x.strip() for x in line.split('is_obsolete: ')]
-            is_obsolete = bool(is_obsolete)
-
-        else:
-            continue
-
-    term = Term(id_, name, is_obsolete)
-    return id_, alt_ids, term
-
-
 def parse_miobo_file(filename):
     """
     Parses all Term objects into a dictionary of :class:`Term`s. Each term
@@ -98,22 +69,12 @@ def parse_miobo_file(filename):
     """
     graph = MiOntology()
     alt_id_map = {}
-    with gzip.open(filename, 'rt') as fp:
-        for line in fp:
-            line = line.strip()
-            if "format-version" in line:
-                _, version = [x.strip() for x in line.split(":")]
-                version = float(version)
-                if version != 1.2:
-                    raise ValueError("Parser only supports version 1.2.")
-            elif "[Term]" in line:
-                tid, alt, term = process_term(fp)
-                alt_id_map[tid] = alt
-                graph[tid] = term
-            else:
-                continue
-
-    # Turn the string ids into object references.
+    with gzip.open(filename, 'rb') as fp:
+        for entry in iter_obo_terms(fp, MI_TERM_FIELDS):
+            term = Term(entry['id'], entry['name'], entry['is_obsolete'])
+            alt_id_map[term.id] = entry['alt_id']
+            graph[term.id] = term
+
     for tid, alts in alt_id_map.items():
         term = graph[tid]
         for alt_tid in alts:
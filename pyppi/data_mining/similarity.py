@@ -0,0 +1,346 @@
+"""
+This module contains functions to compute the information content of GO
+terms from annotation frequencies and vectorised semantic similarity
+features (Resnik, Lin and best-match average) between the GO annotations
+of two proteins.
+"""
+
+import os
+import logging
+import numpy as np
+from scipy import sparse
+
+from .ontology import get_active_instance
+
+__all__ = [
+    'SIMILARITY_NAMESPACES',
+    'SIMILARITY_MEASURES',
+    'similarity_feature_names',
+    'count_annotations',
+    'information_content',
+    'information_content_path',
+    'save_information_content',
+    'load_information_content',
+    'term_pair_similarity',
+    'compute_similarity_features_many'
+]
+
+logger = logging.getLogger("pyppi")
+
+SIMILARITY_NAMESPACES = ('go_mf', 'go_bp', 'go_cc')
+SIMILARITY_MEASURES = ('resnik', 'lin', 'bma')
+IC_FILENAME = 'information_content.npy'
+
+
+def similarity_feature_names(namespaces=SIMILARITY_NAMESPACES):
+    """Returns the column names of the matrix returned by
+    :func:`compute_similarity_features_many`, for example `go_mf_resnik`."""
+    return [
+        '{}_{}'.format(namespace, measure)
+        for namespace in namespaces for measure in SIMILARITY_MEASURES
+    ]
+
+
+def _split_terms(value):
+    if not value:
+        return []
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _term_ids(terms, index):
+    """Maps accessions to the integer ids of their primary terms, ignoring
+    accessions missing from `index`."""
+    ids = [index.term_index.get(t, None) for t in terms]
+    return sorted(set(i for i in ids if i is not None))
+
+
+def count_annotations(annotations, dag=None):
+    """Counts how many times each GO term is directly used as an annotation.
+    Alternate accessions are counted towards their primary term and
+    duplicate annotations within a single entry are counted once.
+
+    Parameters
+    ----------
+    annotations : iterable
+        Iterable of comma delimited strings or lists of GO accessions, one
+        per annotated entry, for example the `go_mf`, `go_bp` and `go_cc`
+        columns of each :class:`..database.models.Protein`.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used.
+
+    Returns
+    -------
+    :class:`np.ndarray`
+        Array of counts aligned with the integer ids of the dag index.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    index = dag.index
+
+    counts = np.zeros(len(index), dtype=np.float64)
+    for terms in annotations:
+        if isinstance(terms, str) or terms is None:
+            terms = _split_terms(terms)
+        ids = _term_ids(terms, index)
+        if ids:
+            counts[ids] += 1
+    return counts
+
+
+def information_content(counts, dag=None):
+    """Computes the information content `-log(p(t))` of every GO term,
+    where `p(t)` is the frequency of annotations to `t` or any of its
+    descendants relative to the most frequent term of the same namespace.
+    Counts are propagated with a single product against the ancestor
+    closure of the dag index. Terms without annotations have an
+    information content of 0.
+
+    Parameters
+    ----------
+    counts : array-like
+        Direct annotation counts as returned by :func:`count_annotations`.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used.
+
+    Returns
+    -------
+    :class:`np.ndarray`
+        Array of information content aligned with the integer ids of the
+        dag index.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    index = dag.index
+
+    counts = np.asarray(counts, dtype=np.float64)
+    if counts.shape != (len(index),):
+        raise ValueError(
+            "Expected {} counts, found {}.".format(len(index), counts.shape)
+        )
+
+    frequency = counts + index.ancestor_matrix().T.dot(counts)
+    totals = np.zeros(len(index.namespace_names), dtype=np.float64)
+    np.maximum.at(totals, index.namespace, frequency)
+    totals = totals[index.namespace]
+
+    ic = np.zeros(len(index), dtype=np.float64)
+    annotated = frequency > 0
+    ic[annotated] = -np.log(frequency[annotated] / totals[annotated])
+    return ic
+
+
+def information_content_path(dag=None):
+    """Returns the path of the information content array stored next to the
+    GO snapshot backing `dag`, or None if the dag was not loaded from a
+    snapshot."""
+    if dag is None:
+        dag = get_active_instance()
+    if dag.index is None or dag.index.path is None:
+        return None
+    return os.path.join(dag.index.path, IC_FILENAME)
+
+
+def save_information_content(ic, dag=None, path=None):
+    """Saves the information content array `ic` to `path`, or next to the
+    GO snapshot of `dag` if `path` is None.
+
+    Returns
+    -------
+    str or None
+        The path written to, or None if there was no snapshot to save
+        next to.
+    """
+    path = path or information_content_path(dag)
+    if path is None:
+        return None
+    tmp_path = '{}.tmp.npy'.format(path)
+    np.save(tmp_path, np.asarray(ic, dtype=np.float64))
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_information_content(dag=None, path=None):
+    """Loads the information content array saved by
+    :func:`save_information_content`.
+
+    Returns
+    -------
+    :class:`np.ndarray` or None
+        The information content array, or None if no array has been saved
+        or it does not match the size of the dag index.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    path = path or information_content_path(dag)
+    if path is None or not os.path.isfile(path):
+        return None
+
+    ic = np.load(path)
+    if ic.shape != (len(dag.index),):
+        logger.warning(
+            "Ignoring information content '{}' of shape {}.".format(
+                path, ic.shape)
+        )
+        return None
+    return ic
+
+
+def term_pair_similarity(a, b, ic, dag=None, batch_size=100000):
+    """Computes the Resnik and Lin similarity of each pair of terms
+    `(a[k], b[k])`. The Resnik similarity is the information content of
+    the most informative common ancestor, where each term is considered an
+    ancestor of itself, and the Lin similarity normalises this by the
+    information content of both terms.
+
+    Parameters
+    ----------
+    a : array-like
+        Integer ids of the first term in each pair.
+
+    b : array-like
+        Integer ids of the second term in each pair.
+
+    ic : array-like
+        Information content as returned by :func:`information_content`.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used.
+
+    batch_size : int, optional, default: 100000
+        Number of term pairs to compute with each sparse product.
+
+    Returns
+    -------
+    `tuple`
+        Arrays of the Resnik and Lin similarity of each pair.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    ic = np.asarray(ic, dtype=np.float64)
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    closure = dag.index.ancestor_matrix(reflexive=True)
+
+    resnik = np.zeros(len(a), dtype=np.float64)
+    for start in range(0, len(a), batch_size):
+        end = start + batch_size
+        common = closure[a[start:end]].multiply(closure[b[start:end]])
+        common = sparse.csr_matrix(common)
+        common.data = ic[common.indices] * common.data
+        resnik[start:end] = common.max(axis=1).toarray().ravel()
+
+    denominator = ic[a] + ic[b]
+    lin = np.zeros(len(a), dtype=np.float64)
+    nonzero = denominator > 0
+    lin[nonzero] = 2 * resnik[nonzero] / denominator[nonzero]
+    return resnik, lin
+
+
+def _flatten(groups):
+    lengths = np.asarray([len(g) for g in groups], dtype=np.int64)
+    indptr = np.zeros(len(groups) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+    flat = np.asarray([t for g in groups for t in g], dtype=np.int64)
+    return flat, indptr, lengths
+
+
+def _set_similarity(sources, targets, ic, dag):
+    """Computes the maximum Resnik, maximum Lin and best-match average Lin
+    similarity between each pair of term id groups `sources[k]` and
+    `targets[k]`. Every term pair is expanded with array arithmetic and
+    only the distinct term pairs are passed to :func:`term_pair_similarity`.
+    """
+    n_groups = len(sources)
+    a_flat, a_ptr, la = _flatten(sources)
+    b_flat, b_ptr, lb = _flatten(targets)
+    result = np.zeros((n_groups, len(SIMILARITY_MEASURES)), dtype=np.float64)
+
+    sizes = la * lb
+    total = int(sizes.sum())
+    if total == 0:
+        return result
+
+    group = np.repeat(np.arange(n_groups, dtype=np.int64), sizes)
+    offsets = np.zeros(n_groups, dtype=np.int64)
+    offsets[1:] = np.cumsum(sizes)[:-1]
+    position = np.arange(total, dtype=np.int64) - offsets[group]
+    rows = a_ptr[group] + position // lb[group]
+    cols = b_ptr[group] + position % lb[group]
+
+    n = len(dag.index)
+    keys, inverse = np.unique(a_flat[rows] * n + b_flat[cols],
+                              return_inverse=True)
+    resnik, lin = term_pair_similarity(keys // n, keys % n, ic, dag)
+    resnik, lin = resnik[inverse], lin[inverse]
+
+    np.maximum.at(result[:, 0], group, resnik)
+    np.maximum.at(result[:, 1], group, lin)
+
+    best_a = np.zeros(len(a_flat), dtype=np.float64)
+    best_b = np.zeros(len(b_flat), dtype=np.float64)
+    np.maximum.at(best_a, rows, lin)
+    np.maximum.at(best_b, cols, lin)
+    sum_a = np.bincount(
+        np.repeat(np.arange(n_groups), la), best_a, minlength=n_groups)
+    sum_b = np.bincount(
+        np.repeat(np.arange(n_groups), lb), best_b, minlength=n_groups)
+    both = sizes > 0
+    result[both, 2] = (sum_a[both] / la[both] + sum_b[both] / lb[both]) / 2
+    return result
+
+
+def compute_similarity_features_many(pairs, ic, dag=None,
+                                     namespaces=SIMILARITY_NAMESPACES):
+    """Computes the GO semantic similarity features between the source and
+    target proteins of many interactions. For each namespace three values
+    are computed: the maximum Resnik similarity and maximum Lin similarity
+    over all pairs of source and target annotations, and the best-match
+    average of the Lin similarity. Annotations missing from `dag` are
+    ignored and a namespace without annotations on either side has a
+    similarity of 0.
+
+    Parameters:
+    ----------
+    pairs : list
+        List of `(source, target)` tuples of
+        :class:`..database.models.Protein` instances.
+
+    ic : array-like
+        Information content as returned by :func:`information_content`.
+
+    dag : :class:`.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be used.
+
+    namespaces : tuple, optional
+        The GO annotation attributes to compare.
+
+    Returns
+    -------
+    :class:`np.ndarray`
+        Array of shape `(len(pairs), 3 * len(namespaces))` with columns
+        named as in :func:`similarity_feature_names`. Rows of pairs where
+        either protein is `None` are all 0.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    index = dag.index
+
+    sources = []
+    targets = []
+    for (source, target) in pairs:
+        for attr in namespaces:
+            if source is None or target is None:
+                sources.append([])
+                targets.append([])
+            else:
+                sources.append(
+                    _term_ids(_split_terms(getattr(source, attr)), index))
+                targets.append(
+                    _term_ids(_split_terms(getattr(target, attr)), index))
+
+    result = _set_similarity(sources, targets, ic, dag)
+    return result.reshape(
+        (len(pairs), len(namespaces) * len(SIMILARITY_MEASURES))
+    )
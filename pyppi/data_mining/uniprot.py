@@ -4,19 +4,26 @@ http://biopython.org/DIST/docs/api/Bio.SwissProt.Record-class.html for more
 information about how biopython stores records.
 """
 
+import io
+import os
+import gzip
 import time
 import logging
 import pandas as pd
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from Bio import SwissProt
 from Bio import ExPASy
 from bioservices import UniProt as UniProtMapper
 from urllib.error import HTTPError
 from enum import Enum
-from joblib import delayed, Parallel
+from joblib import delayed, Parallel, effective_n_jobs
 
 from ..base.utilities import chunk_list
+from .async_download import async_download
 from ..base.io import uniprot_sprot, uniprot_trembl
+from ..base.io import load_uniprot_map_cache, append_uniprot_map_cache
 from ..database.models import Protein
 from ..database.validators import (
     validate_go_annotations,
@@ -32,6 +39,14 @@ http_error_msg = "Unrecoverable HTTPError downloading record for {}."
 
 ERRORS_TO_RETRY = ('503', '504', '408')
 
+# Seconds waited before the first retry of an asyncio download.
+ASYNC_BACKOFF = 0.5
+
+# Seconds a cached result of the UniProt mapping service is used for, and
+# a cached failure to map an accession.
+MAP_CACHE_TTL = 30 * 24 * 60 * 60
+MAP_CACHE_NEGATIVE_TTL = 24 * 60 * 60
+
 
 # --------------------------------------------------------------------------- #
 #
@@ -163,7 +178,7 @@ def download_records(accessions, verbose=False, wait=5,
 
 def parallel_download(accessions, backend="multiprocessing",
                       verbose=False, n_jobs=1, wait=5,
-                      retries=3, taxon_id=9606):
+                      retries=3, taxon_id=9606, batch_size=None):
     """Parallel download records for UniProt accessions via the UniProt API. 
 
     The call will retry upon timeout up to the number specified by `retries`.
@@ -177,7 +192,9 @@ def parallel_download(accessions, backend="multiprocessing",
         If True, log informational and warning messages to the console.
 
     wait : int, optional
-        Seconds to wait before retrying download.
+        Seconds to wait before retrying download. With the 'asyncio'
+        backend, the longest wait between retries, starting from
+        `ASYNC_BACKOFF` seconds.
 
     retries : int, optional
         Number of times to retry the download if the server returns
@@ -189,13 +206,28 @@ def parallel_download(accessions, backend="multiprocessing",
 
     backend : str
         A supported `Joblib` backend. Can be either 'multiprocessing' or 
-        'threading'.
+        'threading'. Use 'asyncio' to download with
+        :func:`.async_download.async_download` instead, making up to
+        `n_jobs` concurrent requests over a shared connection pool.
+
+    batch_size : int, optional, default: None
+        If set, records are requested in groups of `batch_size` accessions
+        per request with the 'asyncio' backend, and accessions missing from
+        a group's response are then requested one at a time.
 
     Returns
     -------
     `list`
         A list of :class:`Bio.SwissProt.Record` record instances.
     """
+    if backend == 'asyncio' or batch_size:
+        return async_download(
+            accessions, max_concurrency=effective_n_jobs(n_jobs),
+            retries=retries, backoff=min(wait, ASYNC_BACKOFF),
+            max_backoff=wait, taxon_id=taxon_id, batch_size=batch_size,
+            verbose=verbose
+        )
+
     # Warning: Setting backend to multiprocessing may cause strange errors.
     # This is most likely due to this function not being run in a
     # protected main loop.
@@ -281,6 +313,234 @@ def parse_record_into_protein(record, verbose=False):
             logger.exception("An error occured when trying to parse record.")
         raise
 
+# --------------------------------------------------------------------------- #
+#
+#                    Streaming UniProt dat Parsing
+#
+# --------------------------------------------------------------------------- #
+
+# The fields of each record parsed by `iter_dat_records`, in the order of
+# the columns of each batch yielded by `iter_dat_batches`. These are the
+# keyword arguments returned by `serialise_record`.
+DAT_COLUMNS = (
+    'uniprot_id', 'taxon_id', 'reviewed', 'gene_id', 'go_mf', 'go_bp',
+    'go_cc', 'interpro', 'pfam', 'keywords', 'function', 'last_update',
+    'last_release'
+)
+GO_ASPECTS = {'F': 'go_mf', 'P': 'go_bp', 'C': 'go_cc'}
+DAT_XREFS = {'Pfam': 'pfam', 'InterPro': 'interpro'}
+
+# Line codes read by `iter_dat_records`, every other line is skipped.
+DAT_LINE_CODES = frozenset(['ID', 'AC', 'DT', 'GN', 'OX', 'DR', 'KW', 'CC',
+                            '//'])
+
+
+def open_dat(file_path):
+    """Opens a UniProt `.dat` file for reading as text, decompressing it
+    with gzip if the path ends in `.gz`."""
+    if os.path.splitext(file_path)[-1] == '.gz':
+        # Buffered so lines are split by the text layer instead of being
+        # read one at a time from the gzip stream.
+        return io.TextIOWrapper(io.BufferedReader(
+            gzip.open(file_path, 'rb'), buffer_size=1 << 20))
+    return open(file_path, 'rt')
+
+
+def _dat_gene_name(value):
+    # Same rule as `gene_name` applied to the first GN line.
+    data = value.split(';')[0].split('=')[-1].split(' ')[0]
+    return data or None
+
+
+def _dat_taxon_id(value):
+    # 'NCBI_TaxID=9606 {ECO:0000313|EMBL:AEX14553.1};'
+    ids = value.split('{')[0].rstrip().rstrip(';').split('=')[-1]
+    return int(ids.split(', ')[0])
+
+
+def _dat_annotation_update(value):
+    upper = value.upper()
+    cols = value.split()
+    if 'ENTRY VERSION' in upper:
+        return cols[0].rstrip(','), int(cols[-1].rstrip('.'))
+    if 'LAST ANNOTATION UPDATE' in upper:
+        # Old style 'DT   01-OCT-2000 (Rel. 40, Last annotation update)'
+        upper_cols = upper.split()
+        index = [i for i, c in enumerate(upper_cols) if 'REL.' in c][-1]
+        version = cols[index + 1].rstrip(',')
+        return cols[0], int(version) if version.isdigit() else version
+    return None
+
+
+def _dat_keywords(value):
+    keywords = []
+    for keyword in value.rstrip(';.').split('; '):
+        if keyword.endswith('}'):
+            keyword = keyword.rsplit('{', 1)[0]
+        keywords.append(keyword.strip())
+    return keywords
+
+
+def iter_dat_records(handle):
+    """Streams the records of a UniProt `.dat` file, reading only the ID,
+    AC, DT, GN, OX, DR, KW and CC lines. Each record is a `dict` equal to
+    :func:`serialise_record` of the record parsed by Biopython, without
+    building the full record, its references, features or sequence.
+
+    Parameters
+    ----------
+    handle : str or file-like
+        An open text handle or the path to a `.dat` or `.dat.gz` file.
+
+    Returns
+    -------
+    `generator`
+        Generator of the keyword arguments of a :class:`Protein` per record.
+    """
+    if isinstance(handle, str):
+        with open_dat(handle) as fp:
+            for record in iter_dat_records(fp):
+                yield record
+        return
+
+    record = None
+    comment = None
+    gene_line = None
+    keywords_ = None
+    for line in handle:
+        key = line[:2]
+        if key not in DAT_LINE_CODES:
+            continue
+        elif key == 'DR':
+            cols = line[5:].rstrip().rstrip('.').split('; ')
+            if cols[0] == 'GO':
+                attr = GO_ASPECTS.get(cols[2][:1], None)
+                if attr is not None:
+                    record[attr].append(cols[1])
+            elif cols[0] in DAT_XREFS:
+                record[DAT_XREFS[cols[0]]].append(cols[1])
+        elif key == 'CC':
+            topic = line[5:8]
+            if topic == '-!-':
+                if comment is not None and record['function'] is None \
+                        and 'FUNCTION:' in comment:
+                    record['function'] = comment.replace('FUNCTION: ', '')
+                comment = line[9:].rstrip()
+            elif topic == '   ':
+                if comment is None:
+                    comment = line[9:].rstrip()
+                else:
+                    comment += ' ' + line[9:].rstrip()
+        elif key == 'ID':
+            record = {column: None for column in DAT_COLUMNS}
+            for attr in ('go_mf', 'go_bp', 'go_cc', 'interpro', 'pfam'):
+                record[attr] = []
+            record['reviewed'] = line.split()[2].rstrip(';') == 'Reviewed'
+            accessions = []
+            comment = None
+            gene_line = None
+            keywords_ = []
+        elif key == 'AC':
+            accessions.extend(line[5:].rstrip().rstrip(';').split('; '))
+        elif key == 'DT':
+            update = _dat_annotation_update(line[5:])
+            if update is not None:
+                record['last_update'], record['last_release'] = update
+        elif key == 'GN':
+            if gene_line is None:
+                gene_line = line[5:].rstrip()
+        elif key == 'OX':
+            if record['taxon_id'] is None:
+                record['taxon_id'] = _dat_taxon_id(line[5:])
+        elif key == 'KW':
+            keywords_.extend(_dat_keywords(line[5:].rstrip()))
+        elif key == '//':
+            if comment is not None and record['function'] is None \
+                    and 'FUNCTION:' in comment:
+                record['function'] = comment.replace('FUNCTION: ', '')
+            record['uniprot_id'] = accessions[0] if accessions else None
+            record['gene_id'] = (
+                None if gene_line is None else _dat_gene_name(gene_line)
+            )
+            record['keywords'] = keywords_
+            yield record
+            record = None
+
+
+def iter_dat_batches(handle, batch_size=10000):
+    """Streams the records of a UniProt `.dat` file as columnar batches.
+    See :func:`iter_dat_records`.
+
+    Parameters
+    ----------
+    handle : str or file-like
+        An open text handle or the path to a `.dat` or `.dat.gz` file.
+
+    batch_size : int, optional, default: 10000
+        Maximum number of records per batch.
+
+    Returns
+    -------
+    `generator`
+        Generator of `dict` mapping each name in `DAT_COLUMNS` to a list
+        of values, one per record of the batch.
+    """
+    batch = {column: [] for column in DAT_COLUMNS}
+    size = 0
+    for record in iter_dat_records(handle):
+        for column in DAT_COLUMNS:
+            batch[column].append(record[column])
+        size += 1
+        if size == batch_size:
+            yield batch
+            batch = {column: [] for column in DAT_COLUMNS}
+            size = 0
+    if size:
+        yield batch
+
+
+def iter_dat_chunks(handle, chunk_bytes=1 << 24):
+    """Splits a UniProt `.dat` stream into blocks of whole records, cut at
+    the `//` line terminating each record. The text is read in large
+    blocks and never split into lines, so the blocks can be parsed with
+    :func:`iter_dat_records` in other processes.
+
+    Parameters
+    ----------
+    handle : str or file-like
+        An open text handle or the path to a `.dat` or `.dat.gz` file.
+
+    chunk_bytes : int, optional, default: 16777216
+        Number of characters read at a time. Blocks are at least this long
+        except for the last, and only longer by a partial record.
+
+    Returns
+    -------
+    `generator`
+        Generator of `str` blocks of complete records.
+    """
+    if isinstance(handle, str):
+        with open_dat(handle) as fp:
+            for chunk in iter_dat_chunks(fp, chunk_bytes):
+                yield chunk
+        return
+
+    remainder = ''
+    while True:
+        block = handle.read(chunk_bytes)
+        if not block:
+            break
+        remainder += block
+        end = remainder.rfind('\n//\n')
+        if end < 0:
+            continue
+        end += 4
+        yield remainder[:end]
+        remainder = remainder[end:]
+    if remainder.strip():
+        yield remainder
+
+
 # --------------------------------------------------------------------------- #
 #
 #                    Biopython/SwissProt Record Parsing
@@ -288,12 +548,41 @@ def parse_record_into_protein(record, verbose=False):
 # --------------------------------------------------------------------------- #
 
 
+def _map_chunk(accessions, fr, cache, attempts, verbose):
+    # Each chunk uses its own mapper, which is not safe to share across
+    # threads.
+    uniprot_mapper = UniProtMapper(cache=cache)
+    for i in range(attempts):
+        mapping = uniprot_mapper.mapping(fr=fr, to='ACC', query=accessions)
+        if mapping:
+            return mapping
+        if i < attempts - 1:
+            # No data was downloaded, try again a few times.
+            if verbose:
+                logger.warning(
+                    "Could not download map from uniprot server. "
+                    "Attempt {}/{}. Re-attempt in 3 seconds.".format(
+                        i + 2, attempts)
+                )
+            time.sleep(3)
+    return {}
+
+
 def batch_map(accessions, fr='ACC+ID', allow_download=False, cache=False,
               session=None, keep_unreviewed=True, match_taxon_id=9606,
-              verbose=False):
+              verbose=False, dat_index=None, chunk_size=500, n_jobs=4,
+              map_cache_path=None, ttl=MAP_CACHE_TTL,
+              negative_ttl=MAP_CACHE_NEGATIVE_TTL):
     """
     Map a list of accessions using the UniProt batch mapping service.
 
+    Accessions are sent in chunks of `chunk_size`, with up to `n_jobs`
+    requests running at a time. If `map_cache_path` is set, the result of
+    each chunk is appended to it as it arrives, so that later calls only
+    send the accessions without a cached result for `fr` younger than `ttl`
+    seconds, or `negative_ttl` seconds for accessions that were not
+    mapped.
+
     Parameters
     ----------
     accessions : list
@@ -324,86 +613,150 @@ def batch_map(accessions, fr='ACC+ID', allow_download=False, cache=False,
     verbose :  bool, optional
         Log info/warning/error messages to the console.
 
+    dat_index : :class:`.dat_index.DatIndex`, optional
+        Index missing records are read from before downloading them. If
+        None, the default index is used if it has been built.
+
+    chunk_size : int, optional, default: 500
+        Number of accessions per mapping request, and per database query.
+
+    n_jobs : int, optional, default: 4
+        Maximum number of concurrent mapping requests.
+
+    map_cache_path : str or None, optional, default: None
+        File the mapping service results are saved to and read from, such
+        as :data:`..base.file_paths.uniprot_map_cache_path`. If None, every
+        accession is sent to the mapping service.
+
+    ttl : float or None, optional, default: `MAP_CACHE_TTL`
+        Seconds a cached result is used for. None to never expire results.
+
+    negative_ttl : float or None, optional, default: `MAP_CACHE_NEGATIVE_TTL`
+        Seconds a cached failure to map an accession is used for.
+
     Returns
     -------
     `dict`
         A dictionary of mappings from UniProt accessions to the most
         up-to-date UniProt accessions. Dictionary values are lists.
     """
-    uniprot_mapper = UniProtMapper(cache=cache)
-    filtered_mapping = {}
-    mapping = uniprot_mapper.mapping(fr=fr, to='ACC', query=accessions)
+    # Imported here since these modules depend on this one.
+    from .dat_index import save_missing_proteins
+    from ..database.utilities import protein_status_map
+
+    if session is None:
+        session = Protein.query.session
+    accessions = list(OrderedDict.fromkeys(accessions))
+    mapped = {}
+    if map_cache_path is not None:
+        mapped = load_uniprot_map_cache(
+            map_cache_path, fr=fr, ttl=ttl, negative_ttl=negative_ttl)
+    unmapped = [a for a in accessions if a not in mapped]
+    if verbose:
+        logger.info(
+            "Read {} mappings from cache. Mapping {} accessions.".format(
+                len(accessions) - len(unmapped), len(unmapped))
+        )
 
-    # No data was downloaded, try again a few times.
-    if mapping == {}:
-        for i in range(0, 4):
-            mapping = uniprot_mapper.mapping(
-                fr=fr, to='ACC', query=accessions
-            )
-            if mapping:
-                break
-            else:
-                if verbose:
-                    logger.warning(
-                        "Could not download map from uniprot server. "
-                        "Attempt {}/5. Re-attempt in 3 seconds.".format(i + 2)
-                    )
-                time.sleep(3)
-    if mapping == {}:
+    chunks = [
+        unmapped[i:i + chunk_size]
+        for i in range(0, len(unmapped), chunk_size)
+    ]
+    failed = 0
+    if chunks:
+        n_workers = min(len(chunks), effective_n_jobs(n_jobs))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(_map_chunk, c, fr, cache, 5, verbose): c
+                for c in chunks
+            }
+            for future in as_completed(futures):
+                mapping = future.result()
+                if not mapping:
+                    failed += 1
+                    continue
+                # Accessions the service could not map are cached as well.
+                mapping = {
+                    a: list(mapping.get(a, [])) for a in futures[future]
+                }
+                if map_cache_path is not None:
+                    append_uniprot_map_cache(mapping, map_cache_path, fr=fr)
+                mapped.update(mapping)
+    if chunks and failed == len(chunks):
         raise ValueError("Could not download map from uniprot server.")
+    elif failed and verbose:
+        logger.warning(
+            "Could not map {}/{} chunks of accessions.".format(
+                failed, len(chunks))
+        )
 
+    # Only accessions mapped to at least one accession are returned.
+    mapping = [(a, mapped[a]) for a in accessions if mapped.get(a)]
+    filtered_mapping = {}
+    for i in range(0, len(mapping), chunk_size):
+        chunk = dict(mapping[i:i + chunk_size])
+        targets = set(a for to in chunk.values() for a in to)
+        status = protein_status_map(targets, session)
+        missing = [a for a in targets if a not in status]
+        if allow_download and missing:
+            if verbose:
+                logger.info(
+                    "Mapping to {} entries not found in database. "
+                    "Attempting download.".format(len(missing))
+                )
+            status.update(save_missing_proteins(
+                missing, index=dat_index, session=session,
+                taxon_id=match_taxon_id, verbose=verbose
+            ))
+        filtered_mapping.update(filter_mapped_accessions(
+            chunk, status, keep_unreviewed=keep_unreviewed,
+            match_taxon_id=match_taxon_id
+        ))
+    return filtered_mapping
+
+
+def filter_mapped_accessions(mapping, status, keep_unreviewed=True,
+                             match_taxon_id=9606):
+    """Filters the targets of an accession mapping as :func:`batch_map`
+    does, removing accessions without a database entry, unreviewed entries
+    unless `keep_unreviewed` is True and entries not matching
+    `match_taxon_id`.
+
+    Parameters
+    ----------
+    mapping : dict
+        A dictionary of mappings from accessions to lists of UniProt
+        accessions.
+
+    status : dict
+        Mapping from the UniProt accession of each database entry to its
+        `(reviewed, taxon_id)`, see
+        :func:`..database.utilities.protein_status_map`.
+
+    keep_unreviewed : bool, optional
+        If True, keep the unreviewed accession in mapping.
+
+    match_taxon_id : int, optional
+        Ignores mappings to proteins that do not match this id.
+
+    Returns
+    -------
+    `dict`
+        The filtered mapping with sorted lists of unique accessions.
+    """
+    filtered = {}
     for fr, to in mapping.items():
-        # Make sure any new accessions are in the database
-        invalid_to = []
+        targets = set()
         for accession in to:
-            # Check to see if a protein macthing accession and the
-            # taxon id exists.
-            entry = Protein.get_by_uniprot_id(accession)
-            if entry is not None:
-                if (match_taxon_id is not None) and entry.taxon_id != match_taxon_id:
-                    invalid_to.append(accession)
-            else:
-                if allow_download:
-                    if verbose:
-                        logger.info(
-                            "Mapping to {}, but entry not found in database. "
-                            "Attempting download.".format(accession)
-                        )
-                    record = download_record(
-                        accession, verbose=True, taxon_id=match_taxon_id
-                    )
-                    protein = parse_record_into_protein(record)
-                    if protein is not None:
-                        protein.save(session, commit=True)
-                    else:
-                        if verbose:
-                            logger.info(
-                                "No valid record for {} was found".format(
-                                    accession)
-                            )
-                        invalid_to.append(accession)
-                else:
-                    invalid_to.append(accession)
-
-        to = [a for a in to if a not in invalid_to]
-        status = [Protein.get_by_uniprot_id(a).reviewed for a in to]
-        reviewed = [a for (a, s) in zip(to, status) if s is True]
-        unreviewed = [a for (a, s) in zip(to, status) if s is False]
-        targets = reviewed
-        if keep_unreviewed:
-            targets += unreviewed
-
-        targets = list(set(targets))
-        if not (match_taxon_id is None):
-            taxon_ids = [
-                Protein.get_by_uniprot_id(a).taxon_id for a in targets
-            ]
-            targets = [
-                t for (t, taxon_id) in zip(targets, taxon_ids)
-                if match_taxon_id == taxon_id
-            ]
-        filtered_mapping[fr] = list(sorted(targets))
-    return filtered_mapping
+            if accession not in status:
+                continue
+            reviewed, taxon_id = status[accession]
+            if (match_taxon_id is not None) and taxon_id != match_taxon_id:
+                continue
+            if reviewed is True or (keep_unreviewed and reviewed is False):
+                targets.add(accession)
+        filtered[fr] = list(sorted(targets))
+    return filtered
 
 
 def __xrefs(db_name, record):
@@ -9,7 +9,7 @@ import atexit
 import logging
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker, Session, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -27,17 +27,49 @@ db_session = scoped_session(
 Base = declarative_base()
 Base.query = db_session.query_property()
 
+# Maximum number of bound parameters in each `IN` query, below the lowest
+# SQLite limit of 999 variables.
+MAX_IN_PARAMETERS = 900
+
+# Tables whose content version is kept in the `content_version` table.
+VERSIONED_TABLES = ('interaction', 'protein')
+
 
 def init_database(engine):
     from .models import (
-        Protein, Interaction, Pubmed, Psimi, Reference
+        Protein, Interaction, Pubmed, Psimi, Reference, FeatureToken
     )
     Base.metadata.create_all(bind=engine, checkfirst=True)
 
+    # Databases created before `feature_ids` was added lack the column.
+    columns = [c['name'] for c in inspect(engine).get_columns('interaction')]
+    if 'feature_ids' not in columns:
+        engine.execute("ALTER TABLE interaction ADD COLUMN feature_ids BLOB")
+
+    # Triggers bump the version of a table on every insert, update and
+    # delete, whether made through the ORM or not, so that caches can
+    # detect changes without reading the table. Versions start at a random
+    # value so a recreated database does not repeat earlier versions.
+    engine.execute(
+        "CREATE TABLE IF NOT EXISTS content_version "
+        "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+    )
+    for table in VERSIONED_TABLES:
+        engine.execute(
+            "INSERT OR IGNORE INTO content_version VALUES (?, random())",
+            (table,)
+        )
+        for event in ('insert', 'update', 'delete'):
+            engine.execute(
+                "CREATE TRIGGER IF NOT EXISTS {0}_{1}_version AFTER {2} ON "
+                "{0} BEGIN UPDATE content_version SET version = version + 1 "
+                "WHERE name = '{0}'; END".format(table, event, event.upper())
+            )
+
 
 def create_session(db_path, echo=False):
     from .models import (
-        Protein, Interaction, Pubmed, Psimi, Reference
+        Protein, Interaction, Pubmed, Psimi, Reference, FeatureToken
     )
     try:
         engine = create_engine(
@@ -56,6 +88,7 @@ def create_session(db_path, echo=False):
         Pubmed.query = session.query_property()
         Psimi.query = session.query_property()
         Reference.query = session.query_property()
+        FeatureToken.query = session.query_property()
 
         return session, engine
     except:
@@ -79,7 +112,7 @@ def cleanup_database(session, engine):
 
 def delete_database(session):
     from ..database.models import (
-        Protein, Interaction, Pubmed, Psimi, Reference
+        Protein, Interaction, Pubmed, Psimi, Reference, FeatureToken
     )
 
     session.query(Protein).delete()
@@ -87,6 +120,7 @@ def delete_database(session):
     session.query(Pubmed).delete()
     session.query(Psimi).delete()
     session.query(Reference).delete()
+    session.query(FeatureToken).delete()
 
     try:
         session.commit()
@@ -0,0 +1,203 @@
+"""
+This module loads UniProt `.dat` dumps into the protein table. The dump is
+read in blocks of whole records, the blocks are parsed and validated in a
+pool of processes, and the rows are upserted through the SQLAlchemy Core
+layer in one transaction per block, without creating :class:`Protein`
+instances. At most a few blocks are held in memory at any time.
+"""
+
+import io
+import logging
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from joblib import effective_n_jobs
+
+from sqlalchemy import bindparam
+
+from . import db_session, MAX_IN_PARAMETERS
+from .models import Protein
+from .validators import (
+    validate_accession, validate_gene_id, validate_taxon_id,
+    validate_boolean, validate_go_annotations, validate_interpro_annotations,
+    validate_pfam_annotations, validate_keywords, validate_function
+)
+from ..data_mining.uniprot import iter_dat_chunks, iter_dat_records
+
+__all__ = [
+    'protein_row',
+    'upsert_protein_rows',
+    'ingest_dat'
+]
+
+logger = logging.getLogger("pyppi")
+
+
+def protein_row(params):
+    """Validates the keyword arguments of a :class:`Protein`, as returned by
+    :func:`..data_mining.uniprot.iter_dat_records`, into the column values
+    the ORM would store. Existence of the accession is not checked.
+
+    Parameters
+    ----------
+    params : dict
+        The keyword arguments of a :class:`Protein`.
+
+    Returns
+    -------
+    `dict`
+        Mapping of each column name to its value.
+    """
+    last_update = params.get('last_update', None)
+    last_release = params.get('last_release', None)
+    if last_update is not None:
+        last_update = datetime.strptime(last_update, '%d-%b-%Y')
+    if last_release is not None and last_release < 1:
+        raise TypeError("`last_release` must be positive.")
+    return {
+        'uniprot_id': validate_accession(
+            params['uniprot_id'], klass=Protein, upper=True,
+            check_exists=False
+        ),
+        'taxon_id': validate_taxon_id(params['taxon_id']),
+        'gene_id': validate_gene_id(params.get('gene_id', None)),
+        'go_mf': validate_go_annotations(params.get('go_mf', None)),
+        'go_cc': validate_go_annotations(params.get('go_cc', None)),
+        'go_bp': validate_go_annotations(params.get('go_bp', None)),
+        'interpro': validate_interpro_annotations(
+            params.get('interpro', None)),
+        'pfam': validate_pfam_annotations(params.get('pfam', None)),
+        'keywords': validate_keywords(params.get('keywords', None)),
+        'function': validate_function(params.get('function', None)),
+        'reviewed': validate_boolean(params.get('reviewed', None)),
+        'last_update': last_update,
+        'last_release': last_release,
+    }
+
+
+def _parse_chunk(chunk):
+    return [protein_row(params) for params in
+            iter_dat_records(io.StringIO(chunk))]
+
+
+def upsert_protein_rows(rows, session=None):
+    """Inserts rows returned by :func:`protein_row` into the protein table,
+    or updates the existing row with the same `uniprot_id`. Existing ids
+    are looked up with one query per 900 accessions, and rows are written
+    with one `executemany` insert and update. The caller commits.
+
+    Parameters
+    ----------
+    rows : list
+        List of column `dict`. Later rows replace earlier rows with the same
+        `uniprot_id`.
+
+    session : :class:`scoped_session`, optional.
+        A session instance to save to. Leave as None to use the default
+        session and save to the database located at `~/.pyppi/pyppi.db`
+
+    Returns
+    -------
+    `tuple`
+        The number of rows inserted and updated.
+    """
+    if session is None:
+        session = db_session
+    table = Protein.__table__
+    rows = list({row['uniprot_id']: row for row in rows}.values())
+    accessions = [row['uniprot_id'] for row in rows]
+
+    existing = {}
+    for i in range(0, len(accessions), MAX_IN_PARAMETERS):
+        query = session.query(Protein.uniprot_id, Protein.id).filter(
+            Protein.uniprot_id.in_(accessions[i:i + MAX_IN_PARAMETERS])
+        )
+        existing.update(query)
+
+    new_rows = [row for row in rows if row['uniprot_id'] not in existing]
+    updated_rows = [
+        dict(row, _id=existing[row['uniprot_id']])
+        for row in rows if row['uniprot_id'] in existing
+    ]
+    if new_rows:
+        session.execute(table.insert(), new_rows)
+    if updated_rows:
+        statement = table.update().where(table.c.id == bindparam('_id'))
+        session.execute(statement, updated_rows)
+    return len(new_rows), len(updated_rows)
+
+
+def ingest_dat(file_path, session=None, n_jobs=1, chunk_bytes=1 << 24,
+               max_pending=2, verbose=False):
+    """Loads every record of a UniProt `.dat` dump into the protein table,
+    updating the entries that already exist. Blocks of records are parsed
+    in a pool of `n_jobs` processes and each block is upserted and
+    committed in its own transaction, in file order.
+
+    Parameters
+    ----------
+    file_path : str or file-like
+        The path to a `.dat` or `.dat.gz` file, or an open text handle.
+
+    session : :class:`scoped_session`, optional.
+        A session instance to save to. Leave as None to use the default
+        session and save to the database located at `~/.pyppi/pyppi.db`
+
+    n_jobs : int, optional, default: 1
+        Number of processes to parse with. Negative values are interpreted
+        as in `joblib`, for example -1 uses all processors.
+
+    chunk_bytes : int, optional, default: 16777216
+        Approximate size in characters of each block of records.
+
+    max_pending : int, optional, default: 2
+        Number of blocks queued per process. Memory use is bounded by about
+        `n_jobs * max_pending` blocks.
+
+    verbose : bool, default: False
+        Log the progress after each block.
+
+    Returns
+    -------
+    `tuple`
+        The number of proteins inserted and updated.
+    """
+    if session is None:
+        session = db_session
+    n_jobs = effective_n_jobs(n_jobs)
+    chunks = iter_dat_chunks(file_path, chunk_bytes)
+    inserted, updated = 0, 0
+
+    def upsert(rows):
+        try:
+            counts = upsert_protein_rows(rows, session)
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        if verbose:
+            logger.info("Inserted {} and updated {} proteins.".format(
+                inserted + counts[0], updated + counts[1]))
+        return counts
+
+    if n_jobs == 1:
+        for chunk in chunks:
+            counts = upsert(_parse_chunk(chunk))
+            inserted, updated = inserted + counts[0], updated + counts[1]
+        return inserted, updated
+
+    pool = multiprocessing.Pool(processes=n_jobs)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_parse_chunk, (chunk,)))
+            while len(pending) >= n_jobs * max_pending:
+                counts = upsert(pending.popleft().get())
+                inserted, updated = inserted + counts[0], updated + counts[1]
+        while pending:
+            counts = upsert(pending.popleft().get())
+            inserted, updated = inserted + counts[0], updated + counts[1]
+    finally:
+        pool.close()
+        pool.join()
+    return inserted, updated
@@ -10,7 +10,7 @@ from enum import Enum
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, ForeignKey, Table, DateTime,
-    UniqueConstraint
+    UniqueConstraint, LargeBinary
 )
 from sqlalchemy.orm import (
     relationship, mapper, validates, backref, Query, scoped_session
@@ -452,6 +452,11 @@ class Interaction(Base):
         An integer representing the UniProt taxonomy id. `9606` represents
         human. It is derived from the `source` protein.
 
+    feature_ids : bytes or None
+        The :class:`FeatureToken` ids of the tokens in each feature column,
+        packed by :func:`..database.utilities.pack_feature_ids`. Reset to
+        None whenever a feature column changes.
+
     Notes
     -----
     Interactions are not directional, so `(A, B)` will be treated as 
@@ -483,6 +488,7 @@ class Interaction(Base):
     ulca_go_bp = Column('ulca_go_bp', String)
     interpro = Column('interpro', String)
     pfam = Column('pfam', String)
+    feature_ids = Column('feature_ids', LargeBinary, default=None)
 
     @classmethod
     def get_by_interactors(cls, a, b):
@@ -671,32 +677,38 @@ class Interaction(Base):
             ])
 
     # ---------------------------- VALIDATORS ----------------------------- #
+    # Changing a feature column invalidates the packed feature ids.
     @validates(*['go_mf', 'go_cc', 'go_bp'])
     def _validate_go_annotations(self, key, values):
+        self.feature_ids = None
         return validate_go_annotations(
             values, upper=True, allow_duplicates=True
         )
 
     @validates(*['ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp'])
     def _validate_ulca_go_annotations(self, key, values):
+        self.feature_ids = None
         return validate_go_annotations(
             values, upper=True, allow_duplicates=True
         )
 
     @validates('interpro')
     def _validate_interpro_annotations(self, key, values):
+        self.feature_ids = None
         return validate_interpro_annotations(
             values, upper=True, allow_duplicates=True
         )
 
     @validates('pfam')
     def _validate_pfam_annotations(self, key, values):
+        self.feature_ids = None
         return validate_pfam_annotations(
             values, upper=True, allow_duplicates=True
         )
 
     @validates('keywords')
     def _validate_keywords(self, key, values):
+        self.feature_ids = None
         return validate_keywords(values, allow_duplicates=True)
 
     @validates('taxon_id')
@@ -1285,3 +1297,27 @@ class Reference(Base):
                 "int or Psimi.".format(
                     type(value).__name__)
             )
+
+
+class FeatureToken(Base):
+    """
+    The vocabulary of tokens appearing in the textual features of
+    interactions. Each token is the text a :class:`CountVectorizer` would
+    extract from a feature column, for example `GO0005515` for `GO:0005515`,
+    and is assigned an integer id used in :attr:`Interaction.feature_ids`.
+
+    Parameters
+    ----------
+    token : str
+        The token text.
+    """
+    __tablename__ = "feature_token"
+
+    id = Column(Integer, primary_key=True)
+    token = Column(String, unique=True, nullable=False)
+
+    def __init__(self, token):
+        self.token = token
+
+    def __repr__(self):
+        return "<FeatureToken(id={}, token={})>".format(self.id, self.token)
@@ -2,9 +2,8 @@
 This module contains a collection of functions that perform common tasks
 related to the database.
 """
-import os
-import gzip
-from Bio import SwissProt
+import re
+import numpy as np
 import logging
 from collections import OrderedDict
 
@@ -13,12 +12,19 @@ from sqlalchemy.orm.query import Query
 
 from ..base.constants import SOURCE, TARGET, LABEL, EXPERIMENT_TYPE, PUBMED
 from ..base.utilities import is_null, remove_duplicates
-from ..data_mining.features import compute_interaction_features
-from ..data_mining.uniprot import serialise_record
+from ..data_mining.features import (
+    compute_interaction_features, compute_ulca_features_many
+)
+from ..data_mining.ontology import get_active_instance
+from ..data_mining.similarity import (
+    count_annotations, information_content, save_information_content,
+    load_information_content, compute_similarity_features_many
+)
+from ..data_mining.uniprot import open_dat, iter_dat_batches, DAT_COLUMNS
 from ..data_mining.psimi import parse_miobo_file
 
-from . import db_session
-from .models import Interaction, Psimi, Protein, Pubmed
+from . import db_session, MAX_IN_PARAMETERS
+from .models import Interaction, Psimi, Protein, Pubmed, FeatureToken
 from .exceptions import ObjectNotFound
 from .validators import (
     validate_interaction_does_not_exist, validate_same_taxonid,
@@ -35,16 +41,36 @@ __all__ = [
     "interactome_interactions",
     "labels_from_interactions",
     "get_upid_to_protein_map",
+    "protein_status_map",
     "get_source_taget_to_interactions_map",
     "create_interaction",
     "proteins_from_dat",
     'psimi_from_obo',
     'pmids_from_list',
-    'psimis_from_list'
+    'psimis_from_list',
+    'proteins_with_go_terms',
+    'refresh_ulca_features',
+    'go_information_content',
+    'interaction_similarity_features',
+    'FEATURE_COLUMNS',
+    'feature_tokens',
+    'pack_feature_ids',
+    'unpack_feature_ids',
+    'feature_vocabulary',
+    'update_feature_ids'
 ]
 
 logger = logging.getLogger("pyppi")
 
+# The feature columns of an Interaction in the order they are packed into
+# its `feature_ids`.
+FEATURE_COLUMNS = (
+    'go_mf', 'go_bp', 'go_cc', 'ulca_go_mf', 'ulca_go_bp', 'ulca_go_cc',
+    'interpro', 'pfam', 'keywords'
+)
+# The default token pattern of CountVectorizer.
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
 
 def uniprotid_entry_map():
     """Creates a `dict` mapping from UniProt accession to it's
@@ -277,6 +303,44 @@ def get_upid_to_protein_map(uniprot_ids, taxon_id=None):
     return mapping
 
 
+def protein_status_map(uniprot_ids, session=None, chunk_size=900):
+    """Builds a `dict` mapping from the given UniProt accession strings to
+    the review status and taxonomy id of their database entries. Only
+    these two columns are queried, with one query per `chunk_size`
+    accessions.
+
+    Parameters
+    ----------
+    uniprot_ids : `list`
+        List of UniProt accession.
+
+    session : :class:`scoped_session`, optional.
+        The session to query. Leave as None to use the session
+        `Protein.query` is bound to.
+
+    chunk_size : int, optional, default: 900
+        Number of accessions per query, below the SQLite limit on bound
+        parameters.
+
+    Returns
+    -------
+    `dict`
+        Mapping from UniProt accession to a `(reviewed, taxon_id)` tuple.
+        Accessions not in the database are left out.
+    """
+    if session is None:
+        session = Protein.query.session
+    uniprot_ids = list(set(upid for upid in uniprot_ids if upid is not None))
+    status = {}
+    for i in range(0, len(uniprot_ids), chunk_size):
+        query = session.query(
+            Protein.uniprot_id, Protein.reviewed, Protein.taxon_id
+        ).filter(Protein.uniprot_id.in_(uniprot_ids[i:i + chunk_size]))
+        for (upid, reviewed, taxon_id) in query:
+            status[upid] = (reviewed, taxon_id)
+    return status
+
+
 def get_source_taget_to_interactions_map(id_ppis, taxon_id=None):
     """Builds a `dict` mapping from a tuple of integer ids representing
     the :class:`Protein` source and target primary keys to the associtated
@@ -452,7 +516,8 @@ def proteins_from_dat(file_path, session=None, verbose=False):
     the file path ends in `.gz` then gzip will be used to read from the file
     automatically. If an entry already exists in the database with the same
     `UniProt` identifier, then that entry will have all of it's attributes
-    updated.
+    updated. Use :func:`.ingest.ingest_dat` for full dumps, which does not
+    keep the instances in memory.
 
     Parameters
     ----------
@@ -475,41 +540,36 @@ def proteins_from_dat(file_path, session=None, verbose=False):
     if session is None:
         session = db_session
 
-    # Not memory efficient but speeds up the process since we don't
-    # need to constantly query the database for entries. This
-    # becomes a faster dict lookup.
-    existing = uniprotid_entry_map()
     new_proteins = []
     updated_proteins = []
 
-    if os.path.splitext(file_path)[-1] == '.gz':
-        fp = gzip.open(file_path, 'rt')
-    else:
-        fp = open(file_path, 'rt')
-
-    records = SwissProt.parse(fp)
-    for record in records:
-        params = serialise_record(record)
-        if params is None:
-            continue
-
-        uniprot_id = params.get('uniprot_id')
-        protein = existing.get(uniprot_id, None)
-        if protein is None:
-            if verbose:
-                logger.info(
-                    "Creating new entry '{}'.".format(uniprot_id)
-                )
-            protein = Protein(**params)
-            new_proteins.append(protein)
-        else:
-            if verbose:
-                logger.info(
-                    "Updating entry '{}'.".format(uniprot_id)
-                )
-            for k, v in params.items():
-                setattr(protein, k, v)
-            updated_proteins.append(protein)
+    fp = open_dat(file_path)
+    for batch in iter_dat_batches(fp, batch_size=500):
+        # Only the entries of the current batch are looked up, instead of
+        # loading every protein in the database up front.
+        query = session.query(Protein).filter(
+            Protein.uniprot_id.in_(batch['uniprot_id'])
+        )
+        existing = {p.uniprot_id: p for p in query}
+        for values in zip(*(batch[column] for column in DAT_COLUMNS)):
+            params = dict(zip(DAT_COLUMNS, values))
+            uniprot_id = params.get('uniprot_id')
+            protein = existing.get(uniprot_id, None)
+            if protein is None:
+                if verbose:
+                    logger.info(
+                        "Creating new entry '{}'.".format(uniprot_id)
+                    )
+                protein = Protein(**params)
+                new_proteins.append(protein)
+            else:
+                if verbose:
+                    logger.info(
+                        "Updating entry '{}'.".format(uniprot_id)
+                    )
+                for k, v in params.items():
+                    setattr(protein, k, v)
+                updated_proteins.append(protein)
 
     try:
         session.add_all(new_proteins + updated_proteins)
@@ -684,3 +744,321 @@ def psimis_from_list(psimi_tuples, session=None):
     except:
         session.rollback()
         raise
+
+
+def proteins_with_go_terms(terms, chunk_size=100):
+    """Finds the :class:`Protein` instances annotated with at least one of
+    the GO accessions in `terms`. Only the id and GO columns are queried,
+    and rows are pre-filtered in SQL with a `LIKE` clause per term.
+
+    Parameters
+    ----------
+    terms : iterable
+        Iterable of GO accessions.
+
+    chunk_size : int, optional, default: 100
+        Number of `LIKE` clauses to combine in a single query.
+
+    Returns
+    -------
+    `list`
+        List of the integer primary keys of matching proteins.
+    """
+    terms = sorted(set(terms))
+    columns = (Protein.go_mf, Protein.go_bp, Protein.go_cc)
+    matches = OrderedDict()
+    for start in range(0, len(terms), chunk_size):
+        chunk = terms[start:start + chunk_size]
+        clauses = [
+            column.like('%{}%'.format(term))
+            for term in chunk for column in columns
+        ]
+        rows = Protein.query.with_entities(Protein.id, *columns).filter(
+            or_(*clauses)
+        )
+        # LIKE also matches accessions containing a term, so check the
+        # split annotations before accepting a row.
+        chunk = set(chunk)
+        for (id_, go_mf, go_bp, go_cc) in rows:
+            if id_ in matches:
+                continue
+            annotations = ','.join(a for a in (go_mf, go_bp, go_cc) if a)
+            if any(t in chunk for t in annotations.split(',')):
+                matches[id_] = True
+    return list(matches.keys())
+
+
+def refresh_ulca_features(terms, dag=None, session=None, batch_size=1000,
+                          verbose=False):
+    """Recomputes the `ulca_go_mf`, `ulca_go_bp` and `ulca_go_cc` columns of
+    the :class:`Interaction` instances whose source or target protein is
+    annotated with any of the GO accessions in `terms`. Use with
+    :func:`..data_mining.ontology.get_affected_terms` to update the
+    database after a new GO release without recomputing every interaction.
+
+    Parameters
+    ----------
+    terms : iterable
+        Iterable of GO accessions.
+
+    dag : dict, optional, default: None
+        Dag of the new GO release. If None, the default global dag instance
+        will be loaded, which is loaded from the `~./pyppi` directory.
+
+    session : :class:`scoped_session`, optional.
+        A session instance to save to. Leave as None to use the default
+        session and save to the database located at `~/.pyppi/pyppi.db`
+
+    batch_size : int, optional, default: 1000
+        Number of interactions to recompute and commit at a time.
+
+    verbose : bool, default: False
+        Log messages that occur during the call.
+
+    Returns
+    -------
+    `list`
+        List of the updated :class:`Interaction` instances.
+    """
+    if session is None:
+        session = db_session
+
+    protein_ids = proteins_with_go_terms(terms)
+    interactions = OrderedDict()
+    # Each id is bound twice, once for the source and once for the target.
+    chunk_size = MAX_IN_PARAMETERS // 2
+    for start in range(0, len(protein_ids), chunk_size):
+        ids = protein_ids[start:start + chunk_size]
+        matches = Interaction.query.filter(
+            or_(Interaction.source_.in_(ids), Interaction.target_.in_(ids))
+        )
+        for interaction in matches.all():
+            interactions[interaction.id] = interaction
+    interactions = list(interactions.values())
+
+    if verbose:
+        logger.info(
+            "Recomputing ULCA features for {} interactions involving "
+            "{} proteins.".format(len(interactions), len(protein_ids))
+        )
+
+    for start in range(0, len(interactions), batch_size):
+        batch = interactions[start:start + batch_size]
+        ids = sorted(
+            set(i.source for i in batch) | set(i.target for i in batch)
+        )
+        proteins = {}
+        for i in range(0, len(ids), MAX_IN_PARAMETERS):
+            query = Protein.query.filter(
+                Protein.id.in_(ids[i:i + MAX_IN_PARAMETERS])
+            )
+            proteins.update((p.id, p) for p in query.all())
+        features = compute_ulca_features_many(
+            [(proteins[i.source], proteins[i.target]) for i in batch], dag
+        )
+        for interaction, values in zip(batch, features):
+            interaction.ulca_go_mf = values['ulca_go_mf']
+            interaction.ulca_go_bp = values['ulca_go_bp']
+            interaction.ulca_go_cc = values['ulca_go_cc']
+        update_feature_ids(batch, session=session)
+
+        try:
+            session.add_all(batch)
+            session.commit()
+        except:
+            if verbose:
+                logger.exception("Could not save updated interactions.")
+            session.rollback()
+            raise
+
+    return interactions
+
+
+def go_information_content(dag=None, recompute=False):
+    """Returns the information content of each GO term computed from the
+    annotation frequencies in the `go_mf`, `go_bp` and `go_cc` columns of
+    the :class:`Protein` table. The array is computed once and stored next
+    to the GO snapshot of `dag`. Set `recompute` to True after the
+    :class:`Protein` table has changed.
+
+    Parameters
+    ----------
+    dag : :class:`..data_mining.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be loaded, which is
+        loaded from the `~./pyppi` directory.
+
+    recompute : bool, optional, default: False
+        Ignore and overwrite the stored information content.
+
+    Returns
+    -------
+    :class:`np.ndarray`
+        Array of information content aligned with the integer ids of the
+        dag index.
+    """
+    if dag is None:
+        dag = get_active_instance()
+
+    if not recompute:
+        ic = load_information_content(dag)
+        if ic is not None:
+            return ic
+
+    rows = Protein.query.with_entities(
+        Protein.go_mf, Protein.go_bp, Protein.go_cc
+    )
+    counts = count_annotations(
+        (annotation for row in rows for annotation in row), dag
+    )
+    ic = information_content(counts, dag)
+    try:
+        save_information_content(ic, dag)
+    except OSError as e:
+        logger.warning("Could not save information content: {}".format(e))
+    return ic
+
+
+def interaction_similarity_features(interactions, dag=None, ic=None):
+    """Computes the GO semantic similarity features between the source and
+    target proteins of each interaction with
+    :func:`..data_mining.similarity.compute_similarity_features_many`.
+
+    Parameters
+    ----------
+    interactions : list
+        List of :class:`Interaction` instances.
+
+    dag : :class:`..data_mining.ontology.GODag`, optional, default: None
+        If None, the default global dag instance will be loaded, which is
+        loaded from the `~./pyppi` directory.
+
+    ic : array-like, optional, default: None
+        Information content of each GO term. Uses
+        :func:`go_information_content` if None.
+
+    Returns
+    -------
+    :class:`np.ndarray`
+        Array with one row per interaction and the columns named by
+        :func:`..data_mining.similarity.similarity_feature_names`.
+    """
+    if dag is None:
+        dag = get_active_instance()
+    if ic is None:
+        ic = go_information_content(dag)
+
+    ids = sorted(
+        set(i.source for i in interactions) |
+        set(i.target for i in interactions)
+    )
+    proteins = {}
+    # Chunk the id list to stay below the sqlite variable limit.
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        for protein in Protein.query.filter(Protein.id.in_(chunk)).all():
+            proteins[protein.id] = protein
+
+    pairs = [
+        (proteins.get(i.source, None), proteins.get(i.target, None))
+        for i in interactions
+    ]
+    return compute_similarity_features_many(pairs, ic, dag)
+
+
+def feature_tokens(value):
+    """Splits a comma delimited feature column into the tokens extracted by
+    a :class:`CountVectorizer` with `lowercase=False` once the ':'
+    characters are removed, as in
+    :func:`..predict.utilities.interactions_to_Xy_format`."""
+    if not value:
+        return []
+    return TOKEN_PATTERN.findall(value.replace(':', ''))
+
+
+def pack_feature_ids(groups):
+    """Packs one sequence of integer token ids per column of
+    `FEATURE_COLUMNS` into little-endian uint32 bytes. The bytes start with
+    the number of ids in each column, followed by the ids themselves."""
+    if len(groups) != len(FEATURE_COLUMNS):
+        raise ValueError("Expected {} groups, found {}.".format(
+            len(FEATURE_COLUMNS), len(groups)))
+    counts = [len(g) for g in groups]
+    ids = [i for g in groups for i in g]
+    return np.asarray(counts + ids, dtype='<u4').tobytes()
+
+
+def unpack_feature_ids(blob):
+    """Inverse of :func:`pack_feature_ids`.
+
+    Returns
+    -------
+    `list`
+        One :class:`np.ndarray` of token ids per column of `FEATURE_COLUMNS`.
+    """
+    values = np.frombuffer(blob, dtype='<u4')
+    n = len(FEATURE_COLUMNS)
+    bounds = np.cumsum(values[:n]) + n
+    return np.split(values[n:bounds[-1]].astype(np.int64), bounds[:-1] - n)
+
+
+def feature_vocabulary(session=None):
+    """Returns a `dict` mapping the text of each :class:`FeatureToken` to
+    its integer id."""
+    if session is None:
+        session = db_session
+    return dict(session.query(FeatureToken.token, FeatureToken.id).all())
+
+
+def update_feature_ids(interactions, session=None, commit=False):
+    """Sets the packed `feature_ids` of each interaction from its feature
+    columns, adding any new tokens to the :class:`FeatureToken` table.
+
+    Parameters
+    ----------
+    interactions : list
+        List of :class:`Interaction` instances.
+
+    session : :class:`scoped_session`, optional.
+        A session instance to save to. Leave as None to use the default
+        session and save to the database located at `~/.pyppi/pyppi.db`
+
+    commit : bool, default: False
+        Commit the new tokens and updated interactions.
+
+    Returns
+    -------
+    `list`
+        The updated :class:`Interaction` instances.
+    """
+    if session is None:
+        session = db_session
+
+    interactions = list(interactions)
+    tokens = [
+        [feature_tokens(getattr(interaction, column))
+         for column in FEATURE_COLUMNS]
+        for interaction in interactions
+    ]
+    vocabulary = feature_vocabulary(session)
+    new = sorted(set(
+        t for groups in tokens for group in groups for t in group
+        if t not in vocabulary
+    ))
+    try:
+        if new:
+            entries = [FeatureToken(token) for token in new]
+            session.add_all(entries)
+            session.flush()
+            vocabulary.update((e.token, e.id) for e in entries)
+
+        for interaction, groups in zip(interactions, tokens):
+            interaction.feature_ids = pack_feature_ids([
+                [vocabulary[t] for t in group] for group in groups
+            ])
+        session.add_all(interactions)
+        if commit:
+            session.commit()
+    except:
+        session.rollback()
+        raise
+    return interactions
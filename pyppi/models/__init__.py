@@ -7,5 +7,6 @@ Top level module to quick instantiting various classifiers
 __all__ = [
     "binary_relevance",
     "classifier_chain",
+    "feature_selection",
     "utilities"
 ]
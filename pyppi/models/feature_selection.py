@@ -0,0 +1,135 @@
+"""
+A supervised feature selection step for the sparse count matrices of a
+single binary label, placed between the `CountVectorizer` and the estimator
+of each per-label pipeline.
+"""
+
+__all__ = [
+    "SELECTION_SCORES",
+    "LabelFeatureSelector",
+    "get_parameter_distribution_for_selector"
+]
+
+import numpy as np
+from scipy import sparse
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_selection import chi2
+
+
+SELECTION_SCORES = ('chi2', 'positive_df')
+
+
+class LabelFeatureSelector(BaseEstimator, TransformerMixin):
+    """Keeps the `k` highest scoring features of a binary label, computed
+    once when fitting on the sparse count matrix of the training samples.
+    Features occurring in fewer than `min_df` positive samples are always
+    removed, so features never seen with a positive are dropped before
+    ranking.
+
+    Parameters
+    ----------
+    score_func : str, optional, default: 'chi2'
+        The feature score to rank by. Either 'chi2', the chi-squared
+        statistic between each feature and the label, or 'positive_df', the
+        number of positive samples each feature occurs in.
+
+    k : int or None, optional, default: None
+        Maximum number of features kept. If None, all features passing
+        `min_df` are kept.
+
+    min_df : int, optional, default: 1
+        Minimum number of positive samples a feature must occur in.
+
+    Attributes
+    ----------
+    scores_ : :class:`np.ndarray`
+        The score of each input feature.
+
+    support_ : :class:`np.ndarray`
+        Boolean mask of the features kept.
+    """
+
+    def __init__(self, score_func='chi2', k=None, min_df=1):
+        self.score_func = score_func
+        self.k = k
+        self.min_df = min_df
+
+    def fit(self, X, y):
+        """Scores the features of `X` against the binary label `y`."""
+        if self.score_func not in SELECTION_SCORES:
+            raise ValueError("score_func must be one of {}.".format(
+                ', '.join(SELECTION_SCORES)))
+        if self.k is not None and self.k < 1:
+            raise ValueError("k must be a positive integer or None.")
+
+        X = sparse.csr_matrix(X)
+        y = np.asarray(y).ravel()
+        positive = X[y == 1]
+        positive_df = np.asarray(
+            (positive > 0).sum(axis=0), dtype=np.float64).ravel()
+
+        if self.score_func == 'chi2':
+            scores, _ = chi2(X, y)
+            scores = np.nan_to_num(scores)
+        else:
+            scores = positive_df
+
+        eligible = positive_df >= self.min_df
+        if not eligible.any():
+            # A fold without positive samples, nothing to select on.
+            eligible[:] = True
+
+        support = eligible
+        if self.k is not None and self.k < eligible.sum():
+            ranked = np.where(eligible, scores, -np.inf)
+            top = np.argsort(-ranked, kind='mergesort')[:self.k]
+            support = np.zeros(X.shape[1], dtype=bool)
+            support[top] = True
+
+        self.scores_ = scores
+        self.support_ = support
+        return self
+
+    def transform(self, X):
+        """Removes the features not selected from `X`."""
+        if X.shape[1] != len(self.support_):
+            raise ValueError(
+                "Expected {} features, found {}.".format(
+                    len(self.support_), X.shape[1])
+            )
+        return sparse.csr_matrix(X)[:, self.support_]
+
+    def get_support(self, indices=False):
+        """Returns the mask, or integer indices if `indices` is True, of
+        the features kept."""
+        if indices:
+            return np.flatnonzero(self.support_)
+        return self.support_
+
+
+def get_parameter_distribution_for_selector(step=None):
+    """Returns the parameter distribution of a :class:`LabelFeatureSelector`
+    for a grid search.
+
+    Parameters
+    ----------
+    step: str, optional, default: None
+        If the selector is placed inside a `Pipeline`, supply the step name
+        to prepend to the parameter keys.
+
+    Returns
+    -------
+    `dict`
+        Dictionary of parameters for the selector.
+    """
+    params = {
+        'k': [100, 250, 500, 1000, 2500, 5000, 10000, None],
+        'min_df': [1, 2, 3],
+    }
+    if step:
+        params = {
+            '{}__{}'.format(step, key): value
+            for (key, value) in params.items()
+        }
+    return params
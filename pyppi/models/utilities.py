@@ -37,6 +37,9 @@ from ..base.utilities import get_term_description, rename
 from ..base.constants import MAX_SEED
 
 from .classifier_chain import KRandomClassifierChains
+from .feature_selection import (
+    LabelFeatureSelector, get_parameter_distribution_for_selector
+)
 from .binary_relevance import MixedBinaryRelevanceClassifier
 
 logger = logging.getLogger("pyppi")
@@ -211,7 +214,8 @@ def make_classifier(algorithm, class_weight='balanced', random_state=None,
 def make_gridsearch_clf(model, rcv_splits=3, rcv_iter=30, scoring='f1',
                         binary=True, n_jobs_model=1, random_state=None,
                         search_vectorizer=True, n_jobs_gs=1, cv=None,
-                        make_pipeline=True, multilabel=True):
+                        make_pipeline=True, multilabel=True, projection=None,
+                        feature_selection=None):
     """Wrapper function to automate the mundane setup of a `Pipeline` classifier
     within a `RandomGridSearchCV` estimator. See the links below for more
     details on the parameters.
@@ -257,6 +261,19 @@ def make_gridsearch_clf(model, rcv_splits=3, rcv_iter=30, scoring='f1',
         Wrap the estimator defined in `model` in a pipeline with the first
         step being a `CountVectorizer`. Useful if your features are textual.
 
+    projection : transformer, optional, default: None
+        A transformer such as :class:`..data_mining.features.GOTermProjector`
+        added as the first step of the pipeline to reduce the vocabulary of
+        the `CountVectorizer`. Ignored if `make_pipeline` is False.
+
+    feature_selection : str or transformer, optional, default: None
+        A supervised feature selection step placed before the estimator,
+        fitted on the count matrix of each label. Either the `score_func` of
+        a :class:`.feature_selection.LabelFeatureSelector`, whose `k` and
+        `min_df` are added to the grid search parameter distribution, or a
+        transformer instance. If `make_pipeline` is False, the estimator is
+        wrapped in a `Pipeline` of the selector and estimator.
+
     Returns
     -------
     `estimator`
@@ -280,13 +297,29 @@ def make_gridsearch_clf(model, rcv_splits=3, rcv_iter=30, scoring='f1',
     base_estimator = make_classifier(
         model, random_state=model_random_state, n_jobs=n_jobs_model)
 
-    if make_pipeline:
+    selector = None
+    if isinstance(feature_selection, str):
+        selector = LabelFeatureSelector(score_func=feature_selection)
+    elif feature_selection is not None:
+        selector = clone(feature_selection)
+
+    if make_pipeline or selector is not None:
         params = get_parameter_distribution_for_model(model, step="estimator")
-        vectorizer = CountVectorizer(lowercase=False, binary=binary)
-        base_estimator = Pipeline(
-            steps=[('vectorizer', vectorizer), ('estimator', base_estimator)])
-        if search_vectorizer:
-            params['vectorizer__binary'] = [False, True]
+        steps = [('estimator', base_estimator)]
+        if selector is not None:
+            steps.insert(0, ('selector', selector))
+            if isinstance(selector, LabelFeatureSelector):
+                params.update(
+                    get_parameter_distribution_for_selector(step="selector")
+                )
+        if make_pipeline:
+            vectorizer = CountVectorizer(lowercase=False, binary=binary)
+            steps.insert(0, ('vectorizer', vectorizer))
+            if projection is not None:
+                steps.insert(0, ('projection', clone(projection)))
+            if search_vectorizer:
+                params['vectorizer__binary'] = [False, True]
+        base_estimator = Pipeline(steps=steps)
     else:
         params = get_parameter_distribution_for_model(model)
 
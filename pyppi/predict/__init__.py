@@ -9,7 +9,6 @@ utility functions for plotting, loading datasets, models and so on.
 import logging
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
 
 from sqlalchemy.orm import scoped_session
 
@@ -22,13 +21,15 @@ from ..database.exceptions import ObjectAlreadyExists
 from ..database.models import Protein, Interaction
 from ..database.utilities import (
     create_interaction, get_upid_to_protein_map,
-    get_source_taget_to_interactions_map
+    get_source_taget_to_interactions_map, update_feature_ids
+)
+from ..data_mining.feature_cache import (
+    FeatureCache, compute_interaction_features_cached
 )
-from ..data_mining.features import compute_interaction_features
 from ..data_mining.uniprot import (
-    parse_record_into_protein, parallel_download,
-    recent_accession
+    parse_record_into_protein, recent_accession
 )
+from ..data_mining.dat_index import fetch_records
 
 from .utilities import VALID_SELECTION, interactions_to_Xy_format
 
@@ -79,7 +80,7 @@ def _check_classifier_and_selection(classifier=None, selection=None):
 
 
 def _update_missing_protein_map(ppis, session, verbose=False, n_jobs=1,
-                                taxon_id=9606):
+                                taxon_id=9606, dat_index=None):
     to_download = set()
     uniprot_ids = [upid for tup in ppis for upid in tup if upid is not None]
 
@@ -104,8 +105,13 @@ def _update_missing_protein_map(ppis, session, verbose=False, n_jobs=1,
     #       (which *should* be caught by elif statement no.2).
     #
     # So really, there's only one thing to fix. TODO: Fix (1).
-    records = parallel_download(
-        to_download, n_jobs=n_jobs, verbose=verbose, taxon_id=taxon_id
+    #
+    # Records found in the local dat index are read from disk, only the
+    # remaining accessions are downloaded.
+    to_download = list(to_download)
+    records = fetch_records(
+        to_download, index=dat_index, n_jobs=n_jobs, verbose=verbose,
+        taxon_id=taxon_id
     )
 
     assert len(records) == len(to_download)
@@ -152,7 +158,7 @@ def _update_missing_protein_map(ppis, session, verbose=False, n_jobs=1,
 
 
 def _create_missing_interactions(ppis, protein_map, session, verbose=False,
-                                 taxon_id=9606, n_jobs=1):
+                                 taxon_id=9606, n_jobs=1, feature_cache=None):
     valid = []
     invalid = []
     id_ppis = []
@@ -191,19 +197,22 @@ def _create_missing_interactions(ppis, protein_map, session, verbose=False,
         new_interactions = {k: v for k, v in interactions.items() if v is None}
         feature_map = {}
         # The new interaction will need to have their features computed
-        # Do this in parallel to speed things up.
+        # Do this in parallel chunks to speed things up, skipping those
+        # already in the feature cache.
         if new_interactions:
             if verbose:
                 logger.info("Computing features for new interactions.")
-            features = Parallel(n_jobs=n_jobs)(
-                delayed(compute_interaction_features)(
-                    id_protein_map[source], id_protein_map[target]
-                )
+            pairs = [
+                (id_protein_map[source], id_protein_map[target])
                 for (source, target) in new_interactions
+            ]
+            features = compute_interaction_features_cached(
+                pairs, cache=feature_cache, n_jobs=n_jobs
             )
             for (source, target), features in zip(new_interactions, features):
                 feature_map[(source, target)] = features
 
+        new = []
         for (a, b), instance in interactions.items():
             if instance is None:
                 source = id_protein_map[a]
@@ -221,10 +230,12 @@ def _create_missing_interactions(ppis, protein_map, session, verbose=False,
                         source.uniprot_id, target.uniprot_id
                     ))
                 valid.append(interaction)
+                new.append(interaction)
             else:
                 valid.append(instance)
 
         try:
+            update_feature_ids(new, session=session)
             session.add_all(valid)
             session.commit()
         except:
@@ -235,7 +246,7 @@ def _create_missing_interactions(ppis, protein_map, session, verbose=False,
 
 
 def get_or_create_interactions(ppis, session=None, taxon_id=9606,
-                               verbose=False, n_jobs=1):
+                               verbose=False, n_jobs=1, feature_cache=None):
     """Parse an iterable of interactions in valid and invalid.
 
     Parse an iterable of either :py:class:`Interaction` instances or
@@ -280,6 +291,12 @@ def get_or_create_interactions(ppis, session=None, taxon_id=9606,
         computing features for new interactions. This can provide a nice speed 
         boost for large input.
 
+    feature_cache : :py:class:`FeatureCache` or `False`, Default: None
+        The cache consulted before computing the features of new
+        interactions, and updated with those computed. If None, the cache
+        saved in the home directory `~/.pyppi/` is used. Set as `False` to
+        always compute features.
+
     Returns
     -------
     `tuple` : (`list`, `list`, `dict`)
@@ -351,10 +368,20 @@ def get_or_create_interactions(ppis, session=None, taxon_id=9606,
             verbose=verbose, taxon_id=taxon_id
         )
         # Parse the interactions creating missing ones where required.
-        interactions, invalid = _create_missing_interactions(
-            ppis=unique_ppis, protein_map=protein_map, n_jobs=n_jobs,
-            session=session, verbose=verbose, taxon_id=taxon_id
-        )
+        default_cache = feature_cache is None
+        if default_cache:
+            feature_cache = FeatureCache()
+        elif feature_cache is False:
+            feature_cache = None
+        try:
+            interactions, invalid = _create_missing_interactions(
+                ppis=unique_ppis, protein_map=protein_map, n_jobs=n_jobs,
+                session=session, verbose=verbose, taxon_id=taxon_id,
+                feature_cache=feature_cache
+            )
+        finally:
+            if default_cache:
+                feature_cache.close()
         # _update_missing_protein_map and _create_missing_interactions
         # will add new instances to the current session. Commit these if
         # requested making sure to rollback changes if there's an error.
@@ -0,0 +1,182 @@
+"""
+This module contains a persistent store of vectorised design matrices. Each
+entry is a :class:`scipy.sparse.csr_matrix` saved with `save_npz` next to a
+JSON file holding the vocabulary, the `joint_id` and labels of each row and
+the row range of each dataset split. Entries are keyed by the feature
+selection, the vectorizer settings and the content version of the
+interaction table, which the database bumps on every write, so any change
+to the database content invalidates them.
+"""
+
+import os
+import glob
+import json
+import hashlib
+import logging
+from scipy import sparse
+from sqlalchemy import text
+
+from ..base.file_paths import design_matrix_cache_path
+from ..database import VERSIONED_TABLES
+from ..database.models import Interaction
+from ..data_mining.features import CROSS_FEATURE, N_CROSS_FEATURES
+from ..data_mining.ontology import get_active_instance, _get_index
+
+__all__ = [
+    'DesignMatrixCache',
+    'database_version'
+]
+
+logger = logging.getLogger("pyppi")
+
+MATRIX_CACHE_VERSION = 2
+
+
+def database_version(session=None, proteins=False):
+    """Returns the content version of the interaction table. Versions are
+    read from the `content_version` table, which triggers created by
+    :func:`..database.init_database` bump on every insert, update and
+    delete, so no rows of the interaction table are read.
+
+    Parameters
+    ----------
+    session : :class:`scoped_session`, optional.
+        The session to query. Leave as None to use the session
+        `Interaction.query` is bound to.
+
+    proteins : bool, optional, default: False
+        Also include the version of the protein table, which the hashed
+        'cross' feature is computed from.
+
+    Returns
+    -------
+    str
+        The versions of the tables.
+    """
+    if session is None:
+        session = Interaction.query.session
+    rows = session.execute(text("SELECT name, version FROM content_version"))
+    versions = {name: version for (name, version) in rows}
+    tables = VERSIONED_TABLES if proteins else ('interaction',)
+    return ','.join(
+        '{}:{}'.format(table, versions[table]) for table in tables
+    )
+
+
+class DesignMatrixCache(object):
+    """Directory of vectorised design matrices, one entry per dataset.
+    Saving an entry replaces any older entry of the same dataset.
+
+    Parameters
+    ----------
+    directory : str, optional, default: `design_matrix_cache_path`
+        Directory to save entries to.
+
+    session : :class:`scoped_session`, optional.
+        The session the database version is read from. Leave as None to use
+        the session `Interaction.query` is bound to.
+
+    dag : :class:`..data_mining.ontology.GODag`, optional, default: None
+        The dag the 'cross' feature is computed with. If None, the default
+        global dag instance will be used.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from the cache.
+
+    misses : int
+        Number of lookups that had to be vectorised.
+    """
+
+    def __init__(self, directory=design_matrix_cache_path, session=None,
+                 dag=None):
+        self.directory = directory
+        self.session = session
+        self.dag = dag
+        self.hits = 0
+        self.misses = 0
+
+    def _paths(self, dataset, key):
+        prefix = os.path.join(self.directory, '{}-{}'.format(dataset, key))
+        return '{}.npz'.format(prefix), '{}.json'.format(prefix)
+
+    def key(self, dataset, selection, binary=False,
+            n_cross_features=N_CROSS_FEATURES, vocabulary=None, **params):
+        """Returns the key of the design matrix of `dataset` vectorised with
+        the given settings from the current database content. Additional
+        keyword parameters, such as the taxonomy id, are included in the
+        key."""
+        selection = [getattr(attr, 'value', attr) for attr in selection]
+        crosses = CROSS_FEATURE in selection
+        settings = {
+            'cache_version': MATRIX_CACHE_VERSION,
+            'dataset': dataset,
+            'selection': selection,
+            'binary': bool(binary),
+            'params': params,
+            'database': database_version(self.session, proteins=crosses),
+        }
+        if crosses:
+            dag = self.dag if self.dag is not None else get_active_instance()
+            settings['n_cross_features'] = n_cross_features
+            settings['dag'] = _get_index(dag).fingerprint()
+        if vocabulary is not None:
+            settings['vocabulary'] = sorted(vocabulary.items())
+        encoded = json.dumps(settings, sort_keys=True).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()
+
+    def get(self, dataset, key):
+        """Loads the entry of `dataset` saved under `key`.
+
+        Returns
+        -------
+        `tuple` or None
+            The design matrix and a `dict` with the keys `vocabulary`,
+            `joint_ids`, `labels` and `splits`, or None if there is no
+            readable entry.
+        """
+        matrix_path, meta_path = self._paths(dataset, key)
+        try:
+            X = sparse.load_npz(matrix_path).tocsr()
+            with open(meta_path, 'rt') as fp:
+                meta = json.load(fp)
+        except (OSError, ValueError) as e:
+            if os.path.exists(matrix_path) or os.path.exists(meta_path):
+                logger.warning("Ignoring design matrix '{}': {}".format(
+                    matrix_path, e))
+            self.misses += 1
+            return None
+        self.hits += 1
+        return X, meta
+
+    def put(self, dataset, key, X, vocabulary, joint_ids, labels,
+            splits=None):
+        """Saves the design matrix `X` of `dataset` under `key`, replacing
+        any older entry of `dataset`. `joint_ids` and `labels` hold the
+        `joint_id` and list of labels of each row and `splits` maps the
+        name of each split to its `[start, end)` row range."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.clear(dataset)
+        matrix_path, meta_path = self._paths(dataset, key)
+        meta = {
+            'vocabulary': vocabulary,
+            'joint_ids': list(joint_ids),
+            'labels': [list(l) for l in labels],
+            'splits': splits or {dataset: [0, X.shape[0]]},
+        }
+
+        # Written to temporary files first so an interrupted save never
+        # leaves a partial entry behind.
+        tmp_matrix = '{}.tmp.npz'.format(matrix_path)
+        sparse.save_npz(tmp_matrix, sparse.csr_matrix(X), compressed=False)
+        with open('{}.tmp'.format(meta_path), 'wt') as fp:
+            json.dump(meta, fp)
+        os.replace('{}.tmp'.format(meta_path), meta_path)
+        os.replace(tmp_matrix, matrix_path)
+
+    def clear(self, dataset=None):
+        """Removes the entries of `dataset`, or all entries if None."""
+        pattern = '{}-*'.format('*' if dataset is None else dataset)
+        for path in glob.glob(os.path.join(self.directory, pattern)):
+            os.remove(path)
@@ -4,14 +4,22 @@ import numpy as np
 import bz2
 import gzip
 from numpy.random import RandomState
+from scipy import sparse
 
 from ..base.constants import MAX_SEED
 from ..base.utilities import rename
-from ..database.models import Interaction
+from ..database import db_session
+from ..database.models import Interaction, Protein, FeatureToken
 from ..database.utilities import (
     full_training_network, training_interactions,
-    interactome_interactions, holdout_interactions
+    interactome_interactions, holdout_interactions,
+    interaction_similarity_features, update_feature_ids,
+    unpack_feature_ids, FEATURE_COLUMNS
 )
+from ..data_mining.features import (
+    CROSS_FEATURE, N_CROSS_FEATURES, compute_cross_features_many
+)
+from .matrix_cache import DesignMatrixCache
 
 from ..model_selection.sampling import IterativeStratifiedKFold
 from ..models.utilities import publication_ensemble, make_gridsearch_clf
@@ -45,7 +53,8 @@ VALID_SELECTION = (
 
 def paper_model(labels, rcv_splits=3, rcv_iter=30, scoring='f1', cv=None,
                 n_jobs_model=1, n_jobs_br=1, n_jobs_gs=1, random_state=None,
-                verbose=False, use_pipeline=True):
+                verbose=False, use_pipeline=True, projection=None,
+                feature_selection=None):
     """This creates a :class:`MixedBinaryRelevanceClassifier`. A `Pipeline`
     classifier with the estimator step being a `RandomizedGridSearch`
     classifier is created. The estimator inside the grid search for
@@ -92,6 +101,15 @@ def paper_model(labels, rcv_splits=3, rcv_iter=30, scoring='f1', cv=None,
         If True, wraps each classifier in a pipeline with a `CountVectorizer` 
         as the first step so features can be transformed automatically.
 
+    projection : transformer, optional, default: None
+        A transformer such as :class:`..data_mining.features.GOTermProjector`
+        to place before the `CountVectorizer` in each pipeline. Ignored if
+        `use_pipeline` is False.
+
+    feature_selection : str or transformer, optional, default: None
+        A supervised feature selection step fitted on the count matrix of
+        each label before its estimator, as in :func:`make_gridsearch_clf`.
+
     Returns
     -------
     :class:`MixedBinaryRelevanceClassifier`
@@ -110,7 +128,8 @@ def paper_model(labels, rcv_splits=3, rcv_iter=30, scoring='f1', cv=None,
             model, rcv_splits=rcv_splits, rcv_iter=rcv_iter, scoring=scoring,
             n_jobs_model=n_jobs_model, n_jobs_gs=n_jobs_gs, cv=cv,
             search_vectorizer=True, random_state=random_state,
-            make_pipeline=use_pipeline
+            make_pipeline=use_pipeline, projection=projection,
+            feature_selection=feature_selection
         )
         estimators.append(rcv)
     return MixedBinaryRelevanceClassifier(
@@ -118,10 +137,12 @@ def paper_model(labels, rcv_splits=3, rcv_iter=30, scoring='f1', cv=None,
     )
 
 
-def interactions_to_Xy_format(interactions, selection):
+def interactions_to_Xy_format(interactions, selection, similarity=None):
     """Takes a list of :class:`Interaction` instances and converts them
     into `X, y` format. No vectorisation or binarisation is computed
-    during this function.
+    during this function. If `similarity` is set, the numeric GO semantic
+    similarity features of each interaction are returned as a third
+    element.
 
     Parameters
     ----------
@@ -132,14 +153,29 @@ def interactions_to_Xy_format(interactions, selection):
         List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
         'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam'.
 
+    similarity : bool or array-like, optional, default: None
+        If True, also compute the Resnik, Lin and best-match average GO
+        similarity columns named by
+        :func:`..data_mining.similarity.similarity_feature_names` using the
+        stored information content of the :class:`Protein` table. An
+        information content array may be passed instead.
+
     Returns
     -------
     `tuple`
         X and y. X is a list of comma delimited strings containing the features
         from each interaction. Y is a list of string labels taken straight
-        from each instance. Both X and y have length n_interactions.
+        from each instance. Both X and y have length n_interactions. If
+        `similarity` is set, the third element is a float array of shape
+        (n_interactions, n_similarity_features).
     """
 
+    if CROSS_FEATURE in [getattr(a, 'value', a) for a in selection]:
+        raise ValueError(
+            "The hashed '{}' feature is only available from "
+            "`interactions_to_csr`.".format(CROSS_FEATURE)
+        )
+
     X = list(range(len(list(interactions))))  # pre-allocate
     y = list(range(len(list(interactions))))
     for i, interaction in enumerate(interactions):
@@ -164,9 +200,130 @@ def interactions_to_Xy_format(interactions, selection):
         X[i] = x.replace(":", "")
         y[i] = label
 
+    if similarity is not None and similarity is not False:
+        ic = None if similarity is True else similarity
+        S = interaction_similarity_features(list(interactions), ic=ic)
+        return np.asarray(X), y, S
     return np.asarray(X), y
 
 
+def interactions_to_csr(interactions, selection, vocabulary=None,
+                        binary=False, session=None,
+                        n_cross_features=N_CROSS_FEATURES, dag=None):
+    """Assembles the design matrix of the textual features of `interactions`
+    directly from their packed `feature_ids`, without any string
+    processing. The result is identical to the output of a
+    `CountVectorizer(lowercase=False)` fitted on the `X` returned by
+    :func:`interactions_to_Xy_format`. Interactions without `feature_ids`
+    are encoded with :func:`..database.utilities.update_feature_ids` first.
+
+    Parameters
+    ----------
+    interactions : list
+        List of :class:`Interaction` instances.
+
+    selection : list
+        List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
+        'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam' and
+        'cross'. The 'cross' feature hashes each source term x target term
+        cross with :func:`..data_mining.features.compute_cross_features_many`
+        into `n_cross_features` columns appended after the vocabulary.
+
+    vocabulary : dict, optional, default: None
+        Mapping of tokens to columns, such as the `vocabulary_` of a fitted
+        `CountVectorizer` or the vocabulary returned for the training
+        interactions. Tokens not in `vocabulary` are ignored. If None, the
+        vocabulary is built from the tokens of `interactions` in sorted
+        order.
+
+    binary : bool, optional, default: False
+        If True, all non-zero counts are set to 1.
+
+    session : :class:`scoped_session`, optional.
+        The session to read tokens from and save new tokens to. Leave as
+        None to use the default session.
+
+    n_cross_features : int, optional, default: 2 ** 20
+        Number of columns of the hashed 'cross' feature. Ignored if 'cross'
+        is not selected.
+
+    dag : :class:`..data_mining.ontology.GODag`, optional, default: None
+        The dag used to resolve the GO annotations of the 'cross' feature.
+        If None, the default global dag instance will be used.
+
+    Returns
+    -------
+    `tuple`
+        A :class:`sparse.csr_matrix` of shape `(n_interactions,
+        len(vocabulary))`, plus `n_cross_features` columns if 'cross' is
+        selected, and the vocabulary mapping tokens to columns.
+    """
+    if session is None:
+        session = db_session
+    interactions = list(interactions)
+    selection = [getattr(attr, 'value', attr) for attr in selection]
+    crosses = CROSS_FEATURE in selection
+    columns = [
+        FEATURE_COLUMNS.index(attr) for attr in selection
+        if attr != CROSS_FEATURE
+    ]
+
+    stale = [i for i in interactions if i.feature_ids is None]
+    if stale:
+        update_feature_ids(stale, session=session, commit=True)
+
+    ids = []
+    lengths = np.zeros(len(interactions), dtype=np.int64)
+    for row, interaction in enumerate(interactions):
+        groups = unpack_feature_ids(interaction.feature_ids)
+        for column in columns:
+            ids.append(groups[column])
+            lengths[row] += len(groups[column])
+    ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+    rows = np.repeat(np.arange(len(interactions)), lengths)
+
+    tokens = dict(session.query(FeatureToken.id, FeatureToken.token).all())
+    if vocabulary is None:
+        vocabulary = {
+            token: column for (column, token) in
+            enumerate(sorted(tokens[i] for i in np.unique(ids).tolist()))
+        }
+
+    lookup = np.full(max(tokens.keys(), default=0) + 1, -1, dtype=np.int64)
+    for i, token in tokens.items():
+        lookup[i] = vocabulary.get(token, -1)
+    cols = lookup[ids]
+    keep = cols >= 0
+
+    X = sparse.csr_matrix(
+        (np.ones(keep.sum(), dtype=np.int64), (rows[keep], cols[keep])),
+        shape=(len(interactions), len(vocabulary))
+    )
+    X.sum_duplicates()
+
+    if crosses:
+        ids = sorted(
+            set(i.source for i in interactions) |
+            set(i.target for i in interactions)
+        )
+        proteins = {}
+        # Chunk the id list to stay below the sqlite variable limit.
+        for start in range(0, len(ids), 500):
+            query = session.query(Protein).filter(
+                Protein.id.in_(ids[start:start + 500])
+            )
+            proteins.update((p.id, p) for p in query.all())
+        X_cross = compute_cross_features_many(
+            [(proteins[i.source], proteins[i.target]) for i in interactions],
+            n_features=n_cross_features, dag=dag
+        )
+        X = sparse.hstack([X, X_cross], format='csr')
+
+    if binary:
+        X.data[:] = 1
+    return X, vocabulary
+
+
 def load_dataset(interactions, labels=None, selection=DEFAULT_SELECTION):
     """Takes a list of :class:`Interaction` instances and converts them
     into `X, y` format. No vectorisation of the textual features is computed
@@ -212,7 +369,115 @@ def load_dataset(interactions, labels=None, selection=DEFAULT_SELECTION):
         return X, y
 
 
-def load_training_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
+def vectorize_datasets(dataset, splits, selection, binary=False,
+                       vocabulary=None, cache=None, session=None, **params):
+    """Vectorises the interactions of each split of `dataset` with
+    :func:`interactions_to_csr` over a vocabulary shared by all splits,
+    loading the result from `cache` when the database has not changed since
+    it was saved. Interactions without `feature_ids` are encoded first.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the dataset the cache entry is saved under.
+
+    splits : dict
+        Mapping of split names to queries of :class:`Interaction` instances.
+        The queries are only run if the dataset is not cached.
+
+    selection : list
+        List of annotations to use, as in :func:`interactions_to_csr`.
+
+    binary : bool, optional, default: False
+        If True, all non-zero counts are set to 1.
+
+    vocabulary : dict, optional, default: None
+        Mapping of tokens to columns. If None, the vocabulary is built from
+        the tokens of all splits in sorted order.
+
+    cache : :class:`.matrix_cache.DesignMatrixCache` or bool, optional
+        The cache to load from and save to. If None, the default cache is
+        used. Use False to always vectorise from the database.
+
+    session : :class:`scoped_session`, optional.
+        The session to read and save tokens with. Leave as None to use the
+        session `Interaction.query` is bound to.
+
+    **params : dict
+        Additional parameters the splits were queried with, such as the
+        taxonomy id, included in the cache key.
+
+    Returns
+    -------
+    `tuple`
+        A `dict` mapping each split name to a tuple of its design matrix,
+        the `joint_id` of each row and the list of labels of each row, and
+        the vocabulary mapping tokens to columns.
+    """
+    if session is None:
+        session = Interaction.query.session
+    if cache is None:
+        cache = DesignMatrixCache(session=session)
+    if vocabulary is not None:
+        vocabulary = {token: int(i) for (token, i) in vocabulary.items()}
+
+    # Entries are only saved once every row has its feature ids, and any
+    # write changes the database version in the key, so a hit needs no
+    # scan for stale rows.
+    if cache is not False:
+        entry = cache.get(dataset, cache.key(
+            dataset, selection, binary=binary, vocabulary=vocabulary,
+            **params
+        ))
+        if entry is not None:
+            X, meta = entry
+            result = {
+                name: (
+                    X[start:end], meta['joint_ids'][start:end],
+                    meta['labels'][start:end]
+                )
+                for name, (start, end) in meta['splits'].items()
+            }
+            return result, meta['vocabulary']
+
+    stale = session.query(Interaction).filter(
+        Interaction.feature_ids.is_(None)
+    ).all()
+    if stale:
+        update_feature_ids(stale, session=session, commit=True)
+    if cache is not False:
+        key = cache.key(
+            dataset, selection, binary=binary, vocabulary=vocabulary,
+            **params
+        )
+
+    interactions = []
+    bounds = {}
+    for name, query in splits.items():
+        rows = query.all()
+        bounds[name] = [len(interactions), len(interactions) + len(rows)]
+        interactions.extend(rows)
+
+    X, vocabulary = interactions_to_csr(
+        interactions, selection, vocabulary=vocabulary, binary=binary,
+        session=session, dag=None if cache is False else cache.dag
+    )
+    joint_ids = [i.joint_id for i in interactions]
+    labels = [i.labels_as_list for i in interactions]
+    if cache is not False:
+        cache.put(
+            dataset, key, X, vocabulary, joint_ids, labels, splits=bounds
+        )
+
+    result = {
+        name: (X[start:end], joint_ids[start:end], labels[start:end])
+        for name, (start, end) in bounds.items()
+    }
+    return result, vocabulary
+
+
+def load_training_dataset(taxon_id=9606, selection=DEFAULT_SELECTION,
+                          vectorize=False, binary=False, cache=None):
     """Loads the :func:`full_training_network` and converts these into
     X, the textual features of each interaction as defined by `selection`,
     and y, the binary multi-label indicator matrix output by a
@@ -229,13 +494,46 @@ def load_training_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
         List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
         'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam'.
 
+    vectorize : bool, optional, default: False
+        If True, X is the sparse count matrix returned by
+        :func:`vectorize_datasets` instead of textual features.
+
+    binary : bool, optional, default: False
+        If True, all non-zero counts are set to 1. Ignored unless
+        `vectorize` is True.
+
+    cache : :class:`.matrix_cache.DesignMatrixCache` or bool, optional
+        The design matrix cache passed to :func:`vectorize_datasets`.
+        Ignored unless `vectorize` is True.
+
     Returns
     -------
     `dict`
         The data dictionary. The key `training` has the (X, y) tuple, `labels`
         points to the sorted list of labels parsed from the interactions and
-        `binarizer` points to the fitted `MultiLabelBinarizer`.
+        `binarizer` points to the fitted `MultiLabelBinarizer`. If `vectorize`
+        is True, `vocabulary` points to the mapping of tokens to columns and
+        `joint_ids` maps `training` to the `joint_id` of each row.
     """
+    if vectorize:
+        splits, vocabulary = vectorize_datasets(
+            'training', {'training': full_training_network(taxon_id)},
+            selection, binary=binary, cache=cache, taxon_id=taxon_id
+        )
+        X_train, joint_ids, y_train = splits['training']
+        if not joint_ids:
+            return {}
+        labels = set(l for ls in y_train for l in ls)
+        mlb = MultiLabelBinarizer(classes=sorted(labels))
+        y_train = mlb.fit_transform(y_train)
+        return {
+            "training": (X_train, y_train),
+            'labels': list(sorted(labels)),
+            'binarizer': mlb,
+            'vocabulary': vocabulary,
+            'joint_ids': {'training': joint_ids}
+        }
+
     training = full_training_network(taxon_id)
     labels = set()
     for interaction in training.all():
@@ -254,7 +552,8 @@ def load_training_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
     }
 
 
-def load_validation_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
+def load_validation_dataset(taxon_id=9606, selection=DEFAULT_SELECTION,
+                            vectorize=False, binary=False, cache=None):
     """Loads all training and holdout interactions and converts these into
     X, the textual features of each interaction as defined by `selection`,
     and y, the binary multi-label indicator matrix output by a
@@ -272,6 +571,19 @@ def load_validation_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
         List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
         'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam'.
 
+    vectorize : bool, optional, default: False
+        If True, X is the sparse count matrix returned by
+        :func:`vectorize_datasets` instead of textual features. The training
+        and holdout matrices share one vocabulary.
+
+    binary : bool, optional, default: False
+        If True, all non-zero counts are set to 1. Ignored unless
+        `vectorize` is True.
+
+    cache : :class:`.matrix_cache.DesignMatrixCache` or bool, optional
+        The design matrix cache passed to :func:`vectorize_datasets`.
+        Ignored unless `vectorize` is True.
+
     Returns
     -------
     `dict`
@@ -279,8 +591,38 @@ def load_validation_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
         points to the sorted list of labels parsed from the interactions and
         `binarizer` points to the fitted `MultiLabelBinarizer`. If holdout interactions
         were found, the key `testing` points to the (X, y) tuple for the training
-        samples.
+        samples. If `vectorize` is True, `vocabulary` points to the mapping of
+        tokens to columns and `joint_ids` maps `training` and `testing` to
+        the `joint_id` of each row.
     """
+    if vectorize:
+        splits, vocabulary = vectorize_datasets(
+            'validation', {
+                'training': training_interactions(
+                    strict=True, taxon_id=taxon_id),
+                'testing': holdout_interactions(
+                    strict=True, taxon_id=taxon_id)
+            },
+            selection, binary=binary, cache=cache, taxon_id=taxon_id
+        )
+        X_train, train_ids, y_train = splits['training']
+        X_test, test_ids, y_test = splits['testing']
+        if not train_ids:
+            return {}
+        labels = set(l for ls in y_train for l in ls)
+        mlb = MultiLabelBinarizer(classes=sorted(labels))
+        data = {
+            'labels': list(sorted(labels)),
+            'training': (X_train, mlb.fit_transform(y_train)),
+            'binarizer': mlb,
+            'vocabulary': vocabulary,
+            'joint_ids': {'training': train_ids}
+        }
+        if test_ids:
+            data['testing'] = (X_test, mlb.transform(y_test))
+            data['joint_ids']['testing'] = test_ids
+        return data
+
     training = training_interactions(strict=True, taxon_id=taxon_id)
     labels = set()
     for interaction in training.all():
@@ -306,7 +648,9 @@ def load_validation_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
     return data
 
 
-def load_interactome_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
+def load_interactome_dataset(taxon_id=9606, selection=DEFAULT_SELECTION,
+                             vectorize=False, vocabulary=None, binary=False,
+                             cache=None):
     """Loads the :func:`interactome_interactions` and converts these into
     X, the textual features of each interaction as defined by `selection`.
 
@@ -320,11 +664,38 @@ def load_interactome_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
         List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
         'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam'.
 
+    vectorize : bool, optional, default: False
+        If True, X is the sparse count matrix returned by
+        :func:`vectorize_datasets` instead of textual features.
+
+    vocabulary : dict, optional, default: None
+        Mapping of tokens to columns, usually the vocabulary of the training
+        dataset. Ignored unless `vectorize` is True.
+
+    binary : bool, optional, default: False
+        If True, all non-zero counts are set to 1. Ignored unless
+        `vectorize` is True.
+
+    cache : :class:`.matrix_cache.DesignMatrixCache` or bool, optional
+        The design matrix cache passed to :func:`vectorize_datasets`.
+        Ignored unless `vectorize` is True.
+
     Returns
     -------
-    `list`
-        List of str textual features for each interaction.
+    `list` or `tuple`
+        List of str textual features for each interaction. If `vectorize`
+        is True, the sparse count matrix and the `joint_id` of each row.
     """
+    if vectorize:
+        splits, _ = vectorize_datasets(
+            'interactome',
+            {'interactome': interactome_interactions(taxon_id)},
+            selection, binary=binary, vocabulary=vocabulary, cache=cache,
+            taxon_id=taxon_id
+        )
+        X_test, joint_ids, _ = splits['interactome']
+        return X_test, joint_ids
+
     interactome = interactome_interactions(taxon_id).all()
     X_test, _ = interactions_to_Xy_format(interactome, selection)
     return X_test
@@ -332,7 +703,8 @@ def load_interactome_dataset(taxon_id=9606, selection=DEFAULT_SELECTION):
 
 def train_paper_model(rcv_splits=3, rcv_iter=60, scoring='f1', n_jobs_model=1,
                       n_jobs_br=1, n_jobs_gs=1, random_state=42, taxon_id=9606,
-                      verbose=False, selection=DEFAULT_SELECTION):
+                      verbose=False, selection=DEFAULT_SELECTION,
+                      projection=None, feature_selection=None):
     """Calls :func:`paper_model` and trains the returned model on
     all interaction instances that are strictly training (`is_training` flag
     is True) as returned by :func:`load_training_dataset`.
@@ -373,6 +745,14 @@ def train_paper_model(rcv_splits=3, rcv_iter=60, scoring='f1', n_jobs_model=1,
         List of annotations to use. Select from 'go_mf', 'go_cc', 'go_bp',
         'ulca_go_mf', 'ulca_go_cc', 'ulca_go_bp', 'interpro', 'pfam'.
 
+    projection : transformer, optional, default: None
+        A transformer such as :class:`..data_mining.features.GOTermProjector`
+        to place before the `CountVectorizer` in each pipeline.
+
+    feature_selection : str or transformer, optional, default: None
+        A supervised feature selection step fitted on the count matrix of
+        each label before its estimator, as in :func:`make_gridsearch_clf`.
+
     Returns
     -------
     `tuple`
@@ -398,7 +778,8 @@ def train_paper_model(rcv_splits=3, rcv_iter=60, scoring='f1', n_jobs_model=1,
     clf = paper_model(
         labels=labels, cv=cv_iter, rcv_iter=rcv_iter,
         scoring=scoring, n_jobs_gs=n_jobs_gs, n_jobs_br=n_jobs_br,
-        random_state=random_state, n_jobs_model=n_jobs_model, verbose=verbose
+        random_state=random_state, n_jobs_model=n_jobs_model, verbose=verbose,
+        projection=projection, feature_selection=feature_selection
     )
     clf.fit(X, y)
     return clf, selection, mlb
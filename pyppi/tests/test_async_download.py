@@ -0,0 +1,273 @@
+import io
+import os
+import time
+import asyncio
+import threading
+from collections import Counter
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from Bio import SwissProt
+from unittest import TestCase
+
+from ..data_mining.async_download import TokenBucket, async_download
+
+base_path = os.path.dirname(__file__)
+records_path = os.path.normpath(
+    "{}/test_data/test_sprot_records.dat".format(base_path)
+)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Serves the test records at /<accession>.txt, and the concatenated
+    # records of many accessions at /accessions?accessions=<a>,<b>. Accessions
+    # listed in `server.failures` first answer with the given status that
+    # many times, as does a batch request keyed by its comma separated
+    # accessions. Batch requests are counted under 'batch'. Accessions in
+    # `server.omitted` are left out of batch responses. Accessions in
+    # `server.redirects` are redirected to the given URL, or to the record of
+    # the given accession.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition('?')
+        if path == '/accessions':
+            key = parse_qs(query)['accessions'][0]
+            accessions = key.split(',')
+            accession = 'batch'
+        else:
+            accessions = None
+            key = accession = path.strip('/').split('.')[0]
+        with server.lock:
+            server.requests[accession] += 1
+            server.clients.add(self.client_address)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            failure = server.failures.get(key, None)
+            if failure is not None and failure[1] > 0:
+                server.failures[key] = (failure[0], failure[1] - 1)
+        try:
+            time.sleep(server.delay)
+            if failure is not None and failure[1] > 0:
+                self.send_response(failure[0])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            redirect = server.redirects.get(accession, None)
+            if redirect is not None:
+                self.send_response(301)
+                self.send_header('Location', redirect if '/' in redirect
+                                 else '/{}.txt'.format(redirect))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if accessions is not None:
+                text = ''.join(
+                    server.records[a] for a in accessions
+                    if a in server.records and a not in server.omitted
+                )
+            else:
+                text = server.records.get(accession, None)
+            if text is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = text.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            if server.chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i in range(0, len(body), 100):
+                    chunk = body[i:i + 100]
+                    self.wfile.write(
+                        '{:x}\r\n'.format(len(chunk)).encode('ascii'))
+                    self.wfile.write(chunk + b'\r\n')
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class TestAsyncDownload(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(records_path, 'rt') as fp:
+            text = fp.read().rstrip('\n') + '\n'
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.server.records = {}
+        for block in text.split('//\n'):
+            if block.strip():
+                record = SwissProt.read(io.StringIO(block + '//\n'))
+                for accession in record.accessions:
+                    cls.server.records[accession] = block + '//\n'
+        cls.url = "http://127.0.0.1:{}/{{}}.txt".format(
+            cls.server.server_address[1])
+        cls.batch_url = "http://127.0.0.1:{}/accessions?accessions={{}}".format(
+            cls.server.server_address[1])
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.lock = threading.Lock()
+        self.server.requests = Counter()
+        self.server.clients = set()
+        self.server.failures = {}
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.delay = 0
+        self.server.chunked = False
+        self.server.omitted = set()
+        self.server.redirects = {}
+
+    def test_downloads_records_in_order(self):
+        accessions = ['Q04917', 'P31946', 'XXXXXX', 'P62258']
+        records = async_download(accessions, url=self.url, taxon_id=None)
+        self.assertEqual(
+            [None if r is None else r.accessions[0] for r in records],
+            ['Q04917', 'P31946', None, 'P62258']
+        )
+        self.assertEqual(records[1].entry_name, '1433B_HUMAN')
+
+    def test_reads_chunked_responses(self):
+        self.server.chunked = True
+        records = async_download(
+            ['P31946', 'P62258'], url=self.url, max_concurrency=1,
+            taxon_id=None
+        )
+        self.assertEqual(
+            [r.accessions[0] for r in records], ['P31946', 'P62258']
+        )
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_filters_non_matching_taxon_id(self):
+        records = async_download(['P31946'], url=self.url, taxon_id=10090)
+        self.assertEqual(records, [None])
+
+    def test_retries_retryable_status_with_backoff(self):
+        self.server.failures = {'P31946': (503, 2), 'P62258': (500, 5)}
+        records = async_download(
+            ['P31946', 'P62258'], url=self.url, retries=2, backoff=0.01,
+            taxon_id=None
+        )
+        self.assertEqual(records[0].accessions[0], 'P31946')
+        self.assertIsNone(records[1])
+        self.assertEqual(self.server.requests['P31946'], 3)
+        self.assertEqual(self.server.requests['P62258'], 3)
+
+    def test_follows_redirects_to_same_host(self):
+        self.server.redirects = {
+            'OLD1': 'OLD2', 'OLD2': 'P31946', 'LOOP': 'LOOP',
+            'AWAY': 'http://localhost:1/P31946.txt',
+        }
+        records = async_download(
+            ['OLD1', 'LOOP', 'AWAY'], url=self.url, taxon_id=None
+        )
+        self.assertEqual(records[0].accessions[0], 'P31946')
+        self.assertEqual(records[1:], [None, None])
+        self.assertEqual(self.server.requests['P31946'], 1)
+        self.assertEqual(self.server.requests['LOOP'], 6)
+        self.assertEqual(self.server.requests['AWAY'], 1)
+
+    def test_does_not_retry_missing_record(self):
+        records = async_download(['XXXXXX'], url=self.url, backoff=0.01)
+        self.assertEqual(records, [None])
+        self.assertEqual(self.server.requests['XXXXXX'], 1)
+
+    def test_limits_concurrency_and_reuses_connections(self):
+        self.server.delay = 0.05
+        accessions = ['P31946', 'P62258', 'Q04917'] * 4
+        records = async_download(
+            accessions, url=self.url, max_concurrency=2, taxon_id=None
+        )
+        self.assertTrue(all(r is not None for r in records))
+        self.assertLessEqual(self.server.max_active, 2)
+        self.assertLessEqual(len(self.server.clients), 2)
+
+    def test_rate_limit_spaces_requests(self):
+        start = time.monotonic()
+        records = async_download(
+            ['P31946'] * 5, url=self.url, rate=20, burst=1, taxon_id=None
+        )
+        self.assertTrue(all(r is not None for r in records))
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_batches_accessions_per_request(self):
+        self.server.chunked = True
+        accessions = ['Q04917', 'P31946', 'P62258', 'XXXXXX', 'A8K9K2']
+        records = async_download(
+            accessions, url=self.url, batch_url=self.batch_url,
+            batch_size=2, taxon_id=None
+        )
+        self.assertEqual(
+            [None if r is None else r.accessions[0] for r in records],
+            ['Q04917', 'P31946', 'P62258', None, 'P31946']
+        )
+        self.assertEqual(self.server.requests['batch'], 3)
+        # Only the accession without a record is requested on its own.
+        self.assertEqual(sum(self.server.requests.values()), 4)
+        self.assertEqual(self.server.requests['XXXXXX'], 1)
+
+    def test_batch_falls_back_per_omitted_accession(self):
+        self.server.omitted = {'P62258'}
+        records = async_download(
+            ['P31946', 'P62258', 'Q04917'], url=self.url,
+            batch_url=self.batch_url, batch_size=2, taxon_id=None
+        )
+        self.assertTrue(all(r is not None for r in records))
+        self.assertEqual(self.server.requests['batch'], 2)
+        self.assertEqual(self.server.requests['P31946'], 0)
+        self.assertEqual(self.server.requests['P62258'], 1)
+        self.assertEqual(self.server.requests['Q04917'], 0)
+
+    def test_failed_batch_is_not_retried_per_accession(self):
+        self.server.failures = {'P31946,P62258': (503, 2)}
+        records = async_download(
+            ['P31946', 'P62258', 'Q04917'], url=self.url,
+            batch_url=self.batch_url, batch_size=2, retries=1,
+            backoff=0.01, taxon_id=None
+        )
+        self.assertEqual(records[:2], [None, None])
+        self.assertEqual(records[2].accessions[0], 'Q04917')
+        self.assertEqual(self.server.requests['batch'], 3)
+        self.assertEqual(self.server.requests['P31946'], 0)
+        self.assertEqual(self.server.requests['P62258'], 0)
+
+    def test_batch_filters_non_matching_taxon_id(self):
+        records = async_download(
+            ['P31946', 'P62258'], url=self.url, batch_url=self.batch_url,
+            batch_size=2, taxon_id=10090
+        )
+        self.assertEqual(records, [None, None])
+        self.assertEqual(self.server.requests['P31946'], 0)
+
+    def test_token_bucket_allows_bursts(self):
+        async def acquire(bucket, n):
+            start = time.monotonic()
+            for _ in range(n):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(acquire(TokenBucket(5, 10), 10)), 0.1)
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
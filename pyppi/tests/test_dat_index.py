@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+from Bio import SwissProt
+from unittest import TestCase
+
+from ..database import create_session, delete_database, cleanup_database
+from ..database.models import Protein
+from ..data_mining.dat_index import (
+    DatIndex, index_records, fetch_records, map_accessions
+)
+
+base_path = os.path.dirname(__file__)
+db_path = os.path.normpath("{}/databases/test.db".format(base_path))
+records_path = os.path.normpath(
+    "{}/test_data/test_sprot_records.dat".format(base_path)
+)
+records_gz_path = os.path.normpath(
+    "{}/test_data/test_sprot_records.dat.gz".format(base_path)
+)
+
+
+class TestDatIndex(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = DatIndex(self.directory)
+        self.index.build([records_gz_path])
+        with open(records_path, 'rt') as fp:
+            self.records = list(SwissProt.parse(fp))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_indexes_primary_and_secondary_accessions(self):
+        self.assertEqual(len(self.index), 3)
+        for record in self.records:
+            for accession in record.accessions:
+                self.assertIn(accession, self.index)
+                self.assertEqual(
+                    self.index.primary_accessions(accession),
+                    [record.accessions[0]]
+                )
+        self.assertNotIn('P00000', self.index)
+        self.assertEqual(self.index.primary_accessions('P00000'), [])
+
+    def test_reads_same_record_as_dump(self):
+        for record in self.records:
+            for accession in (record.accessions[0], record.accessions[-1]):
+                indexed = self.index.get_record(accession.lower())
+                self.assertEqual(indexed.accessions, record.accessions)
+                self.assertEqual(indexed.entry_name, record.entry_name)
+                self.assertEqual(indexed.sequence, record.sequence)
+        self.assertIsNone(self.index.get_record('P00000'))
+
+    def test_unmodified_dump_is_not_reindexed(self):
+        self.assertEqual(self.index.build([records_gz_path]), 0)
+        self.assertEqual(self.index.build([records_gz_path], force=True), 3)
+        self.assertEqual(len(self.index), 3)
+
+        # A reopened index reads the saved entries.
+        self.index.close()
+        index = DatIndex(self.directory)
+        self.assertTrue(index.is_current(records_gz_path))
+        self.assertEqual(index.get_record('P31946').entry_name, '1433B_HUMAN')
+        index.close()
+
+    def test_index_records_reports_missing_and_filters_taxon(self):
+        records, missing = index_records(
+            ['P31946', 'P00000'], self.index, taxon_id=9606
+        )
+        self.assertEqual(records[0].accessions[0], 'P31946')
+        self.assertIsNone(records[1])
+        self.assertEqual(missing, ['P00000'])
+
+        records, missing = index_records(
+            ['P31946'], self.index, taxon_id=10090
+        )
+        self.assertEqual(records, [None])
+        self.assertEqual(missing, [])
+
+    def test_resolve_maps_secondary_to_primary(self):
+        mapping = self.index.resolve(['p31946', 'A8K9K2', 'B3KY71', 'X1'])
+        self.assertEqual(mapping, {
+            'p31946': ['P31946'], 'A8K9K2': ['P31946'],
+            'B3KY71': ['P62258']
+        })
+
+    def test_fetch_records_reads_indexed_records_without_download(self):
+        accessions = [r.accessions[0] for r in self.records]
+        records = fetch_records(accessions, self.index, taxon_id=None)
+        self.assertEqual(
+            [r.accessions[0] for r in records], accessions
+        )
+
+
+class TestMapAccessions(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = DatIndex(self.directory)
+        self.index.build([records_path])
+        self.session, self.engine = create_session(db_path)
+        delete_database(self.session)
+
+        self.p1 = Protein(uniprot_id='P31946', taxon_id=9606, reviewed=True)
+        self.p2 = Protein(uniprot_id='P62258', taxon_id=9606, reviewed=False)
+        self.p3 = Protein(uniprot_id='Q04917', taxon_id=1, reviewed=True)
+        for protein in (self.p1, self.p2, self.p3):
+            protein.save(self.session, commit=True)
+
+    def tearDown(self):
+        delete_database(self.session)
+        cleanup_database(self.session, self.engine)
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_maps_secondary_accessions_offline(self):
+        mapping = map_accessions(
+            ['A8K9K2', 'P62258', 'B3KY71', 'Q04917', 'X1'], self.index,
+            self.session
+        )
+        self.assertEqual(mapping, {
+            'A8K9K2': ['P31946'], 'P62258': ['P62258'],
+            'B3KY71': ['P62258'], 'Q04917': []
+        })
+
+    def test_database_entries_missing_from_index_map_to_themselves(self):
+        Protein(uniprot_id='P99999', taxon_id=9606, reviewed=True).save(
+            self.session, commit=True)
+        mapping = map_accessions(
+            ['P99999', 'X1'], self.index, self.session
+        )
+        self.assertEqual(mapping, {'P99999': ['P99999']})
+
+    def test_filters_unreviewed_and_taxon_ids(self):
+        mapping = map_accessions(
+            ['A8K9K2', 'B3KY71', 'Q04917'], self.index, self.session,
+            keep_unreviewed=False, match_taxon_id=None
+        )
+        self.assertEqual(mapping, {
+            'A8K9K2': ['P31946'], 'B3KY71': [], 'Q04917': ['Q04917']
+        })
+
+    def test_missing_targets_saved_from_index(self):
+        delete_database(self.session)
+        mapping = map_accessions(
+            ['A8K9K2', 'B3KY71'], self.index, self.session,
+            allow_download=True
+        )
+        self.assertEqual(mapping, {
+            'A8K9K2': ['P31946'], 'B3KY71': ['P62258']
+        })
+        self.assertEqual(Protein.query.count(), 2)
+        self.assertTrue(Protein.get_by_uniprot_id('P62258').reviewed)
@@ -1,6 +1,7 @@
 
 import os
 import shutil
+import numpy as np
 import pandas as pd
 
 from collections import OrderedDict
@@ -15,6 +16,7 @@ from ..base.constants import (
 )
 
 from ..database import create_session, delete_database, cleanup_database
+from ..database import utilities
 from ..database.exceptions import ObjectAlreadyExists, ObjectNotFound
 from ..database.utilities import (
     filter_matching_taxon_ids,
@@ -24,18 +26,31 @@ from ..database.utilities import (
     interactome_interactions,
     labels_from_interactions,
     get_upid_to_protein_map,
+    protein_status_map,
     get_source_taget_to_interactions_map,
     create_interaction,
     proteins_from_dat,
     psimi_from_obo,
     pmids_from_list,
-    psimis_from_list
+    psimis_from_list,
+    proteins_with_go_terms,
+    refresh_ulca_features,
+    go_information_content,
+    interaction_similarity_features,
+    FEATURE_COLUMNS,
+    feature_tokens,
+    pack_feature_ids,
+    unpack_feature_ids,
+    feature_vocabulary,
+    update_feature_ids
 )
+from ..data_mining.ontology import get_active_instance, parse_obo12_file
 from ..database.models import (
     Protein, Interaction, Psimi, Pubmed
 )
 
 base_path = os.path.dirname(__file__)
+test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
 
 
 class TestCreateInteractions(TestCase):
@@ -444,6 +459,16 @@ class TestGetUpidProteinMap(TestCase):
         expected = {'A': self.pa, 'D': None}
         self.assertEqual(mapping, expected)
 
+    def test_status_map_reads_review_status_and_taxon_id(self):
+        mapping = protein_status_map(
+            ['A', 'B', 'C', 'D', None], session=self.session, chunk_size=2
+        )
+        expected = {
+            'A': (self.pa.reviewed, 9606), 'B': (self.pb.reviewed, 0),
+            'C': (self.pc.reviewed, 9606)
+        }
+        self.assertEqual(mapping, expected)
+
 
 class TestSTInteractionMap(TestCase):
 
@@ -704,3 +729,221 @@ class TestPsimisFromSet(TestCase):
             psimis_from_list((('a', 'this is a')), session=self.session)
             psimis_from_list(dict(), session=self.session)
             psimis_from_list('a', session=self.session)
+
+
+class TestRefreshULCAFeatures(TestCase):
+
+    def setUp(self):
+        self.db_path = os.path.normpath(
+            "{}/databases/test.db".format(base_path)
+        )
+        self.session, self.engine = create_session(self.db_path)
+        delete_database(self.session)
+        self.dag = get_active_instance(
+            filename=test_obo_file, use_snapshot=False
+        )
+        self.pa = Protein(
+            uniprot_id="A", taxon_id=9606, reviewed=False,
+            go_bp="GO:0007154,GO:0050794"
+        )
+        self.pb = Protein(
+            uniprot_id="B", taxon_id=9606, reviewed=False,
+            go_bp="GO:0051716"
+        )
+        self.pc = Protein(
+            uniprot_id="C", taxon_id=9606, reviewed=False,
+            go_cc="GO:0016459"
+        )
+        self.pa.save(self.session, commit=True)
+        self.pb.save(self.session, commit=True)
+        self.pc.save(self.session, commit=True)
+
+        self.ia = Interaction(self.pa, self.pb, ulca_go_bp="GO:0000001")
+        self.ib = Interaction(self.pc, self.pc, ulca_go_cc="GO:0000001")
+        self.ia.save(self.session, commit=True)
+        self.ib.save(self.session, commit=True)
+
+    def tearDown(self):
+        delete_database(self.session)
+        cleanup_database(self.session, self.engine)
+
+    def test_finds_proteins_with_terms(self):
+        self.assertEqual(
+            proteins_with_go_terms(["GO:0050794", "GO:0000001"]),
+            [self.pa.id]
+        )
+        self.assertEqual(
+            sorted(proteins_with_go_terms(["GO:0051716", "GO:0016459"])),
+            sorted([self.pb.id, self.pc.id])
+        )
+
+    def test_does_not_match_partial_accessions(self):
+        self.assertEqual(proteins_with_go_terms(["GO:005079"]), [])
+
+    def test_finds_proteins_across_chunks(self):
+        terms = ["GO:0050794", "GO:0051716", "GO:0016459"]
+        self.assertEqual(
+            sorted(proteins_with_go_terms(terms, chunk_size=1)),
+            sorted([self.pa.id, self.pb.id, self.pc.id])
+        )
+
+    def test_only_recomputes_interactions_with_affected_terms(self):
+        updated = refresh_ulca_features(
+            ["GO:0051716"], dag=self.dag, session=self.session
+        )
+        self.assertEqual(updated, [self.ia])
+
+        ia = Interaction.query.get(self.ia.id)
+        self.assertEqual(
+            sorted(ia.ulca_go_bp.split(',')),
+            sorted([
+                "GO:0008150", "GO:0008150",
+                "GO:0009987", "GO:0009987",
+                "GO:0065007",
+                "GO:0050896",
+                "GO:0050789",
+                "GO:0007154",
+                "GO:0050794",
+                "GO:0051716"
+            ])
+        )
+        ib = Interaction.query.get(self.ib.id)
+        self.assertEqual(ib.ulca_go_cc, "GO:0000001")
+
+    def test_recomputes_interactions_across_id_chunks(self):
+        limit = utilities.MAX_IN_PARAMETERS
+        utilities.MAX_IN_PARAMETERS = 2
+        try:
+            updated = refresh_ulca_features(
+                ["GO:0050794", "GO:0051716", "GO:0016459"], dag=self.dag,
+                session=self.session
+            )
+        finally:
+            utilities.MAX_IN_PARAMETERS = limit
+        self.assertEqual(
+            sorted(i.id for i in updated), sorted([self.ia.id, self.ib.id])
+        )
+        ib = Interaction.query.get(self.ib.id)
+        self.assertNotEqual(ib.ulca_go_cc, "GO:0000001")
+
+
+class TestSimilarityFeatures(TestCase):
+
+    def setUp(self):
+        self.db_path = os.path.normpath(
+            "{}/databases/test.db".format(base_path)
+        )
+        self.session, self.engine = create_session(self.db_path)
+        delete_database(self.session)
+        # Parsed without a snapshot so the information content is not saved.
+        self.dag = parse_obo12_file(test_obo_file)
+        self.pa = Protein(
+            uniprot_id="A", taxon_id=9606, reviewed=False,
+            go_bp="GO:0007154,GO:0050794"
+        )
+        self.pb = Protein(
+            uniprot_id="B", taxon_id=9606, reviewed=False,
+            go_bp="GO:0007154"
+        )
+        self.pc = Protein(
+            uniprot_id="C", taxon_id=9606, reviewed=False,
+            go_cc="GO:0016459"
+        )
+        self.pa.save(self.session, commit=True)
+        self.pb.save(self.session, commit=True)
+        self.pc.save(self.session, commit=True)
+
+        self.ia = Interaction(self.pa, self.pb)
+        self.ib = Interaction(self.pa, self.pc)
+        self.ia.save(self.session, commit=True)
+        self.ib.save(self.session, commit=True)
+
+    def tearDown(self):
+        delete_database(self.session)
+        cleanup_database(self.session, self.engine)
+
+    def test_ic_computed_from_protein_annotations(self):
+        ic = go_information_content(self.dag)
+        index = self.dag.index
+        self.assertEqual(ic.shape, (len(index),))
+        self.assertAlmostEqual(ic[index.index_of("GO:0008150")], 0.0)
+        self.assertAlmostEqual(
+            ic[index.index_of("GO:0007154")], -np.log(2 / 3)
+        )
+        self.assertEqual(ic[index.index_of("GO:0051716")], 0.0)
+
+    def test_similarity_features_for_interactions(self):
+        features = interaction_similarity_features(
+            [self.ia, self.ib], dag=self.dag
+        )
+        self.assertEqual(features.shape, (2, 9))
+        # go_bp resnik, lin and bma are columns 3 to 5.
+        self.assertAlmostEqual(features[0, 3], -np.log(2 / 3))
+        self.assertAlmostEqual(features[0, 4], 1.0)
+        self.assertTrue(np.all(features[1] == 0))
+
+
+class TestFeatureIds(TestCase):
+
+    def setUp(self):
+        self.db_path = os.path.normpath(
+            "{}/databases/test.db".format(base_path)
+        )
+        self.session, self.engine = create_session(self.db_path)
+        delete_database(self.session)
+        self.pa = Protein(uniprot_id="A", taxon_id=9606, reviewed=False)
+        self.pb = Protein(uniprot_id="B", taxon_id=9606, reviewed=False)
+        self.pa.save(self.session, commit=True)
+        self.pb.save(self.session, commit=True)
+
+        self.ia = Interaction(
+            self.pa, self.pb, go_mf='GO:1,GO:2', pfam='PF5',
+            ulca_go_bp='GO:2', keywords='Cell cycle'
+        )
+        self.ib = Interaction(self.pa, self.pa, go_mf='GO:2', go_cc='GO:3')
+        self.ia.save(self.session, commit=True)
+        self.ib.save(self.session, commit=True)
+
+    def tearDown(self):
+        delete_database(self.session)
+        cleanup_database(self.session, self.engine)
+
+    def test_feature_tokens_match_vectorizer_tokens(self):
+        self.assertEqual(feature_tokens('GO:1,GO:2'), ['GO1', 'GO2'])
+        self.assertEqual(feature_tokens('Cell cycle'), ['Cell', 'cycle'])
+        self.assertEqual(feature_tokens(None), [])
+
+    def test_pack_and_unpack_roundtrip(self):
+        groups = [[1, 2], [], [3], [], [], [], [4, 4], [], [5]]
+        result = unpack_feature_ids(pack_feature_ids(groups))
+        self.assertEqual(len(result), len(FEATURE_COLUMNS))
+        self.assertEqual([list(g) for g in result], groups)
+
+    def test_pack_raises_error_on_wrong_number_of_groups(self):
+        with self.assertRaises(ValueError):
+            pack_feature_ids([[1]])
+
+    def test_update_adds_tokens_once(self):
+        update_feature_ids([self.ia, self.ib], self.session, commit=True)
+        vocabulary = feature_vocabulary(self.session)
+        self.assertEqual(
+            set(vocabulary.keys()),
+            set(['GO1', 'GO2', 'GO3', 'PF5', 'Cell', 'cycle'])
+        )
+
+        groups = unpack_feature_ids(self.ia.feature_ids)
+        by_column = dict(zip(FEATURE_COLUMNS, groups))
+        self.assertEqual(
+            list(by_column['go_mf']), [vocabulary['GO1'], vocabulary['GO2']]
+        )
+        self.assertEqual(list(by_column['ulca_go_bp']), [vocabulary['GO2']])
+        self.assertEqual(len(by_column['go_cc']), 0)
+
+        update_feature_ids([self.ib], self.session, commit=True)
+        self.assertEqual(feature_vocabulary(self.session), vocabulary)
+
+    def test_changing_feature_column_clears_feature_ids(self):
+        update_feature_ids([self.ia], self.session, commit=True)
+        self.assertIsNotNone(self.ia.feature_ids)
+        self.ia.go_cc = 'GO:3'
+        self.assertIsNone(self.ia.feature_ids)
@@ -0,0 +1,169 @@
+import os
+import gzip
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ..database.models import Protein
+from ..data_mining.features import compute_interaction_features
+from ..data_mining.feature_cache import (
+    FeatureCache, protein_stamp, compute_interaction_features_cached
+)
+from ..data_mining.ontology import get_active_instance, parse_obo12_file
+
+
+base_path = os.path.dirname(__file__)
+test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
+dag = get_active_instance(filename=test_obo_file, use_snapshot=False)
+
+
+class TestFeatureCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'features.db')
+        self.proteins = []
+        annotations = [
+            (["GO:0001618"], ["GO:0007154", "GO:0050794"], ["GO:0016459"],
+             ["IPR000001"], ["PF00001"], ["Kinase"]),
+            (["GO:0000975"], ["GO:0051716"], ["GO:0015629"],
+             None, None, ["Membrane"]),
+            (None, ["GO:0007165"], None, None, ["PF00002"], None),
+        ]
+        for (mf, bp, cc, ipr, pf, kw) in annotations:
+            self.proteins.append(Protein(
+                uniprot_id="P{}".format(len(self.proteins)),
+                taxon_id=9606, go_mf=mf, go_bp=bp, go_cc=cc,
+                interpro=ipr, pfam=pf, keywords=kw,
+                last_update="01-JAN-2018", last_release=1
+            ))
+        self.pairs = [
+            (a, b) for a in self.proteins for b in self.proteins
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_computes_missing_features_and_caches_them(self):
+        cache = FeatureCache(self.path, dag=dag)
+        result = compute_interaction_features_cached(self.pairs, cache)
+        for (a, b), features in zip(self.pairs, result):
+            self.assertEqual(features, compute_interaction_features(a, b))
+        self.assertEqual(len(cache), len(self.pairs))
+        self.assertEqual(cache.cache_info().misses, len(self.pairs))
+
+        result = compute_interaction_features_cached(self.pairs, cache)
+        self.assertEqual(cache.cache_info().hits, len(self.pairs))
+        for (a, b), features in zip(self.pairs, result):
+            self.assertEqual(features, compute_interaction_features(a, b))
+
+    def test_returns_copies_of_cached_features(self):
+        cache = FeatureCache(None, dag=dag)
+        pair = self.pairs[:1]
+        compute_interaction_features_cached(pair, cache)
+        features = cache.get_many(pair)[0]
+        features['go_mf'].append("GO:0000001")
+        features['is_training'] = True
+        self.assertEqual(
+            cache.get_many(pair)[0], compute_interaction_features(*pair[0])
+        )
+
+    def test_entries_persist_between_instances(self):
+        cache = FeatureCache(self.path, dag=dag)
+        compute_interaction_features_cached(self.pairs, cache)
+        cache.close()
+
+        cache = FeatureCache(self.path, dag=dag)
+        self.assertEqual(len(cache), len(self.pairs))
+        result = cache.get_many(self.pairs)
+        for (a, b), features in zip(self.pairs, result):
+            self.assertEqual(features, compute_interaction_features(a, b))
+
+    def test_updated_protein_is_recomputed(self):
+        cache = FeatureCache(None, dag=dag)
+        compute_interaction_features_cached(self.pairs, cache)
+        self.proteins[0].last_update = "01-FEB-2018"
+        result = cache.get_many(self.pairs)
+        for (a, b), features in zip(self.pairs, result):
+            if self.proteins[0] in (a, b):
+                self.assertIsNone(features)
+            else:
+                self.assertIsNotNone(features)
+
+    def test_different_dag_does_not_hit(self):
+        cache = FeatureCache(self.path, dag=dag)
+        compute_interaction_features_cached(self.pairs, cache)
+        cache.close()
+
+        # The same release with one term moved to the root.
+        with gzip.open(test_obo_file, 'rt') as fp:
+            lines = fp.read().split('\n')
+        removed = next(
+            i for (i, l) in enumerate(lines) if l.startswith('is_a:'))
+        del lines[removed]
+        other_file = os.path.join(self.directory, 'other.obo.gz')
+        with gzip.open(other_file, 'wt') as fp:
+            fp.write('\n'.join(lines))
+        other = parse_obo12_file(other_file)
+        self.assertEqual(len(other.index), len(dag.index))
+
+        cache = FeatureCache(self.path, dag=other)
+        self.assertNotEqual(
+            cache.fingerprint(), FeatureCache(None, dag=dag).fingerprint()
+        )
+        self.assertEqual(len(cache), len(self.pairs))
+        self.assertEqual(cache.get_many(self.pairs), [None] * len(self.pairs))
+
+    def test_evicts_least_recently_used(self):
+        cache = FeatureCache(None, max_entries=2, dag=dag)
+        compute_interaction_features_cached(self.pairs[:2], cache)
+        cache.get_many(self.pairs[:1])
+        compute_interaction_features_cached(self.pairs[2:3], cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIn(self.pairs[0], cache)
+        self.assertNotIn(self.pairs[1], cache)
+        self.assertIn(self.pairs[2], cache)
+
+    def test_eviction_persists_least_recently_used_order(self):
+        cache = FeatureCache(self.path, max_entries=2, dag=dag)
+        compute_interaction_features_cached(self.pairs[:2], cache)
+        cache.get_many(self.pairs[:1])
+        cache.close()
+
+        cache = FeatureCache(self.path, max_entries=2, dag=dag)
+        compute_interaction_features_cached(self.pairs[2:3], cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIn(self.pairs[0], cache)
+        self.assertNotIn(self.pairs[1], cache)
+
+    def test_replacing_entry_keeps_size(self):
+        cache = FeatureCache(None, dag=dag)
+        compute_interaction_features_cached(self.pairs[:2], cache)
+        cache.put_many(self.pairs[:2], cache.get_many(self.pairs[:2]))
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get_many(self.pairs[:1]), [None])
+
+    def test_replaces_unreadable_cache_file(self):
+        with open(self.path, 'wt') as fp:
+            fp.write("not a database")
+        cache = FeatureCache(self.path, dag=dag)
+        self.assertEqual(len(cache), 0)
+        compute_interaction_features_cached(self.pairs[:1], cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_pairs_with_None_are_not_cached(self):
+        cache = FeatureCache(None, dag=dag)
+        result = compute_interaction_features_cached(
+            [(None, self.proteins[0])], cache
+        )
+        self.assertEqual(result, [None])
+        self.assertEqual(len(cache), 0)
+
+    def test_stamp_falls_back_to_annotation_digest(self):
+        a = Protein(uniprot_id="P1", taxon_id=9606, go_mf=["GO:0001618"])
+        b = Protein(uniprot_id="P1", taxon_id=9606, go_mf=["GO:0000975"])
+        self.assertNotEqual(protein_stamp(a), protein_stamp(b))
+        self.assertEqual(protein_stamp(self.proteins[0]),
+                         protein_stamp(self.proteins[0]))
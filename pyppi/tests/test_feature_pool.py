@@ -0,0 +1,87 @@
+import os
+from unittest import TestCase
+
+from ..database.models import Protein
+from ..data_mining.features import compute_interaction_features_batch
+from ..data_mining.feature_pool import (
+    annotation_table, compute_interaction_features_pool, FeaturePool
+)
+from ..data_mining.ontology import get_active_instance, parse_obo12_file
+
+
+base_path = os.path.dirname(__file__)
+test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
+dag = get_active_instance(filename=test_obo_file, use_snapshot=False)
+
+
+class TestFeaturePool(TestCase):
+
+    def setUp(self):
+        self.proteins = []
+        annotations = [
+            (["GO:0001618"], ["GO:0007154", "GO:0050794"], ["GO:0016459"],
+             ["IPR000001"], ["PF00001"], ["Kinase"]),
+            (["GO:0000975"], ["GO:0051716"], ["GO:0015629"],
+             None, None, ["Membrane"]),
+            (None, ["GO:0007165"], None, None, ["PF00002"], None),
+        ]
+        for (mf, bp, cc, ipr, pf, kw) in annotations:
+            self.proteins.append(Protein(
+                uniprot_id="P{}".format(len(self.proteins)),
+                taxon_id=9606, go_mf=mf, go_bp=bp, go_cc=cc,
+                interpro=ipr, pfam=pf, keywords=kw
+            ))
+        self.pairs = [
+            (a, b) for a in self.proteins for b in self.proteins
+        ] + [(None, self.proteins[0])]
+
+    def test_annotation_table_stores_each_protein_once(self):
+        table, id_pairs = annotation_table(self.pairs)
+        self.assertEqual(len(table), len(self.proteins))
+        self.assertEqual(id_pairs[1], (0, 1))
+        self.assertEqual(id_pairs[-1], (-1, 0))
+        self.assertEqual(table[0].uniprot_id, "P0")
+        self.assertEqual(table[0].go_bp, self.proteins[0].go_bp)
+
+    def test_pool_matches_batch_features(self):
+        expected = compute_interaction_features_batch(self.pairs, dag)
+        result = compute_interaction_features_pool(
+            self.pairs, n_jobs=2, dag=dag, chunks_per_job=2
+        )
+        self.assertEqual(result, expected)
+
+    def test_pool_copies_dag_without_snapshot(self):
+        other = parse_obo12_file(test_obo_file)
+        expected = compute_interaction_features_batch(self.pairs, other)
+        result = compute_interaction_features_pool(
+            self.pairs, n_jobs=2, dag=other
+        )
+        self.assertEqual(result, expected)
+
+    def test_pool_is_reused_across_calls(self):
+        expected = compute_interaction_features_batch(self.pairs, dag)
+        with FeaturePool(self.proteins[:2], n_jobs=2, dag=dag) as pool:
+            workers = [p.pid for p in pool._pool._pool]
+            first = compute_interaction_features_pool(
+                self.pairs[:5], pool=pool)
+            # The third protein is not in the shared table.
+            second = compute_interaction_features_pool(
+                self.pairs[5:], pool=pool)
+            self.assertEqual([p.pid for p in pool._pool._pool], workers)
+        self.assertEqual(len(pool.table), 2)
+        self.assertIsNone(pool._pool)
+        self.assertEqual(first + second, expected)
+
+    def test_tasks_only_carry_proteins_they_reference(self):
+        expected = compute_interaction_features_batch(self.pairs, dag)
+        with FeaturePool(self.proteins[:1], n_jobs=2, dag=dag,
+                         chunks_per_job=2) as pool:
+            extra, id_pairs = pool._task(self.pairs[:2])
+            self.assertEqual([a.uniprot_id for a in extra], ["P1"])
+            self.assertEqual(id_pairs, [(0, 0), (0, 1)])
+
+            extra, id_pairs = pool._task(self.pairs[8:])
+            self.assertEqual([a.uniprot_id for a in extra], ["P2"])
+            self.assertEqual(id_pairs, [(1, 1), (-1, 0)])
+
+            self.assertEqual(pool.compute(self.pairs), expected)
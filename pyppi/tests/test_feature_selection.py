@@ -0,0 +1,67 @@
+import numpy as np
+from scipy import sparse
+from unittest import TestCase
+
+from ..models.feature_selection import (
+    LabelFeatureSelector, get_parameter_distribution_for_selector
+)
+
+
+class TestLabelFeatureSelector(TestCase):
+
+    def setUp(self):
+        # Column 0 only occurs with positives, column 1 with both, column 2
+        # only with negatives and column 3 once with a positive.
+        self.X = sparse.csr_matrix(np.asarray([
+            [2, 1, 0, 1],
+            [1, 1, 0, 0],
+            [0, 1, 1, 0],
+            [0, 1, 3, 0],
+        ]))
+        self.y = np.asarray([1, 1, 0, 0])
+
+    def test_removes_features_never_seen_with_a_positive(self):
+        selector = LabelFeatureSelector().fit(self.X, self.y)
+        self.assertEqual(selector.get_support().tolist(),
+                         [True, True, False, True])
+        self.assertEqual(selector.transform(self.X).shape, (4, 3))
+
+    def test_min_df_counts_positive_samples(self):
+        selector = LabelFeatureSelector(min_df=2).fit(self.X, self.y)
+        self.assertEqual(selector.get_support(indices=True).tolist(), [0, 1])
+
+    def test_k_keeps_highest_scores(self):
+        selector = LabelFeatureSelector(k=1).fit(self.X, self.y)
+        self.assertEqual(selector.get_support(indices=True).tolist(), [0])
+
+        selector = LabelFeatureSelector(
+            score_func='positive_df', k=2).fit(self.X, self.y)
+        self.assertEqual(selector.get_support(indices=True).tolist(), [0, 1])
+
+    def test_transform_returns_selected_columns(self):
+        selector = LabelFeatureSelector(k=2).fit(self.X, self.y)
+        X = selector.transform(self.X)
+        self.assertTrue(sparse.issparse(X))
+        self.assertEqual(X.toarray().tolist(),
+                         self.X.toarray()[:, [0, 3]].tolist())
+
+    def test_keeps_all_features_without_positives(self):
+        selector = LabelFeatureSelector().fit(self.X, np.zeros(4))
+        self.assertTrue(selector.get_support().all())
+
+    def test_invalid_parameters_raise_valueerror(self):
+        with self.assertRaises(ValueError):
+            LabelFeatureSelector(score_func='mutual_info').fit(self.X, self.y)
+        with self.assertRaises(ValueError):
+            LabelFeatureSelector(k=0).fit(self.X, self.y)
+
+    def test_transform_checks_number_of_features(self):
+        selector = LabelFeatureSelector().fit(self.X, self.y)
+        with self.assertRaises(ValueError):
+            selector.transform(self.X[:, :2])
+
+    def test_step_used_as_prefix_of_each_key(self):
+        params = get_parameter_distribution_for_selector('selector')
+        self.assertEqual(
+            sorted(params.keys()), ['selector__k', 'selector__min_df']
+        )
@@ -1,17 +1,24 @@
 import os
+import pickle
+import shutil
+import tempfile
 from unittest import TestCase
 from Bio import SwissProt
 
 from ..database import create_session, delete_database, cleanup_database
 from ..database.models import Protein
-from ..data_mining.features import compute_interaction_features
+from ..data_mining.features import (
+    compute_interaction_features, compute_ulca_features_many,
+    compute_interaction_features_batch, iter_interaction_features,
+    cross_feature_indices, compute_cross_features_many, GOTermProjector
+)
 from ..data_mining.ontology import parse_obo12_file, get_active_instance
 from ..data_mining.uniprot import parse_record_into_protein
 
 
 base_path = os.path.dirname(__file__)
 test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
-dag = get_active_instance(filename=test_obo_file)
+dag = get_active_instance(filename=test_obo_file, use_snapshot=False)
 
 
 class TestComputeInteractionFeatures(TestCase):
@@ -168,3 +175,237 @@ class TestComputeInteractionFeatures(TestCase):
         features = compute_interaction_features(protein, protein)
         self.assertEqual(features['go_mf'], ['GO:0044212', 'GO:0044212'])
         self.assertTrue('GO:0000975' not in features['ulca_go_mf'])
+
+
+class TestComputeULCAFeaturesMany(TestCase):
+
+    def setUp(self):
+        self.proteins = []
+        annotations = [
+            (["GO:0001618"], ["GO:0007154", "GO:0050794"], ["GO:0016459"]),
+            (["GO:0000975"], ["GO:0051716"], ["GO:0015629"]),
+            (None, ["GO:0007165"], None),
+        ]
+        for (mf, bp, cc) in annotations:
+            self.proteins.append(Protein(
+                uniprot_id="P{}".format(len(self.proteins)),
+                taxon_id=9606, go_mf=mf, go_bp=bp, go_cc=cc
+            ))
+
+    def test_matches_single_interaction_features(self):
+        pairs = [
+            (a, b) for a in self.proteins for b in self.proteins
+        ]
+        result = compute_ulca_features_many(pairs)
+        for (a, b), features in zip(pairs, result):
+            expected = compute_interaction_features(a, b)
+            for key in ('ulca_go_mf', 'ulca_go_bp', 'ulca_go_cc'):
+                self.assertEqual(sorted(features[key]), sorted(expected[key]))
+
+    def test_returns_None_if_either_protein_is_None(self):
+        result = compute_ulca_features_many(
+            [(None, self.proteins[0]), (self.proteins[0], None)]
+        )
+        self.assertEqual(result, [None, None])
+
+
+class TestComputeInteractionFeaturesBatch(TestCase):
+
+    def setUp(self):
+        self.proteins = []
+        annotations = [
+            (["GO:0001618"], ["GO:0007154", "GO:0050794"], ["GO:0016459"],
+             ["IPR000001", "IPR000002"], ["PF00001"], ["Kinase"]),
+            (["GO:0000975"], ["GO:0051716"], ["GO:0015629"],
+             ["IPR000001"], None, ["Kinase", "Membrane"]),
+            (None, ["GO:0007165"], None, None, ["PF00002"], None),
+        ]
+        for (mf, bp, cc, ipr, pf, kw) in annotations:
+            self.proteins.append(Protein(
+                uniprot_id="P{}".format(len(self.proteins)),
+                taxon_id=9606, go_mf=mf, go_bp=bp, go_cc=cc,
+                interpro=ipr, pfam=pf, keywords=kw
+            ))
+
+    def test_matches_single_interaction_features(self):
+        pairs = [
+            (a, b) for a in self.proteins for b in self.proteins
+        ]
+        result = compute_interaction_features_batch(pairs)
+        self.assertEqual(len(result), len(pairs))
+        for (a, b), features in zip(pairs, result):
+            self.assertEqual(features, compute_interaction_features(a, b))
+
+    def test_returns_None_if_either_protein_is_None(self):
+        result = compute_interaction_features_batch(
+            [(None, self.proteins[0]), (self.proteins[0], None)]
+        )
+        self.assertEqual(result, [None, None])
+
+    def test_raises_error_for_unknown_go_terms(self):
+        protein = Protein(uniprot_id="P1", taxon_id=9606, go_mf=["GO:9999999"])
+        with self.assertRaises(KeyError):
+            compute_interaction_features_batch([(protein, self.proteins[0])])
+
+
+class TestCrossFeatures(TestCase):
+
+    def setUp(self):
+        self.a = Protein(
+            uniprot_id="P0", taxon_id=9606, go_mf=["GO:0001618"],
+            go_bp=["GO:0007154", "GO:0050794"], pfam=["PF00001"]
+        )
+        self.b = Protein(
+            uniprot_id="P1", taxon_id=9606, go_bp=["GO:0007165"],
+            pfam=["PF00002", "PF00001"]
+        )
+
+    def test_crosses_are_only_computed_if_requested(self):
+        features = compute_interaction_features(self.a, self.b)
+        self.assertNotIn('cross', features)
+
+    def test_crosses_within_each_annotation_type(self):
+        features = compute_interaction_features(self.a, self.b, crosses=True)
+        # 2 go_bp crosses and 2 pfam crosses. go_mf has no target terms.
+        self.assertEqual(len(features['cross']), 4)
+        self.assertTrue(all(
+            0 <= i < 2 ** 20 for i in features['cross']
+        ))
+
+    def test_crosses_are_symmetric(self):
+        self.assertEqual(
+            compute_interaction_features(self.a, self.b, crosses=True)['cross'],
+            compute_interaction_features(self.b, self.a, crosses=True)['cross']
+        )
+
+    def test_hashes_into_n_features_columns(self):
+        indices = cross_feature_indices(
+            [[], [], [], ['IPR1', 'IPR2'], []],
+            [[], [], [], ['IPR3'], []], n_features=4
+        )
+        self.assertEqual(len(indices), 2)
+        self.assertTrue(all(0 <= i < 4 for i in indices))
+
+    def test_batch_and_matrix_match_single_interaction(self):
+        pairs = [(self.a, self.b), (self.b, self.b), (None, self.a)]
+        batch = compute_interaction_features_batch(pairs, crosses=True)
+        X = compute_cross_features_many(pairs, n_features=2 ** 20)
+        self.assertEqual(X.shape, (3, 2 ** 20))
+        for row, (a, b) in enumerate(pairs[:2]):
+            expected = compute_interaction_features(a, b, crosses=True)
+            self.assertEqual(batch[row], expected)
+            self.assertEqual(list(X[row].indices), expected['cross'])
+        self.assertEqual(X[2].nnz, 0)
+
+
+class TestIterInteractionFeatures(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'checkpoint.json')
+        self.proteins = [
+            Protein(uniprot_id="P0", taxon_id=9606, go_mf=["GO:0001618"],
+                    pfam=["PF00001"]),
+            Protein(uniprot_id="P1", taxon_id=9606, go_bp=["GO:0007165"]),
+            Protein(uniprot_id="P2", taxon_id=9606, go_cc=["GO:0016459"]),
+        ]
+        self.pairs = [
+            (a, b) for a in self.proteins for b in self.proteins
+        ]
+        self.computed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compute(self, chunk):
+        self.computed.append(len(chunk))
+        return compute_interaction_features_batch(chunk)
+
+    def test_yields_fixed_size_chunks_from_a_generator(self):
+        result = []
+        generator = iter_interaction_features(
+            (pair for pair in self.pairs), chunk_size=4, compute=self.compute
+        )
+        for start, chunk, features in generator:
+            self.assertEqual(chunk, self.pairs[start:start + len(chunk)])
+            result.extend(features)
+        self.assertEqual(self.computed, [4, 4, 1])
+        self.assertEqual(result, compute_interaction_features_batch(
+            self.pairs))
+
+    def test_resumes_after_last_completed_chunk(self):
+        generator = iter_interaction_features(
+            self.pairs, chunk_size=4, checkpoint=self.checkpoint,
+            compute=self.compute
+        )
+        next(generator)
+        next(generator)
+        # Interrupted while persisting the second chunk.
+        del generator
+        self.assertTrue(os.path.isfile(self.checkpoint))
+
+        self.computed = []
+        starts = [
+            start for (start, _, _) in iter_interaction_features(
+                self.pairs, chunk_size=4, checkpoint=self.checkpoint,
+                compute=self.compute
+            )
+        ]
+        self.assertEqual(starts, [4, 8])
+        self.assertEqual(self.computed, [4, 1])
+        self.assertFalse(os.path.isfile(self.checkpoint))
+
+    def test_raises_error_on_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            list(iter_interaction_features(self.pairs, chunk_size=0))
+
+
+class TestGOTermProjector(TestCase):
+
+    def test_projects_terms_to_max_depth(self):
+        projector = GOTermProjector(max_depth=1, dag=dag)
+        X = projector.fit_transform(
+            ["GO0051716,IPR000001,GO0008150", "", "GO0009987"]
+        )
+        self.assertEqual(
+            sorted(X[0].split(',')),
+            sorted(["GO0009987", "GO0050896", "IPR000001", "GO0008150"])
+        )
+        self.assertEqual(X[1], "")
+        self.assertEqual(X[2], "GO0009987")
+
+    def test_keeps_accession_format(self):
+        projector = GOTermProjector(max_depth=1, dag=dag).fit([])
+        X = projector.transform(["GO:0050794,GO:0050794"])
+        self.assertEqual(X[0], "GO:0065007,GO:0065007")
+
+    def test_projects_terms_to_slim(self):
+        projector = GOTermProjector(
+            slim=["GO:0009987", "GO:0065007"], dag=dag
+        )
+        X = projector.fit_transform(
+            ["GO0007154,GO0050794,GO0016459,PF00001"]
+        )
+        self.assertEqual(X[0], "GO0009987,GO0065007,PF00001")
+
+    def test_unknown_terms_are_unchanged(self):
+        projector = GOTermProjector(max_depth=0, dag=dag)
+        X = projector.fit_transform(["GO9999999,GO0007154"])
+        self.assertEqual(X[0], "GO9999999,GO0008150")
+
+    def test_requires_exactly_one_projection(self):
+        with self.assertRaises(ValueError):
+            GOTermProjector(dag=dag).fit(["GO0007154"])
+        with self.assertRaises(ValueError):
+            GOTermProjector(max_depth=1, slim=["GO:0009987"], dag=dag).fit(
+                ["GO0007154"]
+            )
+        with self.assertRaises(ValueError):
+            GOTermProjector(max_depth=-1, dag=dag).fit(["GO0007154"])
+
+    def test_pickle_does_not_store_memo(self):
+        projector = GOTermProjector(max_depth=1)
+        expected = projector.fit_transform(["GO0051716"])
+        restored = pickle.loads(pickle.dumps(projector))
+        self.assertFalse(hasattr(restored, '_mapping'))
+        self.assertEqual(restored.transform(["GO0051716"]), expected)
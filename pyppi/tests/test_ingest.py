@@ -0,0 +1,110 @@
+import io
+import os
+from unittest import TestCase
+
+from ..database import create_session, delete_database, cleanup_database
+from ..database.models import Protein
+from ..database.ingest import protein_row, upsert_protein_rows, ingest_dat
+from ..data_mining.uniprot import iter_dat_chunks, iter_dat_records
+
+base_path = os.path.dirname(__file__)
+db_path = os.path.normpath("{}/databases/test.db".format(base_path))
+records_path = os.path.normpath(
+    "{}/test_data/test_sprot_records.dat".format(base_path)
+)
+records_gz_path = os.path.normpath(
+    "{}/test_data/test_sprot_records.dat.gz".format(base_path)
+)
+
+
+class TestIngestDat(TestCase):
+
+    def setUp(self):
+        self.session, self.engine = create_session(db_path)
+        delete_database(self.session)
+
+    def tearDown(self):
+        delete_database(self.session)
+        cleanup_database(self.session, self.engine)
+
+    def test_chunks_split_on_record_boundaries(self):
+        with open(records_path, 'rt') as fp:
+            text = fp.read()
+        chunks = list(iter_dat_chunks(records_path, chunk_bytes=100))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(''.join(chunks), text)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith('ID   '))
+            self.assertEqual(
+                len(list(iter_dat_records(io.StringIO(chunk)))), 1)
+
+    def test_rows_match_orm_columns(self):
+        for params in iter_dat_records(records_path):
+            row = protein_row(params)
+            protein = Protein(**params)
+            for column in Protein.columns():
+                self.assertEqual(
+                    row[column.value], getattr(protein, column.value)
+                )
+
+    def test_ingest_inserts_all_records(self):
+        inserted, updated = ingest_dat(
+            records_gz_path, self.session, chunk_bytes=100
+        )
+        self.assertEqual((inserted, updated), (3, 0))
+        self.assertEqual(Protein.query.count(), 3)
+
+        for params in iter_dat_records(records_path):
+            row = protein_row(params)
+            protein = Protein.get_by_uniprot_id(row['uniprot_id'])
+            for column in Protein.columns():
+                self.assertEqual(
+                    getattr(protein, column.value), row[column.value]
+                )
+
+    def test_ingest_updates_existing_entries(self):
+        protein = Protein(uniprot_id="P31946", taxon_id=0, reviewed=False)
+        protein.save(self.session, commit=True)
+        protein_id = protein.id
+
+        inserted, updated = ingest_dat(records_path, self.session)
+        self.assertEqual((inserted, updated), (2, 1))
+        self.session.expire_all()
+        protein = Protein.get_by_uniprot_id("P31946")
+        self.assertEqual(protein.id, protein_id)
+        self.assertEqual(protein.taxon_id, 9606)
+        self.assertTrue(protein.reviewed)
+
+        inserted, updated = ingest_dat(records_path, self.session)
+        self.assertEqual((inserted, updated), (0, 3))
+        self.assertEqual(Protein.query.count(), 3)
+
+    def test_upsert_keeps_last_duplicate(self):
+        rows = [protein_row(p) for p in iter_dat_records(records_path)]
+        duplicate = dict(rows[0], gene_id='DUP')
+        counts = upsert_protein_rows(rows + [duplicate], self.session)
+        self.session.commit()
+        self.assertEqual(counts, (3, 0))
+        self.assertEqual(
+            Protein.get_by_uniprot_id(rows[0]['uniprot_id']).gene_id, 'DUP'
+        )
+
+    def test_parallel_ingest_matches_serial(self):
+        ingest_dat(records_path, self.session, chunk_bytes=100)
+        serial = [
+            tuple(getattr(p, c.value) for c in Protein.columns())
+            for p in Protein.query.order_by(Protein.uniprot_id)
+        ]
+        delete_database(self.session)
+
+        inserted, _ = ingest_dat(
+            records_path, self.session, n_jobs=2, chunk_bytes=100,
+            max_pending=1
+        )
+        self.assertEqual(inserted, 3)
+        self.session.expire_all()
+        parallel = [
+            tuple(getattr(p, c.value) for c in Protein.columns())
+            for p in Protein.query.order_by(Protein.uniprot_id)
+        ]
+        self.assertEqual(serial, parallel)
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from unittest import TestCase
+
+from ..database import create_session, delete_database, cleanup_database
+from ..database.models import Interaction, Protein
+from ..predict.matrix_cache import DesignMatrixCache, database_version
+from ..predict.utilities import (
+    interactions_to_Xy_format,
+    load_training_dataset,
+    load_validation_dataset,
+    load_interactome_dataset
+)
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+base_path = os.path.dirname(__file__)
+db_path = os.path.normpath("{}/databases/test.db".format(base_path))
+
+
+class TestDesignMatrixCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DesignMatrixCache(self.directory)
+        self.session, self.engine = create_session(db_path)
+        delete_database(session=self.session)
+
+        self.protein_a = Protein(uniprot_id="A", taxon_id=9606, reviewed=True)
+        self.protein_b = Protein(uniprot_id="B", taxon_id=9606, reviewed=True)
+        self.protein_a.save(self.session, commit=True)
+        self.protein_b.save(self.session, commit=True)
+
+        self.i1 = Interaction(  # training only
+            source=self.protein_a.id, target=self.protein_a.id,
+            is_holdout=False, is_training=True, is_interactome=False,
+            label='activation', go_mf='GO:21,GO:21', go_bp='GO:22',
+            interpro='IPR21', pfam='PF21'
+        )
+        self.i2 = Interaction(  # holdout and interactome
+            source=self.protein_a.id, target=self.protein_b.id,
+            is_holdout=True, is_training=False, is_interactome=True,
+            label='activation,inhibition', go_mf='GO:31', go_bp='GO:22',
+            pfam='PF21'
+        )
+        self.i3 = Interaction(  # training and interactome
+            source=self.protein_b.id, target=self.protein_b.id,
+            is_holdout=False, is_training=True, is_interactome=True,
+            label='inhibition', go_cc='GO:43', pfam='PF41'
+        )
+        for interaction in (self.i1, self.i2, self.i3):
+            interaction.save(self.session, commit=True)
+
+    def tearDown(self):
+        delete_database(session=self.session)
+        cleanup_database(self.session, self.engine)
+        shutil.rmtree(self.directory)
+
+    def test_vectorized_validation_matches_count_vectorizer(self):
+        data = load_validation_dataset(vectorize=True, cache=self.cache)
+        X_text, _ = interactions_to_Xy_format(
+            [self.i1, self.i3, self.i2], ['go_mf', 'go_cc', 'go_bp',
+                                          'interpro', 'pfam']
+        )
+        vectorizer = CountVectorizer(lowercase=False)
+        expected = vectorizer.fit_transform(X_text).toarray()
+
+        self.assertEqual(data['vocabulary'], vectorizer.vocabulary_)
+        self.assertTrue(np.array_equal(
+            data['training'][0].toarray(), expected[:2]))
+        self.assertTrue(np.array_equal(
+            data['testing'][0].toarray(), expected[2:]))
+        self.assertEqual(data['training'][1].tolist(), [[1, 0], [0, 1]])
+        self.assertEqual(data['testing'][1].tolist(), [[1, 1]])
+        self.assertEqual(data['labels'], ['Activation', 'Inhibition'])
+        self.assertEqual(
+            data['joint_ids'],
+            {'training': [self.i1.joint_id, self.i3.joint_id],
+             'testing': [self.i2.joint_id]}
+        )
+
+    def test_second_load_is_read_from_cache(self):
+        first = load_training_dataset(vectorize=True, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        second = load_training_dataset(vectorize=True, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.assertEqual(first['vocabulary'], second['vocabulary'])
+        self.assertEqual(first['joint_ids'], second['joint_ids'])
+        self.assertTrue(np.array_equal(
+            first['training'][0].toarray(), second['training'][0].toarray()
+        ))
+        self.assertTrue(np.array_equal(
+            first['training'][1], second['training'][1]
+        ))
+
+    def test_database_change_invalidates_entry(self):
+        version = database_version()
+        load_training_dataset(vectorize=True, cache=self.cache)
+
+        self.i1.label = 'inhibition'
+        self.i1.save(self.session, commit=True)
+        self.assertNotEqual(version, database_version())
+
+        data = load_training_dataset(vectorize=True, cache=self.cache)
+        self.assertEqual(self.cache.misses, 2)
+        row = data['joint_ids']['training'].index(self.i1.joint_id)
+        self.assertEqual(data['training'][1][row].tolist(), [0, 1])
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_version_changes_on_writes_to_each_table(self):
+        interactions = database_version(self.session)
+        both = database_version(self.session, proteins=True)
+        self.assertEqual(interactions, database_version(self.session))
+
+        self.session.query(Protein).filter(Protein.id == self.protein_a.id) \
+            .update({'go_mf': 'GO:0001618'}, synchronize_session=False)
+        self.session.commit()
+        self.assertEqual(interactions, database_version(self.session))
+        self.assertNotEqual(
+            both, database_version(self.session, proteins=True))
+
+        self.session.query(Interaction).filter(
+            Interaction.id == self.i1.id).delete(synchronize_session=False)
+        self.session.commit()
+        self.assertNotEqual(interactions, database_version(self.session))
+
+    def test_different_settings_do_not_hit(self):
+        load_training_dataset(vectorize=True, cache=self.cache)
+        data = load_training_dataset(
+            vectorize=True, binary=True, cache=self.cache
+        )
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(data['training'][0].max(), 1)
+
+        load_training_dataset(
+            vectorize=True, selection=['pfam'], cache=self.cache
+        )
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_interactome_uses_supplied_vocabulary(self):
+        vocabulary = {'GO22': 0, 'PF21': 1, 'PF41': 2}
+        X, joint_ids = load_interactome_dataset(
+            vectorize=True, vocabulary=vocabulary, cache=self.cache
+        )
+        self.assertEqual(joint_ids, [self.i2.joint_id, self.i3.joint_id])
+        self.assertEqual(X.toarray().tolist(), [[1, 1, 0], [0, 0, 1]])
+
+        vocabulary['GO31'] = 3
+        X, _ = load_interactome_dataset(
+            vectorize=True, vocabulary=vocabulary, cache=self.cache
+        )
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(X.toarray().tolist(), [[1, 1, 0, 1], [0, 0, 1, 0]])
+
+    def test_disabled_cache_writes_nothing(self):
+        data = load_training_dataset(vectorize=True, cache=False)
+        self.assertEqual(data['training'][0].shape[0], 3)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_returns_empty_dict_non_matching_taxon(self):
+        data = load_validation_dataset(
+            taxon_id=0, vectorize=True, cache=self.cache
+        )
+        self.assertEqual(data, {})
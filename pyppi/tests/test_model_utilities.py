@@ -12,6 +12,8 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.feature_extraction.text import CountVectorizer
 
 from ..base.constants import MAX_SEED
+from ..data_mining.features import GOTermProjector
+from ..models.feature_selection import LabelFeatureSelector
 from ..models.utilities import (
     get_parameter_distribution_for_model,
     make_classifier,
@@ -100,6 +102,49 @@ class TestMakeGridSearchClf(TestCase):
         self.assertEqual(cv.n_splits, 5)
         self.assertEqual(cv.random_state, cv_random_state)
 
+    def test_projection_is_first_pipeline_step(self):
+        projection = GOTermProjector(max_depth=2)
+        clf = make_gridsearch_clf(
+            'LogisticRegression', rcv_splits=5, rcv_iter=50,
+            random_state=0, projection=projection
+        )
+        pipe = clf.estimator
+        self.assertEqual(
+            [name for (name, _) in pipe.steps],
+            ['projection', 'vectorizer', 'estimator']
+        )
+        self.assertIsInstance(pipe.steps[0][1], GOTermProjector)
+        self.assertEqual(pipe.steps[0][1].max_depth, 2)
+        self.assertIsNot(pipe.steps[0][1], projection)
+
+    def test_feature_selection_is_step_before_estimator(self):
+        clf = make_gridsearch_clf(
+            'RandomForestClassifier', rcv_splits=5, rcv_iter=50,
+            random_state=0, feature_selection='chi2'
+        )
+        pipe = clf.estimator
+        self.assertEqual(
+            [name for (name, _) in pipe.steps],
+            ['vectorizer', 'selector', 'estimator']
+        )
+        self.assertEqual(pipe.steps[1][1].score_func, 'chi2')
+        self.assertIn('selector__k', clf.param_distributions)
+        self.assertIn('selector__min_df', clf.param_distributions)
+
+    def test_feature_selection_without_vectorizer_pipeline(self):
+        selector = LabelFeatureSelector(score_func='positive_df', k=10)
+        clf = make_gridsearch_clf(
+            'LogisticRegression', rcv_splits=5, rcv_iter=50,
+            random_state=0, make_pipeline=False, feature_selection=selector
+        )
+        pipe = clf.estimator
+        self.assertEqual(
+            [name for (name, _) in pipe.steps], ['selector', 'estimator']
+        )
+        self.assertIsNot(pipe.steps[0][1], selector)
+        self.assertEqual(pipe.steps[0][1].k, 10)
+        self.assertNotIn('vectorizer__binary', clf.param_distributions)
+
     def test_make_pipeline_false_estimator_is_not_pipeline(self):
         clf = make_gridsearch_clf(
             'LogisticRegression', rcv_splits=5, rcv_iter=50, scoring='accuracy',
@@ -0,0 +1,120 @@
+import os
+import gzip
+from io import BytesIO
+from unittest import TestCase
+
+from ..data_mining.obo import iter_obo_terms, TERM_FIELDS, _iter_lines
+from ..data_mining.psimi import parse_miobo_file
+
+base_path = os.path.dirname(__file__)
+test_mi_file = '{}/{}'.format(base_path, "test_data/mi.obo.gz")
+
+OBO = b"""format-version: 1.2
+data-version: releases/2018-03-08
+default-namespace: gene_ontology
+
+[Term]
+id: GO:0000001
+name: root term
+namespace: biological_process
+
+[Term]
+id: GO:0000002
+alt_id: GO:0000003
+alt_id: GO:0000004
+name: child: with a colon
+namespace: biological_process
+is_a: GO:0000001 ! root term
+relationship: part_of GO:0000005 ! other term
+relationship: regulates GO:0000001 ! root term
+is_obsolete: false
+
+[Term]
+id: GO:0000005
+name: other term
+namespace: cellular_component
+is_a: GO:0000001 {source="GOC:test"} ! root term
+is_obsolete: true
+
+[Typedef]
+id: part_of
+name: part of
+is_transitive: true
+"""
+
+
+class TestOboTokenizer(TestCase):
+
+    def test_yields_only_term_stanzas(self):
+        entries = list(iter_obo_terms(BytesIO(OBO)))
+        self.assertEqual(
+            [e['id'] for e in entries],
+            ["GO:0000001", "GO:0000002", "GO:0000005"]
+        )
+
+    def test_extracts_all_fields(self):
+        entry = list(iter_obo_terms(BytesIO(OBO)))[1]
+        self.assertEqual(set(entry.keys()), set(TERM_FIELDS))
+        self.assertEqual(entry['name'], "child: with a colon")
+        self.assertEqual(entry['namespace'], "biological_process")
+        self.assertEqual(entry['alt_id'], ["GO:0000003", "GO:0000004"])
+        self.assertEqual(entry['is_a'], ["GO:0000001"])
+        self.assertEqual(entry['part_of'], ["GO:0000005"])
+
+    def test_obsolete_flag_is_parsed_from_value(self):
+        entries = list(iter_obo_terms(BytesIO(OBO)))
+        self.assertEqual(
+            [e['is_obsolete'] for e in entries], [False, False, True]
+        )
+
+    def test_strips_qualifiers_from_references(self):
+        entry = list(iter_obo_terms(BytesIO(OBO)))[2]
+        self.assertEqual(entry['is_a'], ["GO:0000001"])
+
+    def test_extracts_only_requested_fields(self):
+        entry = list(iter_obo_terms(BytesIO(OBO), ('id', 'is_obsolete')))[2]
+        self.assertEqual(entry, {'id': "GO:0000005", 'is_obsolete': True})
+
+    def test_missing_fields_have_defaults(self):
+        entry = list(iter_obo_terms(BytesIO(OBO)))[0]
+        self.assertEqual(entry['alt_id'], [])
+        self.assertEqual(entry['is_a'], [])
+        self.assertEqual(entry['part_of'], [])
+        self.assertFalse(entry['is_obsolete'])
+
+    def test_handles_windows_line_endings(self):
+        entries = list(iter_obo_terms(BytesIO(OBO.replace(b'\n', b'\r\n'))))
+        self.assertEqual(
+            list(iter_obo_terms(BytesIO(OBO))), entries
+        )
+
+    def test_handles_lines_split_across_blocks(self):
+        lines = list(_iter_lines(BytesIO(OBO), size=7))
+        self.assertEqual(lines, OBO.splitlines())
+
+    def test_can_read_gzip_stream(self):
+        fp = gzip.open(BytesIO(gzip.compress(OBO)), 'rb')
+        self.assertEqual(
+            list(iter_obo_terms(fp)), list(iter_obo_terms(BytesIO(OBO)))
+        )
+
+    def test_raises_error_on_unsupported_version(self):
+        obo = OBO.replace(b"format-version: 1.2", b"format-version: 1.4")
+        with self.assertRaises(ValueError):
+            list(iter_obo_terms(BytesIO(obo)))
+
+
+class TestMiOboParser(TestCase):
+
+    def setUp(self):
+        self.graph = parse_miobo_file(test_mi_file)
+
+    def test_can_parse_mi_file(self):
+        term = self.graph["MI:0004"]
+        self.assertEqual(term.id, "MI:0004")
+        self.assertEqual(term.name, "affinity chromatography technology")
+        self.assertFalse(term.is_obsolete)
+
+    def test_obsolete_terms_are_flagged(self):
+        obsolete = set(t.id for t in self.graph.values() if t.is_obsolete)
+        self.assertEqual(len(obsolete), 167)
@@ -1,18 +1,37 @@
 import os
+import shutil
+import tempfile
+import tracemalloc
 from unittest import TestCase
 
 from ..data_mining.ontology import get_active_instance
 from ..data_mining.ontology import (
     get_up_to_lca,
+    get_up_to_lca_many,
     get_lca_of_terms,
     group_terms_by_ontology_type,
     filter_obsolete_terms,
-    parse_obo12_file
+    parse_obo12_file,
+    GOTerm,
+    GODagIndex,
+    save_go_snapshot,
+    load_go_snapshot,
+    load_or_compile_snapshot,
+    snapshot_directory,
+    set_active_instance,
+    get_ulca_cache,
+    ULCACache,
+    GODag,
+    diff_go_dags,
+    get_affected_terms,
+    parse_go_slim,
+    namespaces_for_selection
 )
+from ..data_mining import ontology
 
 base_path = os.path.dirname(__file__)
 test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
-dag = get_active_instance(filename=test_obo_file)
+dag = get_active_instance(filename=test_obo_file, use_snapshot=False)
 
 
 class TestULCAInducer(TestCase):
@@ -72,6 +91,38 @@ class TestULCAInducer(TestCase):
         induced = get_up_to_lca(p1, p2)
         self.assertEqual(list(sorted(expected)), list(sorted(induced)))
 
+    def test_ulca_many_is_identical_to_single_pair_inducer(self):
+        pairs = [
+            (["GO:0007154", "GO:0050794"], ["GO:0050794", "GO:0051716"]),
+            (["GO:0007154"], ["GO:0050794"]),
+            (["GO:0008150"], ["GO:0008150"]),
+            (["GO:0008150"], []),
+            ([], ["GO:0008150"]),
+            (["GO:0016459", "GO:0015629"], ["GO:0044430"]),
+            (["GO:0001618"], ["GO:0007165", "GO:0000975"]),
+            (["GO:0104005"], ["GO:0016459"]),
+        ]
+        expected = [get_up_to_lca(p1, p2) for (p1, p2) in pairs]
+        self.assertEqual(get_up_to_lca_many(pairs), expected)
+        self.assertEqual(get_up_to_lca_many(pairs, batch_size=3), expected)
+
+    def test_ulca_many_handles_empty_input(self):
+        self.assertEqual(get_up_to_lca_many([]), [])
+
+    def test_ulca_inducer_accepts_plain_dict_dag(self):
+        root = GOTerm("GO:1", "root", "biological_process", [], [], False)
+        a = GOTerm("GO:2", "a", "biological_process", [root], [], False)
+        b = GOTerm("GO:3", "b", "biological_process", [root], [], False)
+        plain = {t.id: t for t in [root, a, b]}
+
+        expected = ["GO:1", "GO:1", "GO:2", "GO:3"]
+        induced = get_up_to_lca(["GO:2"], ["GO:3"], dag=plain)
+        self.assertEqual(sorted(expected), sorted(induced))
+        self.assertEqual(
+            get_up_to_lca_many([(["GO:2"], ["GO:3"])], dag=plain),
+            [induced]
+        )
+
     def test_can_parse_obo_file(self):
         self.assertEqual(len(dag), 49209)
         expected = str({
@@ -214,6 +265,21 @@ class TestULCAInducer(TestCase):
         }
         self.assertEqual(grouped, expected)
 
+    def test_group_by_ontology_uses_given_dag(self):
+        other = {
+            "GO:1": GOTerm("GO:1", "a", "cellular_component", [], [], False),
+            "GO:2": GOTerm("GO:2", "b", "biological_process", [], [], False),
+        }
+        grouped = group_terms_by_ontology_type(
+            term_ids=["GO:1", "GO:2", "GO:2"], max_count=1, dag=other
+        )
+        expected = {
+            'cc': ["GO:1"],
+            'bp': ["GO:2"],
+            'mf': [],
+        }
+        self.assertEqual(grouped, expected)
+
     def test_can_filter_obsolete_terms(self):
         result = filter_obsolete_terms(["GO:0000005", "GO:0000006"])
         expected = ["GO:0000006"]
@@ -221,3 +287,422 @@ class TestULCAInducer(TestCase):
 
     def test_can_parse_alt_ids(self):
         self.assertEqual(dag['GO:0000975'].id, 'GO:0044212')
+
+
+class TestGODagIndex(TestCase):
+
+    def setUp(self):
+        self.index = dag.index
+
+    def test_parser_builds_index(self):
+        self.assertIsInstance(self.index, GODagIndex)
+        self.assertEqual(
+            len(self.index), len(set(t.id for t in dag.values()))
+        )
+
+    def test_index_maps_alt_ids_to_primary_term(self):
+        i = self.index.index_of('GO:0000975')
+        self.assertEqual(self.index.ids[i], 'GO:0044212')
+        self.assertEqual(i, self.index.index_of('GO:0044212'))
+
+    def test_ancestor_closure_matches_traversal(self):
+        i = self.index.index_of("GO:0007165")
+        result = sorted(self.index.ids[j] for j in self.index.ancestors(i))
+        expected = sorted([
+            "GO:0007154",
+            "GO:0050789",
+            "GO:0008150",
+            "GO:0009987",
+            "GO:0051716",
+            "GO:0023052",
+            "GO:0050794",
+            "GO:0050896",
+            "GO:0065007",
+        ])
+        self.assertEqual(result, expected)
+
+    def test_has_ancestor(self):
+        i = self.index.index_of("GO:0007165")
+        j = self.index.index_of("GO:0008150")
+        self.assertTrue(self.index.has_ancestor(i, j))
+        self.assertFalse(self.index.has_ancestor(j, i))
+
+    def test_index_depth_matches_term_depth(self):
+        for tid in ["GO:0007165", "GO:0023052", "GO:0008150"]:
+            i = self.index.index_of(tid)
+            self.assertEqual(self.index.depth[i], dag[tid].depth)
+
+    def test_lowest_common_ancestors(self):
+        indices = [
+            self.index.index_of("GO:0007154"),
+            self.index.index_of("GO:0051716")
+        ]
+        result = self.index.lowest_common_ancestors(indices)
+        self.assertEqual(result, [self.index.index_of("GO:0009987")])
+
+    def test_lowest_common_ancestors_returns_None_if_none_shared(self):
+        indices = [self.index.index_of("GO:0008150")]
+        self.assertIsNone(self.index.lowest_common_ancestors(indices))
+        self.assertIsNone(self.index.lowest_common_ancestors([]))
+
+    def test_all_parents_without_index_visits_each_term_once(self):
+        root = GOTerm("GO:1", "root", "biological_process", [], [], False)
+        a = GOTerm("GO:2", "a", "biological_process", [root], [], False)
+        b = GOTerm("GO:3", "b", "biological_process", [root], [a], False)
+        c = GOTerm("GO:4", "c", "biological_process", [a, b], [], False)
+        self.assertEqual(c.all_parents, set([root, a, b]))
+        self.assertTrue(c.has_ancestor(root))
+        self.assertEqual(c.depth, 3)
+
+
+class TestGOSnapshot(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+        save_go_snapshot(dag, self.path)
+        self.loaded = load_go_snapshot(self.path)
+
+    def tearDown(self):
+        self.loaded = None
+        shutil.rmtree(self.directory)
+
+    def test_snapshot_contains_same_accessions(self):
+        self.assertEqual(set(self.loaded.keys()), set(dag.keys()))
+        self.assertEqual(len(self.loaded), len(dag))
+
+    def test_snapshot_terms_match_parsed_terms(self):
+        for tid in ["GO:0007165", "GO:0001618", "GO:0016459", "GO:0000005"]:
+            self.assertEqual(str(self.loaded[tid]), str(dag[tid]))
+            self.assertEqual(self.loaded[tid].depth, dag[tid].depth)
+            self.assertEqual(
+                sorted(t.id for t in self.loaded[tid].all_parents),
+                sorted(t.id for t in dag[tid].all_parents)
+            )
+
+    def test_snapshot_resolves_children(self):
+        term = self.loaded["GO:0015629"]
+        self.assertEqual(
+            sorted(t.id for t in term.has_part),
+            sorted(t.id for t in dag["GO:0015629"].has_part)
+        )
+        self.assertEqual(
+            sorted(t.id for t in term.has_a),
+            sorted(t.id for t in dag["GO:0015629"].has_a)
+        )
+
+    def test_snapshot_maps_alt_ids(self):
+        self.assertEqual(self.loaded['GO:0000975'].id, 'GO:0044212')
+        self.assertIs(self.loaded['GO:0000975'], self.loaded['GO:0044212'])
+
+    def test_snapshot_terms_are_created_lazily(self):
+        self.assertIsNone(self.loaded.index._terms[0])
+        self.loaded[self.loaded.index.ids[0]]
+        self.assertIsNotNone(self.loaded.index._terms[0])
+
+    def test_snapshot_ulca_matches_parsed_dag(self):
+        p1 = ["GO:0007154", "GO:0050794"]
+        p2 = ["GO:0050794", "GO:0051716"]
+        self.assertEqual(
+            sorted(get_up_to_lca(p1, p2, dag=self.loaded)),
+            sorted(get_up_to_lca(p1, p2, dag=dag))
+        )
+
+    def test_snapshot_is_keyed_by_file_hash(self):
+        path = snapshot_directory(test_obo_file, self.directory)
+        self.assertFalse(os.path.isdir(path))
+        compiled = load_or_compile_snapshot(test_obo_file, self.directory)
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(len(compiled), len(dag))
+
+        loaded = load_or_compile_snapshot(test_obo_file, self.directory)
+        self.assertIsNone(loaded.index._terms[0])
+        self.assertEqual(len(loaded), len(dag))
+
+
+class TestULCACache(TestCase):
+
+    def setUp(self):
+        self.cache = get_ulca_cache()
+        self.cache.clear()
+        self.maxsize = self.cache.maxsize
+
+    def tearDown(self):
+        self.cache.resize(self.maxsize)
+        set_active_instance(dag)
+
+    def test_repeated_annotation_sets_hit_cache(self):
+        p1 = ["GO:0007154", "GO:0050794"]
+        p2 = ["GO:0050794", "GO:0051716"]
+        first = get_up_to_lca(p1, p2)
+        info = self.cache.cache_info()
+        self.assertEqual(info.hits, 0)
+        self.assertEqual(info.misses, 3)
+
+        second = get_up_to_lca(list(reversed(p2)), p1)
+        self.assertEqual(sorted(first), sorted(second))
+        self.assertEqual(self.cache.cache_info().hits, 3)
+        self.assertEqual(self.cache.cache_info().misses, 3)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.resize(1)
+        get_up_to_lca(["GO:0007154"], ["GO:0050794"])
+        get_up_to_lca(["GO:0016459"], ["GO:0015629"])
+        self.assertEqual(self.cache.cache_info().currsize, 2)
+
+        get_up_to_lca(["GO:0007154"], ["GO:0050794"])
+        self.assertEqual(self.cache.cache_info().hits, 0)
+
+    def test_size_zero_disables_cache(self):
+        self.cache.resize(0)
+        get_up_to_lca(["GO:0007154"], ["GO:0050794"])
+        get_up_to_lca(["GO:0007154"], ["GO:0050794"])
+        self.assertEqual(self.cache.cache_info().hits, 0)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_cache_cleared_when_different_dag_activated(self):
+        get_up_to_lca(["GO:0007154"], ["GO:0050794"])
+        self.assertGreater(len(self.cache), 0)
+
+        set_active_instance(dag)
+        self.assertGreater(len(self.cache), 0)
+
+        other = GODag(index=GODagIndex.from_arrays(dag.index.arrays))
+        set_active_instance(other)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.cache_info().misses, 0)
+
+        induced = get_up_to_lca(["GO:0007154"], ["GO:0050794"])
+        self.assertIs(self.cache.index, other.index)
+        self.assertEqual(
+            sorted(induced),
+            sorted(get_up_to_lca(["GO:0007154"], ["GO:0050794"], dag=dag))
+        )
+        self.assertIs(self.cache.index, dag.index)
+
+    def test_unbounded_cache(self):
+        cache = ULCACache(maxsize=None)
+        cache.bind(dag.index)
+        for tid in ["GO:0007154", "GO:0050794", "GO:0016459"]:
+            cache.ancestor_union(frozenset([dag.index.index_of(tid)]))
+        self.assertEqual(cache.cache_info(), (0, 3, None, 3))
+
+
+def _make_dag(edges, obsolete=(), alt_ids=None):
+    terms = {}
+    for tid in sorted(edges.keys()):
+        terms[tid] = GOTerm(
+            tid, tid, "biological_process", [], [], tid in obsolete
+        )
+    for tid, parents in edges.items():
+        terms[tid].is_a = set(terms[p] for p in parents)
+    for alt_tid, tid in (alt_ids or {}).items():
+        terms[alt_tid] = terms[tid]
+    return terms
+
+
+class TestGODagDiff(TestCase):
+
+    def setUp(self):
+        self.old = _make_dag({
+            "GO:1": [], "GO:2": ["GO:1"], "GO:3": ["GO:1"],
+            "GO:4": ["GO:2"], "GO:5": ["GO:4"], "GO:6": ["GO:1"],
+            "GO:7": ["GO:3"], "GO:8": ["GO:1"]
+        }, alt_ids={"GO:9": "GO:8"})
+        self.new = _make_dag({
+            "GO:1": [], "GO:2": ["GO:1"], "GO:3": ["GO:1"],
+            "GO:4": ["GO:3"], "GO:5": ["GO:4"], "GO:6": ["GO:1"],
+            "GO:8": [], "GO:10": ["GO:2"]
+        }, obsolete=["GO:8"], alt_ids={"GO:7": "GO:3", "GO:9": "GO:8"})
+
+    def test_diff_reports_changes(self):
+        diff = diff_go_dags(self.old, self.new)
+        self.assertEqual(diff['added'], set(["GO:10"]))
+        self.assertEqual(diff['removed'], set(["GO:7"]))
+        self.assertEqual(diff['obsoleted'], set(["GO:8"]))
+        self.assertEqual(diff['reparented'], set(["GO:4", "GO:8"]))
+
+    def test_diff_of_identical_dags_is_empty(self):
+        diff = diff_go_dags(dag, dag)
+        self.assertEqual(
+            diff, dict(
+                added=set(), removed=set(), obsoleted=set(),
+                reparented=set()
+            )
+        )
+
+    def test_affected_terms_include_descendants_and_alt_ids(self):
+        affected = get_affected_terms(self.old, self.new)
+        self.assertEqual(
+            affected, set(["GO:4", "GO:5", "GO:7", "GO:8", "GO:9"])
+        )
+
+
+class TestParseGOSlim(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'goslim.obo')
+        with open(self.path, 'wt') as fp:
+            fp.write(
+                "format-version: 1.2\n\n"
+                "[Term]\nid: GO:0008150\nname: biological_process\n\n"
+                "[Term]\nid: GO:0000001\nname: old\nis_obsolete: true\n\n"
+                "[Term]\nid: GO:0009987\nname: cellular process\n"
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parses_non_obsolete_slim_terms(self):
+        self.assertEqual(
+            parse_go_slim(self.path), ["GO:0008150", "GO:0009987"]
+        )
+
+
+class TestNamespaceLoading(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.active = get_active_instance()
+
+    def tearDown(self):
+        set_active_instance(self.active)
+        shutil.rmtree(self.directory)
+
+    def test_namespaces_for_selection(self):
+        self.assertEqual(
+            namespaces_for_selection(['go_mf', 'ulca_go_cc', 'pfam']),
+            frozenset(['molecular_function', 'cellular_component'])
+        )
+        self.assertEqual(
+            namespaces_for_selection(['interpro', 'pfam']), frozenset()
+        )
+
+    def test_restricted_dag_contains_namespace_and_ancestors(self):
+        restricted = parse_obo12_file(
+            test_obo_file, namespaces=['cellular_component']
+        )
+        self.assertEqual(
+            restricted.namespaces, frozenset(['cellular_component'])
+        )
+        self.assertLess(len(restricted.index), len(dag.index))
+        for tid in dag.index.ids:
+            term = dag[tid]
+            if term.namespace == 'cellular_component':
+                self.assertIn(tid, restricted)
+                self.assertEqual(
+                    set(p.id for p in restricted[tid].is_a),
+                    set(p.id for p in term.is_a)
+                )
+                for i in dag.index.ancestors(dag.index.index_of(tid)):
+                    self.assertIn(dag.index.ids[i], restricted)
+            elif tid not in restricted:
+                self.assertNotEqual(term.namespace, 'cellular_component')
+        self.assertNotIn("GO:0007154", restricted)
+
+    def test_unknown_namespace_raises(self):
+        with self.assertRaises(ValueError):
+            parse_obo12_file(test_obo_file, namespaces=['cc'])
+
+    def test_restricted_ulca_matches_full_dag(self):
+        restricted = parse_obo12_file(
+            test_obo_file, namespaces=['biological_process']
+        )
+        p1 = ["GO:0007154", "GO:0050794"]
+        p2 = ["GO:0051716"]
+        self.assertEqual(
+            get_up_to_lca(p1, p2, restricted), get_up_to_lca(p1, p2, dag)
+        )
+
+    def test_restricted_snapshot_is_keyed_by_namespaces(self):
+        full = snapshot_directory(test_obo_file, self.directory)
+        mf = snapshot_directory(
+            test_obo_file, self.directory, ['molecular_function'])
+        self.assertNotEqual(full, mf)
+
+        compiled = load_or_compile_snapshot(
+            test_obo_file, self.directory, ['molecular_function']
+        )
+        loaded = load_go_snapshot(mf)
+        self.assertEqual(loaded.namespaces, frozenset(['molecular_function']))
+        self.assertEqual(loaded.index.ids, compiled.index.ids)
+        self.assertFalse(os.path.isdir(full))
+
+    def test_active_instance_loads_nothing_without_namespaces(self):
+        ontology.__GODAG__ = None
+        self.assertIsNone(get_active_instance(namespaces=[]))
+        self.assertIsNone(ontology.__GODAG__)
+
+    def test_active_instance_reloads_when_namespaces_missing(self):
+        ontology.__GODAG__ = None
+        mf = get_active_instance(
+            filename=test_obo_file, use_snapshot=False,
+            namespaces=['molecular_function']
+        )
+        self.assertEqual(mf.namespaces, frozenset(['molecular_function']))
+        self.assertIs(
+            get_active_instance(namespaces=['molecular_function']), mf
+        )
+        self.assertIs(get_active_instance(namespaces=[]), mf)
+
+        both = get_active_instance(
+            filename=test_obo_file, use_snapshot=False,
+            namespaces=['cellular_component']
+        )
+        self.assertEqual(
+            both.namespaces,
+            frozenset(['molecular_function', 'cellular_component'])
+        )
+        full = get_active_instance(
+            filename=test_obo_file, use_snapshot=False
+        )
+        self.assertIsNone(full.namespaces)
+        self.assertEqual(len(full.index), len(dag.index))
+
+
+class TestGOTermMemory(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = snapshot_directory(test_obo_file, self.directory)
+        save_go_snapshot(dag, path)
+        self.dag = load_go_snapshot(path, mmap_mode=None)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_terms_do_not_have_instance_dicts(self):
+        term = self.dag["GO:0007154"]
+        self.assertFalse(hasattr(term, '__dict__'))
+        with self.assertRaises(AttributeError):
+            term.other = 1
+
+    def test_term_api_is_read_from_index(self):
+        term = self.dag["GO:0050794"]
+        expected = dag["GO:0050794"]
+        self.assertEqual(term.id, expected.id)
+        self.assertEqual(term.name, expected.name)
+        self.assertEqual(term.namespace, expected.namespace)
+        self.assertEqual(term.depth, expected.depth)
+        self.assertEqual(term.is_obsolete, expected.is_obsolete)
+        self.assertEqual(
+            sorted(p.id for p in term.parents),
+            sorted(p.id for p in expected.parents)
+        )
+
+    def test_memory_per_materialised_term(self):
+        ids = self.dag.index.ids
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            terms = [self.dag[tid] for tid in ids]
+            for term in terms:
+                (term.id, term.namespace, term.parents, term.depth,
+                 term.is_obsolete)
+            used = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        # A term is a slotted record plus a slot in the index term list and
+        # in the list above. A dict based term with four sets is over 1KB.
+        self.assertLess(used / len(terms), 200)
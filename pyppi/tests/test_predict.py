@@ -1,14 +1,16 @@
+import io
 import os
 import numpy as np
 from itertools import product
 from Bio import SwissProt
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from ..database import create_session, delete_database, cleanup_database
 from ..database.models import Interaction, Protein
 from ..database.utilities import create_interaction
 from ..database.exceptions import ObjectAlreadyExists
 
+from ..data_mining import uniprot
 from ..data_mining.uniprot import parse_record_into_protein
 from ..data_mining.features import compute_interaction_features
 from ..data_mining.ontology import get_active_instance
@@ -29,9 +31,12 @@ from sklearn.feature_extraction.text import CountVectorizer
 
 base_path = os.path.dirname(__file__)
 db_path = os.path.normpath("{}/databases/test.db".format(base_path))
+records_path = os.path.normpath(
+    "{}/test_data/test_sprot_records.dat".format(base_path)
+)
 
 test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
-dag = get_active_instance(filename=test_obo_file)
+dag = get_active_instance(filename=test_obo_file, use_snapshot=False)
 
 
 class TestCheckClassifierAndSelection(TestCase):
@@ -45,9 +50,29 @@ class TestCheckClassifierAndSelection(TestCase):
             _check_classifier_and_selection(classifier=1, selection=['1'])
 
 
+def fake_download(accessions, taxon_id=9606, **kwargs):
+    # Serves the test records, and a mouse copy of one under Q3TYD4, in
+    # place of the UniProt service.
+    with open(records_path, 'rt') as fp:
+        text = fp.read()
+    records = {r.accessions[0]: r for r in SwissProt.parse(io.StringIO(text))}
+    mouse = text.split('//\n')[0].replace('AC   P31946;', 'AC   Q3TYD4;')
+    records['Q3TYD4'] = SwissProt.read(io.StringIO(
+        mouse.replace('NCBI_TaxID=9606', 'NCBI_TaxID=10090') + '//\n'))
+    found = [records.get(a, None) for a in accessions]
+    return [
+        r if r is None or taxon_id is None or
+        int(r.taxonomy_id[0]) == taxon_id else None for r in found
+    ]
+
+
 class TestUpdateMissingProteinMap(TestCase):
 
     def setUp(self):
+        patcher = mock.patch.object(
+            uniprot, 'async_download', side_effect=fake_download)
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.session, self.engine = create_session(db_path)
         self.p1 = Protein(uniprot_id='A', taxon_id=9606, reviewed=True)
         self.p2 = Protein(uniprot_id='B', taxon_id=1, reviewed=True)
@@ -6,6 +6,7 @@ from unittest import TestCase
 from ..base.constants import MAX_SEED
 from ..database import create_session, delete_database, cleanup_database
 from ..database.models import Interaction, Protein
+from ..data_mining.ontology import parse_obo12_file
 
 from ..models.binary_relevance import MixedBinaryRelevanceClassifier
 from ..models.classifier_chain import KRandomClassifierChains
@@ -17,6 +18,7 @@ from ..predict.utilities import (
     load_dataset,
     paper_model,
     interactions_to_Xy_format,
+    interactions_to_csr,
     load_training_dataset,
     load_validation_dataset,
     load_interactome_dataset,
@@ -102,6 +104,91 @@ class TestInteractionsToXyFormat(TestCase):
         self.assertEqual(result_y, y)
 
 
+class TestInteractionsToCSR(TestCase):
+
+    def setUp(self):
+        self.session, self.engine = create_session(db_path)
+        delete_database(session=self.session)
+
+        self.protein_a = Protein(uniprot_id="A", taxon_id=9606, reviewed=True)
+        self.protein_b = Protein(uniprot_id="B", taxon_id=9606, reviewed=True)
+        self.protein_a.save(self.session, commit=True)
+        self.protein_b.save(self.session, commit=True)
+
+        self.interactions = [
+            Interaction(
+                source=self.protein_a, target=self.protein_b,
+                go_mf='GO:1,GO:1', go_bp='GO:2', interpro='IPR4', pfam='PF5',
+                ulca_go_mf='GO:6'
+            ),
+            Interaction(
+                source=self.protein_a, target=self.protein_a,
+                go_mf='GO:1', go_cc='GO:3', pfam='PF5'
+            ),
+        ]
+        for interaction in self.interactions:
+            interaction.save(self.session, commit=True)
+        self.selection = [
+            Interaction.columns().GO_MF,
+            Interaction.columns().GO_BP,
+            Interaction.columns().GO_CC,
+            Interaction.columns().PFAM,
+        ]
+
+    def tearDown(self):
+        delete_database(session=self.session)
+        cleanup_database(self.session, self.engine)
+
+    def test_matches_count_vectorizer(self):
+        X_text, _ = interactions_to_Xy_format(
+            self.interactions, self.selection
+        )
+        vectorizer = CountVectorizer(lowercase=False)
+        expected = vectorizer.fit_transform(X_text)
+
+        X, vocabulary = interactions_to_csr(
+            self.interactions, self.selection, session=self.session
+        )
+        self.assertEqual(vocabulary, vectorizer.vocabulary_)
+        self.assertTrue(np.array_equal(X.toarray(), expected.toarray()))
+
+    def test_uses_supplied_vocabulary_and_binary(self):
+        vocabulary = {'GO1': 0, 'PF5': 1, 'GO99': 2}
+        X, result = interactions_to_csr(
+            self.interactions, self.selection, vocabulary=vocabulary,
+            binary=True, session=self.session
+        )
+        self.assertIs(result, vocabulary)
+        self.assertEqual(X.toarray().tolist(), [[1, 1, 0], [1, 1, 0]])
+
+    def test_appends_hashed_cross_columns(self):
+        self.protein_a.pfam = 'PF5'
+        self.protein_b.pfam = 'PF6,PF7'
+        self.protein_a.save(self.session, commit=True)
+        self.protein_b.save(self.session, commit=True)
+
+        X_text, vocabulary = interactions_to_csr(
+            self.interactions, self.selection, session=self.session
+        )
+        dag = parse_obo12_file(
+            "{}/test_data/test_go.obo.gz".format(base_path)
+        )
+        X, _ = interactions_to_csr(
+            self.interactions, self.selection + ['cross'],
+            session=self.session, n_cross_features=16, dag=dag
+        )
+        self.assertEqual(X.shape, (2, len(vocabulary) + 16))
+        self.assertTrue(np.array_equal(
+            X[:, :len(vocabulary)].toarray(), X_text.toarray()
+        ))
+        self.assertEqual(X[0, len(vocabulary):].sum(), 2)
+        self.assertEqual(X[1, len(vocabulary):].sum(), 1)
+
+    def test_Xy_format_rejects_cross_selection(self):
+        with self.assertRaises(ValueError):
+            interactions_to_Xy_format(self.interactions, ['go_mf', 'cross'])
+
+
 # ------------- PAPER MODEL ------------------------ #
 class TestPaperModel(TestCase):
 
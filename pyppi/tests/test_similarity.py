@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from types import SimpleNamespace
+from unittest import TestCase
+
+from ..data_mining.ontology import (
+    load_or_compile_snapshot, GOTerm, GODag, GODagIndex
+)
+from ..data_mining.similarity import (
+    similarity_feature_names,
+    count_annotations,
+    information_content,
+    information_content_path,
+    save_information_content,
+    load_information_content,
+    term_pair_similarity,
+    compute_similarity_features_many
+)
+
+base_path = os.path.dirname(__file__)
+test_obo_file = '{}/{}'.format(base_path, "test_data/test_go.obo.gz")
+
+
+def _make_dag(edges):
+    terms = {}
+    for tid in sorted(edges.keys()):
+        terms[tid] = GOTerm(tid, tid, "biological_process", [], [], False)
+    for tid, parents in edges.items():
+        terms[tid].is_a = set(terms[p] for p in parents)
+    return GODag(index=GODagIndex.from_dag(terms))
+
+
+def _protein(go_mf=None, go_bp=None, go_cc=None):
+    return SimpleNamespace(go_mf=go_mf, go_bp=go_bp, go_cc=go_cc)
+
+
+class TestInformationContent(TestCase):
+
+    def setUp(self):
+        self.dag = _make_dag({
+            "GO:1": [], "GO:2": ["GO:1"], "GO:3": ["GO:1"],
+            "GO:4": ["GO:2"], "GO:5": ["GO:2", "GO:3"]
+        })
+        self.index = self.dag.index
+        self.annotations = ["GO:4", "GO:5", "GO:4,GO:5,GO:5", ["GO:3"], None]
+
+    def ic_of(self, ic, tid):
+        return ic[self.index.index_of(tid)]
+
+    def test_counts_unique_annotations_per_entry(self):
+        counts = count_annotations(self.annotations, self.dag)
+        self.assertEqual(counts[self.index.index_of("GO:4")], 2)
+        self.assertEqual(counts[self.index.index_of("GO:5")], 2)
+        self.assertEqual(counts[self.index.index_of("GO:3")], 1)
+        self.assertEqual(counts.sum(), 5)
+
+    def test_ic_propagates_counts_to_ancestors(self):
+        ic = information_content(
+            count_annotations(self.annotations, self.dag), self.dag
+        )
+        self.assertAlmostEqual(self.ic_of(ic, "GO:1"), 0.0)
+        self.assertAlmostEqual(self.ic_of(ic, "GO:2"), -np.log(4 / 5))
+        self.assertAlmostEqual(self.ic_of(ic, "GO:3"), -np.log(3 / 5))
+        self.assertAlmostEqual(self.ic_of(ic, "GO:4"), -np.log(2 / 5))
+
+    def test_unannotated_terms_have_zero_ic(self):
+        ic = information_content(count_annotations(["GO:2"], self.dag),
+                                 self.dag)
+        self.assertEqual(self.ic_of(ic, "GO:4"), 0.0)
+
+    def test_ic_raises_error_on_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            information_content([1, 2], self.dag)
+
+    def test_term_pair_similarity(self):
+        ic = information_content(
+            count_annotations(self.annotations, self.dag), self.dag
+        )
+        a = [self.index.index_of(t) for t in ("GO:4", "GO:4", "GO:4")]
+        b = [self.index.index_of(t) for t in ("GO:5", "GO:4", "GO:3")]
+        resnik, lin = term_pair_similarity(a, b, ic, self.dag)
+        ic_4 = -np.log(2 / 5)
+        self.assertTrue(np.allclose(resnik, [-np.log(4 / 5), ic_4, 0]))
+        self.assertTrue(np.allclose(
+            lin, [2 * -np.log(4 / 5) / (2 * ic_4), 1, 0]
+        ))
+
+    def test_set_similarity_features(self):
+        ic = information_content(
+            count_annotations(self.annotations, self.dag), self.dag
+        )
+        pairs = [
+            (_protein(go_bp="GO:4"), _protein(go_bp="GO:4,GO:3")),
+            (_protein(go_bp="GO:4"), _protein()),
+            (None, _protein(go_bp="GO:4")),
+        ]
+        features = compute_similarity_features_many(pairs, ic, self.dag)
+        self.assertEqual(features.shape, (3, 9))
+        names = similarity_feature_names()
+        row = dict(zip(names, features[0]))
+        self.assertAlmostEqual(row['go_bp_resnik'], -np.log(2 / 5))
+        self.assertAlmostEqual(row['go_bp_lin'], 1.0)
+        self.assertAlmostEqual(row['go_bp_bma'], 0.75)
+        self.assertEqual(row['go_mf_resnik'], 0)
+        self.assertTrue(np.all(features[1:] == 0))
+
+    def test_feature_names(self):
+        names = similarity_feature_names(('go_cc',))
+        self.assertEqual(names, ['go_cc_resnik', 'go_cc_lin', 'go_cc_bma'])
+
+
+class TestSimilarityOnGO(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dag = load_or_compile_snapshot(test_obo_file, self.directory)
+        self.index = self.dag.index
+        rng = np.random.RandomState(0)
+        self.terms = np.asarray(
+            [i for i in range(len(self.index))
+             if not self.index.is_obsolete[i]]
+        )
+        self.annotations = [
+            [self.index.ids[i] for i in rng.choice(self.terms, size=3)]
+            for _ in range(200)
+        ]
+        self.ic = information_content(
+            count_annotations(self.annotations, self.dag), self.dag
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_batch_resnik_matches_ancestor_sets(self):
+        rng = np.random.RandomState(1)
+        a = rng.choice(self.terms, size=300)
+        b = rng.choice(self.terms, size=300)
+        resnik, _ = term_pair_similarity(a, b, self.ic, self.dag)
+        for k, (i, j) in enumerate(zip(a, b)):
+            common = (
+                (self.index.ancestor_set(i) | set([i])) &
+                (self.index.ancestor_set(j) | set([j]))
+            )
+            expected = max([self.ic[t] for t in common] + [0])
+            self.assertAlmostEqual(resnik[k], expected)
+
+    def test_ic_is_saved_next_to_snapshot(self):
+        path = save_information_content(self.ic, self.dag)
+        self.assertEqual(path, information_content_path(self.dag))
+        self.assertEqual(os.path.dirname(path), self.index.path)
+
+        dag = load_or_compile_snapshot(test_obo_file, self.directory)
+        self.assertTrue(np.array_equal(
+            load_information_content(dag), self.ic
+        ))
+
+    def test_load_returns_none_without_saved_ic(self):
+        self.assertIsNone(load_information_content(self.dag))
+        self.assertIsNone(information_content_path(GODag()))
@@ -1,17 +1,25 @@
 import os
+import io
+import json
 import time
+import shutil
+import tempfile
 
 from unittest import TestCase
 from Bio import SwissProt
 
 from ..database import create_session, delete_database, cleanup_database
 from ..database.models import Protein
+from ..base.io import load_uniprot_map_cache, append_uniprot_map_cache
+from ..data_mining.dat_index import DatIndex
 from ..data_mining.uniprot import (
     parallel_download, download_record,
     parse_record_into_protein,
     go_terms, interpro_terms, pfam_terms,
     keywords, gene_name, recent_accession, taxonid,
-    review_status, batch_map, function
+    review_status, batch_map, function, serialise_record,
+    iter_dat_records, iter_dat_batches, DAT_COLUMNS,
+    filter_mapped_accessions
 )
 
 base_path = os.path.dirname(__file__)
@@ -25,9 +33,12 @@ class TestUniProtMethods(TestCase):
         ), 'rt')
         self.db_path = '{}/databases/test.db'.format(base_path)
         self.session, self.engine = create_session(self.db_path)
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, 'map_cache.jsonl')
 
     def tearDown(self):
         self.records.close()
+        shutil.rmtree(self.directory)
         delete_database(self.session)
         cleanup_database(self.session, self.engine)
 
@@ -204,6 +215,7 @@ class TestUniProtMethods(TestCase):
         protein3.save(self.session, commit=True)
 
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['P50224'], keep_unreviewed=True,
             match_taxon_id=None
         )
@@ -221,6 +233,7 @@ class TestUniProtMethods(TestCase):
         protein3.save(self.session, commit=True)
 
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['P50224'], keep_unreviewed=False,
             match_taxon_id=None
         )
@@ -238,6 +251,7 @@ class TestUniProtMethods(TestCase):
         protein3.save(self.session, commit=True)
 
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['P50224'], keep_unreviewed=False,
             match_taxon_id=0
         )
@@ -255,6 +269,7 @@ class TestUniProtMethods(TestCase):
         protein3.save(self.session, commit=True)
 
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['P50224'], keep_unreviewed=True,
             match_taxon_id=9606
         )
@@ -262,6 +277,7 @@ class TestUniProtMethods(TestCase):
 
     def test_batch_map_downloads_missing_records(self):
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['P50224'], keep_unreviewed=True,
             match_taxon_id=9606, allow_download=True
         )
@@ -269,6 +285,7 @@ class TestUniProtMethods(TestCase):
 
     def test_batch_map_doesnt_save_invalid_record(self):
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['P50224'], match_taxon_id=0,
             allow_download=True
         )
@@ -276,6 +293,199 @@ class TestUniProtMethods(TestCase):
 
     def test_batch_return_empty_list_if_accession_maps_to_invalid_record(self):
         mapping = batch_map(
+            map_cache_path=self.cache_path,
             session=self.session, accessions=['Q02248'], match_taxon_id=9606
         )
         self.assertEqual(mapping, {"Q02248": []})
+
+
+class TestBatchMapCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, 'map_cache.jsonl')
+        self.session, self.engine = create_session(
+            '{}/databases/test.db'.format(base_path))
+        delete_database(self.session)
+
+    def tearDown(self):
+        delete_database(self.session)
+        cleanup_database(self.session, self.engine)
+        shutil.rmtree(self.directory)
+
+    def write_cache_line(self, age, mapping, fr='ACC+ID'):
+        with open(self.cache_path, 'at') as fp:
+            fp.write(json.dumps({
+                'time': time.time() - age, 'fr': fr, 'mapping': mapping
+            }) + '\n')
+
+    def test_cache_skips_expired_and_incomplete_lines(self):
+        self.write_cache_line(100, {'A': ['B']})
+        append_uniprot_map_cache({'C': ['D'], 'E': []}, self.cache_path)
+        with open(self.cache_path, 'at') as fp:
+            fp.write('{"time": ')
+
+        self.assertEqual(
+            load_uniprot_map_cache(self.cache_path, ttl=60),
+            {'C': ['D'], 'E': []}
+        )
+        # Expired and incomplete lines are removed from the file.
+        self.assertEqual(
+            load_uniprot_map_cache(self.cache_path),
+            {'C': ['D'], 'E': []}
+        )
+        self.assertEqual(
+            load_uniprot_map_cache(os.path.join(self.directory, 'x')), {}
+        )
+
+    def test_cache_is_keyed_by_source_database(self):
+        append_uniprot_map_cache({'A': ['B']}, self.cache_path)
+        append_uniprot_map_cache(
+            {'A': ['C']}, self.cache_path, fr='GENENAME')
+        self.assertEqual(
+            load_uniprot_map_cache(self.cache_path), {'A': ['B']})
+        self.assertEqual(
+            load_uniprot_map_cache(self.cache_path, fr='GENENAME'),
+            {'A': ['C']}
+        )
+        self.assertEqual(load_uniprot_map_cache(self.cache_path, fr='X'), {})
+
+    def test_failed_mappings_expire_first(self):
+        self.write_cache_line(100, {'A': ['B'], 'C': []})
+        self.assertEqual(
+            load_uniprot_map_cache(self.cache_path, ttl=200, negative_ttl=50),
+            {'A': ['B']}
+        )
+
+    def test_cache_is_compacted_on_load(self):
+        for i in range(3):
+            self.write_cache_line(10 - i, {'A': [str(i)], 'B': ['B']})
+        append_uniprot_map_cache({'A': ['3']}, self.cache_path)
+        self.assertEqual(
+            load_uniprot_map_cache(self.cache_path), {'A': ['3'], 'B': ['B']}
+        )
+        with open(self.cache_path, 'rt') as fp:
+            lines = fp.readlines()
+        self.assertEqual(len(lines), 2)
+
+        # A compacted cache is not rewritten.
+        mtime = os.path.getmtime(self.cache_path)
+        time.sleep(0.01)
+        load_uniprot_map_cache(self.cache_path)
+        self.assertEqual(os.path.getmtime(self.cache_path), mtime)
+
+    def test_filter_skips_unknown_review_status(self):
+        mapping = filter_mapped_accessions(
+            {'X': ['A', 'B', 'C']},
+            {'A': (True, 9606), 'B': (False, 9606), 'C': (None, 9606)}
+        )
+        self.assertEqual(mapping, {'X': ['A', 'B']})
+
+    def test_batch_map_reads_cached_mappings(self):
+        Protein(uniprot_id='P0DMN0', taxon_id=9606, reviewed=True).save(
+            self.session, commit=True)
+        Protein(uniprot_id='P0DMM9', taxon_id=9606, reviewed=False).save(
+            self.session, commit=True)
+        Protein(uniprot_id='Q02248', taxon_id=10090, reviewed=True).save(
+            self.session, commit=True)
+        append_uniprot_map_cache({
+            'P50224': ['P0DMN0', 'P0DMM9'], 'Q02248': ['Q02248'],
+            'XXXXXX': []
+        }, self.cache_path)
+
+        # Every accession is cached so the mapping service is not used.
+        mapping = batch_map(
+            ['P50224', 'Q02248', 'XXXXXX', 'P50224'], session=self.session,
+            keep_unreviewed=False, map_cache_path=self.cache_path,
+            chunk_size=1
+        )
+        self.assertEqual(mapping, {'P50224': ['P0DMN0'], 'Q02248': []})
+
+    def test_batch_map_saves_missing_records_from_index(self):
+        index = DatIndex(self.directory)
+        index.build([os.path.normpath(
+            "{}/test_data/test_sprot_records.dat".format(base_path))])
+        append_uniprot_map_cache(
+            {'A8K9K2': ['P31946'], 'B3KY71': ['P62258']}, self.cache_path
+        )
+        mapping = batch_map(
+            ['A8K9K2', 'B3KY71'], session=self.session,
+            allow_download=True, dat_index=index,
+            map_cache_path=self.cache_path
+        )
+        index.close()
+        self.assertEqual(mapping, {
+            'A8K9K2': ['P31946'], 'B3KY71': ['P62258']
+        })
+        self.assertEqual(Protein.query.count(), 2)
+
+
+class TestDatParser(TestCase):
+
+    def setUp(self):
+        self.path = os.path.normpath(
+            "{}/test_data/test_sprot_records.dat".format(base_path)
+        )
+
+    def test_matches_serialise_record(self):
+        with open(self.path, 'rt') as fp:
+            expected = [serialise_record(r) for r in SwissProt.parse(fp)]
+        result = list(iter_dat_records(self.path))
+        self.assertEqual(len(result), len(expected))
+        for params, record in zip(result, expected):
+            self.assertEqual(sorted(params.keys()), sorted(record.keys()))
+            for key in record:
+                if key == 'gene_id':
+                    # Newer Biopython versions no longer expose the raw GN
+                    # line that `gene_name` splits.
+                    continue
+                self.assertEqual(params[key], record[key])
+        self.assertEqual(
+            [r['gene_id'] for r in result], ['YWHAB', 'YWHAE', 'YWHAH']
+        )
+
+    def test_reads_gzipped_file(self):
+        self.assertEqual(
+            list(iter_dat_records(self.path + '.gz')),
+            list(iter_dat_records(self.path))
+        )
+
+    def test_batches_are_columnar(self):
+        records = list(iter_dat_records(self.path))
+        batches = list(iter_dat_batches(self.path, batch_size=2))
+        self.assertEqual([len(b['uniprot_id']) for b in batches], [2, 1])
+        for batch in batches:
+            self.assertEqual(tuple(batch.keys()), DAT_COLUMNS)
+        self.assertEqual(
+            [r['go_mf'] for r in records],
+            batches[0]['go_mf'] + batches[1]['go_mf']
+        )
+
+    def test_parses_evidence_codes_and_old_date_lines(self):
+        text = (
+            "ID   A0A024R161_HUMAN        Unreviewed;       116 AA.\n"
+            "AC   A0A024R161;\n"
+            "DT   01-OCT-2000 (Rel. 40, Last annotation update)\n"
+            "GN   ORFNames=hCG_1811434 {ECO:0000313|EMBL:EAW74669.1};\n"
+            "OX   NCBI_TaxID=9606 {ECO:0000313|EMBL:EAW74669.1};\n"
+            "CC   -!- SIMILARITY: Belongs to the DNAJC25 family.\n"
+            "CC   -----------------------------------------------------------\n"
+            "DR   GO; GO:0016021; C:integral component of membrane; IEA:UniProtKB-KW.\n"
+            "DR   Pfam; PF00002; 7tm_2; 1.\n"
+            "KW   Complete proteome {ECO:0000313|Proteomes:UP000005640};\n"
+            "KW   Membrane {ECO:0000256|SAM:Phobius}.\n"
+            "SQ   SEQUENCE   116 AA;  13278 MW;  6E2A9D3C5A1A6B2F CRC64;\n"
+            "     MGAGALAICQ SKAAVRLKED MKKIVAVPLN EQKDFTYQKL FGVSLQELER\n"
+            "//\n"
+        )
+        record, = list(iter_dat_records(io.StringIO(text)))
+        self.assertEqual(record['uniprot_id'], 'A0A024R161')
+        self.assertEqual(record['taxon_id'], 9606)
+        self.assertFalse(record['reviewed'])
+        self.assertEqual(record['gene_id'], 'hCG_1811434')
+        self.assertEqual(record['go_cc'], ['GO:0016021'])
+        self.assertEqual(record['pfam'], ['PF00002'])
+        self.assertEqual(record['keywords'], ['Complete proteome', 'Membrane'])
+        self.assertIsNone(record['function'])
+        self.assertEqual(record['last_update'], '01-OCT-2000')
+        self.assertEqual(record['last_release'], 40)
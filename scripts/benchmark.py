@@ -0,0 +1,585 @@
+"""
+This script benchmarks the performance critical parts of the feature
+computation pipeline on randomly generated inputs.
+
+Usage:
+  benchmark.py ulca [--obo=FILE] [--n_pairs=N] [--n_proteins=P]
+                    [--max_terms=T] [--seed=S]
+  benchmark.py parse [--obo=FILE] [--mi_obo=FILE] [--repeats=R]
+  benchmark.py features [--obo=FILE] [--n_pairs=N] [--n_proteins=P]
+                        [--max_terms=T] [--seed=S]
+  benchmark.py workers [--obo=FILE] [--n_pairs=N] [--n_proteins=P]
+                       [--max_terms=T] [--seed=S] [--n_jobs=LIST]
+  benchmark.py vocabulary [--obo=FILE] [--max_depth=D] [--slim=FILE]
+                          [--n_pairs=N] [--n_proteins=P] [--max_terms=T]
+                          [--seed=S]
+  benchmark.py pruning [--obo=FILE] [--n_pairs=N] [--n_proteins=P]
+                       [--max_terms=T] [--seed=S] [--rcv_iter=I]
+  benchmark.py dat [--dat=FILE] [--max_records=M]
+  benchmark.py download [--dat=FILE] [--n_accessions=A] [--latency=L]
+                        [--concurrency=C] [--batch_size=B]
+  benchmark.py -h | --help
+
+Options:
+  -h --help         Show this screen.
+  --obo=FILE        Gzipped GO obo file. Uses the default GO file in the
+                    home cache directory ~/.pyppi/ if None. [default: None]
+  --n_pairs=N       Number of protein pairs to benchmark. [default: 5000]
+  --n_proteins=P    Number of random proteins to draw pairs from.
+                    [default: 1000]
+  --max_terms=T     Maximum number of GO annotations per protein and
+                    namespace. [default: 10]
+  --seed=S          Seed for the random number generator. [default: 42]
+  --mi_obo=FILE     Gzipped PSI-MI obo file. Uses the default PSI-MI file in
+                    the home cache directory ~/.pyppi/ if None.
+                    [default: None]
+  --repeats=R       Number of times to repeat each timing. [default: 3]
+  --n_jobs=LIST     Comma separated numbers of processes to compare.
+                    [default: 1,4,16]
+  --max_depth=D     Maximum depth of GO terms after projection. [default: 3]
+  --slim=FILE       GO slim obo file to project GO terms onto instead of
+                    using a maximum depth. [default: None]
+  --rcv_iter=I      Number of grid search iterations per classifier.
+                    [default: 10]
+  --dat=FILE        UniProt dat file, gzipped if ending in '.gz'. Uses the
+                    TrEMBL file in the home cache directory ~/.pyppi/ if
+                    None. [default: None]
+  --max_records=M   Maximum number of records to parse, all if None.
+                    [default: None]
+  --n_accessions=A  Number of accessions to download from a local fake
+                    UniProt endpoint serving records of --dat.
+                    [default: 2000]
+  --latency=L       Seconds the fake endpoint waits before each response.
+                    [default: 0.05]
+  --concurrency=C   Maximum number of concurrent requests. [default: 10]
+  --batch_size=B    Number of accessions per batch request. [default: 100]
+"""
+
+import time
+import gzip
+import pickle
+import logging
+import threading
+from collections import Counter
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+import numpy as np
+from itertools import islice
+from Bio import SwissProt
+from types import SimpleNamespace
+from numpy.random import RandomState
+from joblib import Parallel, delayed
+from docopt import docopt
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.pipeline import Pipeline
+from sklearn.metrics import f1_score
+
+from pyppi.base.log import create_logger
+from pyppi.base.file_paths import obo_file, psimi_obo_file
+from pyppi.base.file_paths import uniprot_trembl_dat
+from pyppi.data_mining.ontology import get_active_instance, get_ulca_cache
+from pyppi.data_mining.ontology import get_up_to_lca, get_up_to_lca_many
+from pyppi.data_mining.ontology import parse_obo12_file, parse_go_slim
+from pyppi.data_mining.ontology import GODag, GODagIndex, GOTerm
+from pyppi.data_mining.features import GOTermProjector
+from pyppi.data_mining.features import (
+    compute_interaction_features, compute_interaction_features_batch
+)
+from pyppi.data_mining.feature_pool import compute_interaction_features_pool
+from pyppi.database.models import Protein
+from pyppi.data_mining.psimi import parse_miobo_file, Term
+from pyppi.data_mining.uniprot import (
+    open_dat, serialise_record, iter_dat_records
+)
+from pyppi.data_mining.async_download import async_download
+from pyppi.models.utilities import make_gridsearch_clf
+
+
+logger = create_logger("scripts", logging.INFO)
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def random_go_proteins(dag, n_proteins, max_terms, rng):
+    """Generates `n_proteins` random proteins, each a dictionary of
+    namespace to a list of non-obsolete GO term accessions."""
+    by_namespace = {}
+    for tid in dag.index.ids:
+        term = dag[tid]
+        if not term.is_obsolete:
+            by_namespace.setdefault(term.namespace, []).append(tid)
+    namespaces = sorted(by_namespace.keys())
+
+    proteins = []
+    for _ in range(n_proteins):
+        protein = {}
+        for namespace in namespaces:
+            terms = by_namespace[namespace]
+            size = rng.randint(0, max_terms + 1)
+            protein[namespace] = [
+                terms[i] for i in rng.randint(0, len(terms), size=size)
+            ]
+        proteins.append(protein)
+    return namespaces, proteins
+
+
+def benchmark_ulca(args):
+    dag, elapsed = _timed(get_active_instance, filename=args['obo'])
+    logger.info("Loaded GO dag in {:.3f}s.".format(elapsed))
+
+    rng = RandomState(args['seed'])
+    namespaces, proteins = random_go_proteins(
+        dag, args['n_proteins'], args['max_terms'], rng
+    )
+    pairs = []
+    for (a, b) in rng.randint(0, len(proteins), size=(args['n_pairs'], 2)):
+        for namespace in namespaces:
+            pairs.append((proteins[a][namespace], proteins[b][namespace]))
+
+    single, t_single = _timed(
+        lambda: [get_up_to_lca(p1, p2, dag) for (p1, p2) in pairs]
+    )
+    many, t_many = _timed(get_up_to_lca_many, pairs, dag)
+
+    logger.info("Induced {} annotation pairs.".format(len(pairs)))
+    logger.info("get_up_to_lca: {:.3f}s ({:.0f} pairs/s)".format(
+        t_single, len(pairs) / t_single))
+    logger.info("get_up_to_lca_many: {:.3f}s ({:.0f} pairs/s)".format(
+        t_many, len(pairs) / t_many))
+    logger.info("Outputs identical: {}".format(single == many))
+    logger.info("ULCA cache: {}".format(get_ulca_cache().cache_info()))
+
+
+def _baseline_read_term(fp):
+    # Line based reader of a single [Term] stanza, as used by the GO and
+    # PSI-MI parsers before they shared `pyppi.data_mining.obo`.
+    id_, name, namespace = None, None, None
+    is_a, part_of, alt_ids = [], [], []
+    is_obsolete = False
+    line = "[Term]"
+    while line.strip() != "":
+        line = fp.readline().strip()
+        if line.startswith("id:"):
+            _, id_ = [x.strip() for x in line.split('id: ')]
+        elif line.startswith("alt_id:"):
+            _, alt_id = [x.strip() for x in line.split('alt_id: ')]
+            alt_ids += [alt_id]
+        elif line.startswith("name:"):
+            _, name = [x.strip() for x in line.split('name: ')]
+        elif line.startswith("namespace:"):
+            _, namespace = [x.strip() for x in line.split('namespace: ')]
+        elif line.startswith("is_a:"):
+            _, is_a_term = [x.strip() for x in line.split('is_a: ')]
+            is_a_term, _ = [x.strip() for x in is_a_term.split(' ! ')]
+            is_a.append(is_a_term)
+        elif line.startswith("relationship: part_of"):
+            _, part_of_term = [
+                x.strip() for x in line.split('relationship: part_of ')
+            ]
+            part_of_term, _ = [x.strip() for x in part_of_term.split(' ! ')]
+            part_of.append(part_of_term)
+        elif line.startswith("is_obsolete"):
+            _, is_obsolete = [x.strip() for x in line.split('is_obsolete: ')]
+            is_obsolete = bool(is_obsolete)
+    return id_, name, namespace, is_a, part_of, is_obsolete, alt_ids
+
+
+def _baseline_read_obo(filename):
+    entries = []
+    with gzip.open(filename, 'rt') as fp:
+        for line in fp:
+            line = line.strip()
+            if "format-version" in line:
+                _, version = [x.strip() for x in line.split(":")]
+                if float(version) != 1.2:
+                    raise ValueError("Parser only supports version 1.2.")
+            elif "[Term]" in line:
+                entries.append(_baseline_read_term(fp))
+    return entries
+
+
+def baseline_parse_obo12_file(filename):
+    """Reference implementation of :func:`parse_obo12_file` using the
+    previous line based reader. Builds a dict of :class:`GOTerm` instances,
+    links their relationships and then indexes the dag."""
+    dag = GODag()
+    alt_id_map = {}
+    for (tid, name, namespace, is_a, part_of, is_obsolete, alt_ids) in \
+            _baseline_read_obo(filename):
+        dag[tid] = GOTerm(tid, name, namespace, is_a, part_of, is_obsolete)
+        alt_id_map[tid] = alt_ids
+
+    for _, item in dag.items():
+        is_a_terms = [dag[t_id] for t_id in item.is_a]
+        part_of_terms = [dag[t_id] for t_id in item.part_of]
+        for term in is_a_terms:
+            term.has_a.add(item)
+        for term in part_of_terms:
+            term.has_part.add(item)
+        item.is_a = set(is_a_terms)
+        item.part_of = set(part_of_terms)
+
+    for tid, alts in alt_id_map.items():
+        for alt_tid in alts:
+            dag[alt_tid] = dag[tid]
+
+    dag.index = GODagIndex.from_dag(dag)
+    for i, term in enumerate(dag.index._terms):
+        term._index = dag.index
+        term._idx = i
+    return dag
+
+
+def baseline_parse_miobo_file(filename):
+    """Reference implementation of :func:`parse_miobo_file` using the
+    previous line based reader."""
+    graph = {}
+    for (tid, name, _, _, _, is_obsolete, alt_ids) in \
+            _baseline_read_obo(filename):
+        graph[tid] = Term(tid, name, is_obsolete)
+        for alt_tid in alt_ids:
+            graph[alt_tid] = graph[tid]
+    return graph
+
+
+def benchmark_parse(args):
+    for name, slow_func, fast_func, path in [
+            ('GO', baseline_parse_obo12_file, parse_obo12_file,
+             args['obo']),
+            ('PSI-MI', baseline_parse_miobo_file, parse_miobo_file,
+             args['mi_obo'])]:
+        t_slow, t_fast = [], []
+        for _ in range(args['repeats']):
+            slow, elapsed = _timed(slow_func, path)
+            t_slow.append(elapsed)
+            fast, elapsed = _timed(fast_func, path)
+            t_fast.append(elapsed)
+        t_slow, t_fast = min(t_slow), min(t_fast)
+        logger.info("Parsed {} entries from {} obo file '{}'.".format(
+            len(fast), name, path))
+        logger.info("Line based reader: {:.3f}s (best of {})".format(
+            t_slow, args['repeats']))
+        logger.info("{}: {:.3f}s (best of {})".format(
+            fast_func.__name__, t_fast, args['repeats']))
+        logger.info("Speedup: {:.1f}x".format(t_slow / t_fast))
+        logger.info("Same accessions: {}".format(
+            sorted(slow.keys()) == sorted(fast.keys())))
+
+
+def random_interactions(dag, args, factory=SimpleNamespace):
+    """Generates random pairs of proteins created by `factory` from random
+    GO, InterPro, Pfam and keyword annotations."""
+    rng = RandomState(args['seed'])
+    namespaces, annotations = random_go_proteins(
+        dag, args['n_proteins'], args['max_terms'], rng
+    )
+    attrs = {
+        'molecular_function': 'go_mf', 'biological_process': 'go_bp',
+        'cellular_component': 'go_cc'
+    }
+    proteins = []
+    for i, annotation in enumerate(annotations):
+        params = dict(
+            uniprot_id='P{:05d}'.format(i), taxon_id=9606, go_mf=None,
+            go_bp=None, go_cc=None, interpro='IPR{:06d}'.format(i % 97),
+            pfam='PF{:05d}'.format(i % 53), keywords='Kinase'
+        )
+        for namespace, terms in annotation.items():
+            if namespace in attrs:
+                params[attrs[namespace]] = ','.join(terms)
+        proteins.append(factory(**params))
+    pairs = [
+        (proteins[a], proteins[b])
+        for (a, b) in rng.randint(0, len(proteins), size=(args['n_pairs'], 2))
+    ]
+    return proteins, pairs
+
+
+def benchmark_features(args):
+    dag = get_active_instance(filename=args['obo'])
+    proteins, pairs = random_interactions(dag, args)
+
+    get_ulca_cache().clear()
+    single, t_single = _timed(
+        lambda: [compute_interaction_features(a, b, dag) for (a, b) in pairs]
+    )
+    get_ulca_cache().clear()
+    batch, t_batch = _timed(compute_interaction_features_batch, pairs, dag)
+
+    logger.info("Computed features for {} pairs of {} proteins.".format(
+        len(pairs), len(proteins)))
+    logger.info("compute_interaction_features: {:.3f}s ({:.0f} pairs/s)".format(
+        t_single, len(pairs) / t_single))
+    logger.info(
+        "compute_interaction_features_batch: {:.3f}s ({:.0f} pairs/s)".format(
+            t_batch, len(pairs) / t_batch))
+    logger.info("Outputs identical: {}".format(single == batch))
+
+
+def benchmark_workers(args):
+    dag = get_active_instance(filename=args['obo'])
+    proteins, pairs = random_interactions(dag, args, factory=Protein)
+    logger.info("Computing features for {} pairs of {} proteins.".format(
+        len(pairs), len(proteins)))
+
+    expected = None
+    for n_jobs in args['n_jobs']:
+        chunk_size = max(1, -(-len(pairs) // n_jobs))
+        chunked, t_chunked = _timed(
+            Parallel(n_jobs=n_jobs, backend='multiprocessing'),
+            (delayed(compute_interaction_features_batch)(
+                pairs[i:i + chunk_size])
+             for i in range(0, len(pairs), chunk_size))
+        )
+        chunked = [values for chunk in chunked for values in chunk]
+        pooled, t_pooled = _timed(
+            compute_interaction_features_pool, pairs, n_jobs=n_jobs, dag=dag
+        )
+        expected = expected or chunked
+        logger.info(
+            "n_jobs={}: Protein chunks {:.3f}s ({:.0f} pairs/s), "
+            "worker pool {:.3f}s ({:.0f} pairs/s), identical: {}".format(
+                n_jobs, t_chunked, len(pairs) / t_chunked, t_pooled,
+                len(pairs) / t_pooled,
+                chunked == expected and pooled == expected
+            )
+        )
+
+
+def random_documents(dag, args, rng):
+    """Generates the textual GO features of random protein pairs, as
+    returned by :func:`pyppi.predict.utilities.interactions_to_Xy_format`."""
+    namespaces, proteins = random_go_proteins(
+        dag, args['n_proteins'], args['max_terms'], rng
+    )
+    X = []
+    for (a, b) in rng.randint(0, len(proteins), size=(args['n_pairs'], 2)):
+        terms = [
+            t for namespace in namespaces
+            for t in proteins[a][namespace] + proteins[b][namespace]
+        ]
+        X.append(','.join(terms).replace(':', ''))
+    return X
+
+
+def benchmark_vocabulary(args):
+    dag = get_active_instance(filename=args['obo'])
+    rng = RandomState(args['seed'])
+    X = random_documents(dag, args, rng)
+    y = rng.randint(0, 2, size=len(X))
+
+    if args['slim'] is not None:
+        projector = GOTermProjector(slim=parse_go_slim(args['slim']))
+    else:
+        projector = GOTermProjector(max_depth=args['max_depth'])
+
+    for name, steps in [
+            ('No projection', []),
+            (str(projector), [('projection', projector)])]:
+        pipeline = Pipeline(steps=steps + [
+            ('vectorizer', CountVectorizer(lowercase=False, binary=True)),
+            ('estimator', RandomForestClassifier(
+                n_estimators=50, random_state=args['seed']))
+        ])
+        _, elapsed = _timed(pipeline.fit, X, y)
+        vocabulary = pipeline.named_steps['vectorizer'].vocabulary_
+        logger.info("{}: vocabulary {}, fit {:.3f}s, model {} bytes".format(
+            name, len(vocabulary), elapsed, len(pickle.dumps(pipeline))))
+
+
+def benchmark_pruning(args):
+    dag = get_active_instance(filename=args['obo'])
+    rng = RandomState(args['seed'])
+    X = random_documents(dag, args, rng)
+
+    # The label depends on a handful of frequent terms, plus 10% noise.
+    tokens = sorted(set(t for x in X for t in x.split(',') if t))
+    signal = set(rng.choice(tokens, size=20, replace=False))
+    y = np.asarray([bool(signal & set(x.split(','))) for x in X], dtype=int)
+    flip = rng.uniform(size=len(y)) < 0.1
+    y[flip] = 1 - y[flip]
+
+    split = int(0.8 * len(X))
+    X_train, y_train = X[:split], y[:split]
+    X_test, y_test = X[split:], y[split:]
+    logger.info("{} training and {} testing samples, {:.1%} positive.".format(
+        len(X_train), len(X_test), y.mean()))
+
+    for feature_selection in [None, 'chi2', 'positive_df']:
+        clf = make_gridsearch_clf(
+            'RandomForestClassifier', rcv_iter=args['rcv_iter'],
+            random_state=args['seed'], feature_selection=feature_selection
+        )
+        _, elapsed = _timed(clf.fit, X_train, y_train)
+        f1 = f1_score(y_test, clf.predict(X_test))
+        logger.info("{}: fit {:.3f}s, F1 {:.3f}, best {}".format(
+            feature_selection or 'No pruning', elapsed, f1,
+            {k: v for (k, v) in clf.best_params_.items()
+             if k.startswith('selector')}
+        ))
+
+
+def benchmark_dat(args):
+    def biopython():
+        with open_dat(args['dat']) as fp:
+            records = islice(SwissProt.parse(fp), args['max_records'])
+            return [serialise_record(r) for r in records]
+
+    def streaming():
+        with open_dat(args['dat']) as fp:
+            return list(islice(iter_dat_records(fp), args['max_records']))
+
+    slow, t_slow = _timed(biopython)
+    fast, t_fast = _timed(streaming)
+    logger.info("Parsed {} records from '{}'.".format(len(fast), args['dat']))
+    logger.info("SwissProt.parse + serialise_record: {:.3f}s "
+                "({:.0f} records/s)".format(t_slow, len(slow) / t_slow))
+    logger.info("iter_dat_records: {:.3f}s ({:.0f} records/s)".format(
+        t_fast, len(fast) / t_fast))
+    # Newer Biopython versions return structured gene names, which
+    # serialise_record does not split.
+    logger.info("Outputs identical (ignoring gene_id): {}".format(
+        [dict(r, gene_id=None) for r in slow] ==
+        [dict(r, gene_id=None) for r in fast]
+    ))
+
+
+class _FakeUniProtServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Idle keep-alive connections are reset when the client exits.
+        pass
+
+
+class _FakeUniProtHandler(BaseHTTPRequestHandler):
+    # Serves records at /<accession>.txt and concatenated records at
+    # /accessions?accessions=<a>,<b> after `server.latency` seconds.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/accessions':
+            accessions = parse_qs(query)['accessions'][0].split(',')
+        else:
+            accessions = [path.strip('/').split('.')[0]]
+        with self.server.lock:
+            self.server.requests[path == '/accessions'] += 1
+        time.sleep(self.server.latency)
+        body = ''.join(
+            self.server.records.get(a, '') for a in accessions
+        ).encode('utf-8')
+        self.send_response(200 if body else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def benchmark_download(args):
+    # Records of the dat file are served under generated accessions so that
+    # any number of distinct accessions can be requested.
+    with open_dat(args['dat']) as fp:
+        blocks = (fp.read().rstrip('\n') + '\n').split('//\n')
+    blocks = [
+        '\n'.join(l for l in b.split('\n') if not l.startswith('AC   '))
+        for b in blocks if b.strip()
+    ]
+    accessions = ['X{:05d}'.format(i) for i in range(args['n_accessions'])]
+    records = {}
+    for i, accession in enumerate(accessions):
+        block = blocks[i % len(blocks)]
+        first, _, rest = block.partition('\n')
+        records[accession] = '{}\nAC   {};\n{}//\n'.format(
+            first, accession, rest)
+
+    server = _FakeUniProtServer(('127.0.0.1', 0), _FakeUniProtHandler)
+    server.records = records
+    server.latency = args['latency']
+    server.lock = threading.Lock()
+    host = "http://127.0.0.1:{}".format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    logger.info("Downloading {} accessions with {}s latency and {} "
+                "concurrent requests.".format(
+                    len(accessions), args['latency'], args['concurrency']))
+    try:
+        for batch_size in (None, args['batch_size']):
+            server.requests = Counter()
+            downloaded, elapsed = _timed(
+                async_download, accessions, url=host + '/{}.txt',
+                batch_url=host + '/accessions?accessions={}',
+                max_concurrency=args['concurrency'], batch_size=batch_size,
+                taxon_id=None
+            )
+            scale = 1000 / len(accessions)
+            logger.info(
+                "{}: {} records, {:.0f} requests and {:.3f}s per 1,000 "
+                "accessions.".format(
+                    'Batch size {}'.format(batch_size) if batch_size
+                    else 'One per request',
+                    sum(r is not None for r in downloaded),
+                    sum(server.requests.values()) * scale, elapsed * scale
+                )
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    parsed = {
+        'obo': obo_file if args['--obo'] == 'None' else args['--obo'],
+        'n_pairs': int(args['--n_pairs']),
+        'n_proteins': int(args['--n_proteins']),
+        'max_terms': int(args['--max_terms']),
+        'seed': int(args['--seed']),
+        'mi_obo': (
+            psimi_obo_file if args['--mi_obo'] == 'None'
+            else args['--mi_obo']
+        ),
+        'repeats': int(args['--repeats']),
+        'n_jobs': [int(n) for n in args['--n_jobs'].split(',')],
+        'max_depth': int(args['--max_depth']),
+        'slim': None if args['--slim'] == 'None' else args['--slim'],
+        'rcv_iter': int(args['--rcv_iter']),
+        'dat': (
+            uniprot_trembl_dat if args['--dat'] == 'None' else args['--dat']
+        ),
+        'max_records': (
+            None if args['--max_records'] == 'None'
+            else int(args['--max_records'])
+        ),
+        'n_accessions': int(args['--n_accessions']),
+        'latency': float(args['--latency']),
+        'concurrency': int(args['--concurrency']),
+        'batch_size': int(args['--batch_size']),
+    }
+    if args['ulca']:
+        benchmark_ulca(parsed)
+    elif args['parse']:
+        benchmark_parse(parsed)
+    elif args['features']:
+        benchmark_features(parsed)
+    elif args['workers']:
+        benchmark_workers(parsed)
+    elif args['vocabulary']:
+        benchmark_vocabulary(parsed)
+    elif args['pruning']:
+        benchmark_pruning(parsed)
+    elif args['dat']:
+        benchmark_dat(parsed)
+    elif args['download']:
+        benchmark_download(parsed)
@@ -3,20 +3,21 @@ This script runs classifier training over the entire training data and then
 output predictions over the interactome.
 
 Usage:
-  build_data.py [--clear_cache] [--n_jobs=J] [--verbose]
+  build_data.py [--clear_cache] [--remote_map] [--n_jobs=J] [--verbose]
   build_data.py -h | --help
 
 Options:
   -h --help  Show this screen.
   --n_jobs=J  Number of processes to run in parallel [default: 1]
   --clear_cache  Delete previous bioservices KEGG/UniProt cache
+  --remote_map  Map accessions not found in the local UniProt dumps with the
+                UniProt mapping service.
   --verbose  Log information and warning output to console.
 """
 
 import pandas as pd
 import logging
-from Bio import SwissProt
-from joblib import Parallel, delayed
+from functools import partial
 from docopt import docopt
 
 from pyppi.base.utilities import delete_cache, is_null
@@ -31,18 +32,20 @@ from pyppi.base.file_paths import innate_i_network_path, innate_c_network_path
 from pyppi.base.file_paths import interactome_network_path, full_training_network_path
 from pyppi.base.file_paths import kegg_network_path, hprd_network_path
 from pyppi.base.file_paths import testing_network_path, training_network_path
+from pyppi.base.file_paths import uniprot_sprot_dat, uniprot_trembl_dat
+from pyppi.base.file_paths import uniprot_map_cache_path
 
 from pyppi.base.io import save_uniprot_accession_map, save_network_to_path
 from pyppi.base.io import bioplex_v4, pina2_mitab, innate_curated, innate_imported
-from pyppi.base.io import uniprot_sprot, uniprot_trembl
 
 from pyppi.database import delete_database, db_session, cleanup_module
 from pyppi.database.models import Protein, Interaction
 from pyppi.database.models import Pubmed, Psimi, Reference
 from pyppi.database.utilities import create_interaction, uniprotid_entry_map
+from pyppi.database.utilities import update_feature_ids
+from pyppi.database.ingest import ingest_dat
 
-from pyppi.data_mining.uniprot import parse_record_into_protein
-from pyppi.data_mining.uniprot import batch_map
+from pyppi.data_mining.dat_index import DatIndex, map_accessions
 from pyppi.data_mining.generic import bioplex_func
 from pyppi.data_mining.generic import pina_mitab_func, innate_mitab_func
 from pyppi.data_mining.generic import generic_to_dataframe
@@ -52,13 +55,18 @@ from pyppi.data_mining.tools import remove_common_ppis, remove_labels
 from pyppi.data_mining.tools import map_network_accessions
 from pyppi.data_mining.kegg import download_pathway_ids, pathways_to_dataframe
 from pyppi.data_mining.psimi import get_active_instance as load_mi_ontology
-from pyppi.data_mining.features import compute_interaction_features
+from pyppi.data_mining.feature_cache import (
+    FeatureCache, compute_interaction_features_cached
+)
+from pyppi.data_mining.features import iter_interaction_features
+from pyppi.data_mining.feature_pool import FeaturePool
 
 from pyppi.predict.utilities import train_paper_model
 
 logger = create_logger("scripts", logging.INFO)
 ORGANISM = "hsa"
 TAXONOMY = 9606
+FEATURE_CHUNK_SIZE = 50000
 
 
 if __name__ == "__main__":
@@ -67,6 +75,7 @@ if __name__ == "__main__":
     n_jobs = args['n_jobs']
     clear_cache = args['clear_cache']
     verbose = args['verbose']
+    remote_map = args['remote_map']
 
     # Setup the protein table in the database
     # --------------------------------------------------------------------- #
@@ -78,9 +87,12 @@ if __name__ == "__main__":
     delete_database(db_session)
 
     logger.info("Parsing UniProt and PSI-MI into database.")
-    records = list(SwissProt.parse(uniprot_sprot())) + \
-        list(SwissProt.parse(uniprot_trembl()))
-    proteins = [parse_record_into_protein(r) for r in records]
+    for path in (uniprot_sprot_dat, uniprot_trembl_dat):
+        inserted, _ = ingest_dat(path, db_session, n_jobs=n_jobs)
+        logger.info("Loaded {} proteins from '{}'.".format(inserted, path))
+
+    logger.info("Indexing UniProt dumps for local record lookups.")
+    DatIndex().build([uniprot_sprot_dat, uniprot_trembl_dat], verbose=True)
 
     psimi_objects = []
     mi_ont = load_mi_ontology()
@@ -89,7 +101,7 @@ if __name__ == "__main__":
         psimi_objects.append(obj)
 
     try:
-        db_session.add_all(proteins + psimi_objects)
+        db_session.add_all(psimi_objects)
         db_session.commit()
     except:
         db_session.rollback()
@@ -156,13 +168,15 @@ if __name__ == "__main__":
     sources = set(p for df in networks for p in df.source.values)
     targets = set(p for df in networks for p in df.target.values)
     accessions = list(sources | targets)
-    accession_mapping = batch_map(
+    accession_mapping = map_accessions(
         cache=True,
         verbose=verbose,
         allow_download=False,
         accessions=accessions,
         keep_unreviewed=True,
-        match_taxon_id=TAXONOMY
+        match_taxon_id=TAXONOMY,
+        remote=remote_map,
+        map_cache_path=uniprot_map_cache_path
     )
     save_uniprot_accession_map(accession_mapping)
 
@@ -273,20 +287,6 @@ if __name__ == "__main__":
 
     logger.info("Saving Interaction records to database.")
     protein_map = uniprotid_entry_map()
-    ppis = [
-        (protein_map[a], protein_map[b])
-        for network in [full_training, interactome]
-        for (a, b) in zip(network[SOURCE], network[TARGET])
-    ]
-
-    feature_map = {}
-    logger.info("Computing features.")
-    features_ls = Parallel(n_jobs=n_jobs, backend='multiprocessing')(
-        delayed(compute_interaction_features)(source, target)
-        for (source, target) in ppis
-    )
-    for (source, target), features in zip(ppis, features_ls):
-        feature_map[(source.uniprot_id, target.uniprot_id)] = features
 
     # Create and save all the psimi and pubmed objects if they don't already
     # exist in the database. If the psi-mi obo parsed in the first step
@@ -358,7 +358,7 @@ if __name__ == "__main__":
         if entry is None:
             source = protein_map[uniprot_a]
             target = protein_map[uniprot_b]
-            class_kwargs = feature_map[(uniprot_a, uniprot_b)]
+            class_kwargs = {}
             class_kwargs["is_training"] = True
             entry = create_interaction(
                 source, target, label, session=db_session, save=False,
@@ -382,7 +382,7 @@ if __name__ == "__main__":
         if entry is None:
             source = protein_map[uniprot_a]
             target = protein_map[uniprot_b]
-            class_kwargs = feature_map[(uniprot_a, uniprot_b)]
+            class_kwargs = {}
             class_kwargs["is_holdout"] = True
             entry = create_interaction(
                 source, target, label, session=db_session, save=False,
@@ -406,7 +406,7 @@ if __name__ == "__main__":
         if entry is None:
             source = protein_map[uniprot_a]
             target = protein_map[uniprot_b]
-            class_kwargs = feature_map[(uniprot_a, uniprot_b)]
+            class_kwargs = {}
             class_kwargs["is_holdout"] = True
             class_kwargs["is_training"] = True
             entry = create_interaction(
@@ -432,7 +432,7 @@ if __name__ == "__main__":
         if entry is None:
             source = protein_map[uniprot_a]
             target = protein_map[uniprot_b]
-            class_kwargs = feature_map[(uniprot_a, uniprot_b)]
+            class_kwargs = {}
             class_kwargs["is_interactome"] = True
             entry = create_interaction(
                 source, target, label, session=db_session, save=False,
@@ -481,6 +481,54 @@ if __name__ == "__main__":
         db_session.rollback()
         raise
 
+    # Features are computed and committed one chunk at a time. Only the ids
+    # of the interactions are kept, and the entries of each chunk are loaded
+    # and released with it, so memory is bounded by the chunk size. Only
+    # interactions with updated proteins or a new GO release are recomputed.
+    # The feature cache is an SQLite table, so each chunk reads and writes
+    # only its own entries and nothing accumulates across chunks. Proteins
+    # are loaded once and detached so that committing a chunk does not
+    # expire them.
+    logger.info("Computing features.")
+    del interactions, entries, references
+    proteins = Protein.query.all()
+    for protein in proteins:
+        db_session.expunge(protein)
+    protein_id_map = {p.id: p for p in proteins}
+    rows = db_session.query(
+        Interaction.id, Interaction.source_, Interaction.target_
+    ).order_by(Interaction.id).all()
+    feature_cache = FeatureCache()
+    with FeaturePool(proteins, n_jobs=n_jobs) as feature_pool:
+        generator = iter_interaction_features(
+            pairs=(
+                (protein_id_map[source], protein_id_map[target])
+                for (_, source, target) in rows
+            ),
+            chunk_size=FEATURE_CHUNK_SIZE,
+            compute=partial(
+                compute_interaction_features_cached,
+                cache=feature_cache, pool=feature_pool
+            )
+        )
+        for start, chunk, features_ls in generator:
+            # Rows are ordered by id, so the range holds exactly the chunk.
+            batch = Interaction.query.filter(Interaction.id.between(
+                rows[start][0], rows[start + len(chunk) - 1][0]
+            )).order_by(Interaction.id).all()
+            for entry, features in zip(batch, features_ls):
+                for key, value in features.items():
+                    setattr(entry, key, value)
+            try:
+                update_feature_ids(batch, session=db_session, commit=True)
+            except:
+                db_session.rollback()
+                raise
+            logger.info("Computed features for {} interactions.".format(
+                start + len(chunk)))
+    logger.info("Feature cache: {}".format(feature_cache.cache_info()))
+    feature_cache.close()
+
     logger.info("Training default model.")
     train_paper_model(
         n_jobs_gs=n_jobs,
@@ -0,0 +1,51 @@
+"""
+This script loads UniProt dat dumps into the protein table of the database,
+updating proteins that already exist. Blocks of records are parsed in
+parallel and each block is upserted in its own transaction.
+
+Usage:
+  ingest_uniprot.py [--dat=FILE...] [--n_jobs=J] [--chunk_mb=M] [--verbose]
+  ingest_uniprot.py -h | --help
+
+Options:
+  -h --help     Show this screen.
+  --dat=FILE    UniProt dat file, gzipped if ending in '.gz'. Can be given
+                more than once. Uses the SwissProt and TrEMBL files in the
+                home cache directory ~/.pyppi/ if not given.
+  --n_jobs=J    Number of processes to parse with. [default: 1]
+  --chunk_mb=M  Size in megabytes of each block of records. [default: 16]
+  --verbose     Log information and warning output to console.
+"""
+
+import time
+import logging
+from docopt import docopt
+
+from pyppi.base.log import create_logger
+from pyppi.base.file_paths import uniprot_sprot_dat, uniprot_trembl_dat
+from pyppi.database import db_session, cleanup_module
+from pyppi.database.ingest import ingest_dat
+
+
+logger = create_logger("scripts", logging.INFO)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    paths = args['--dat'] or [uniprot_sprot_dat, uniprot_trembl_dat]
+    n_jobs = int(args['--n_jobs'])
+    chunk_bytes = int(float(args['--chunk_mb']) * (1 << 20))
+    verbose = args['--verbose']
+
+    for path in paths:
+        logger.info("Loading '{}'.".format(path))
+        start = time.time()
+        inserted, updated = ingest_dat(
+            path, db_session, n_jobs=n_jobs, chunk_bytes=chunk_bytes,
+            verbose=verbose
+        )
+        logger.info(
+            "Inserted {} and updated {} proteins in {:.1f}s.".format(
+                inserted, updated, time.time() - start)
+        )
+    cleanup_module()
@@ -7,6 +7,7 @@ output predictions over the interactome.
 Usage:
   predict_ppis.py [--interpro] [--pfam] [--mf] [--cc] [--bp]
                   [--retrain] [--chain] [--induce] [--verbose] [--save]
+                  [--remote_map]
                   [--model=M] [--n_jobs=J] [--n_splits=S] [--n_iterations=I]
                   [--input=FILE] [--output=FILE] [--directory=DIR]
                   [--output_folder=OUT]
@@ -27,6 +28,8 @@ Options:
                 features along with the same induce setting.
   --save        Save the trained classifier to the home cache directory ~/.pyppi/,
                 overwritting any previously saved classifier.
+  --remote_map  Map input accessions not found in the local UniProt dumps with
+                the UniProt mapping service.
   --model=M         A binary classifier from Scikit-Learn implementing fit,
                     predict and predict_proba [default: LogisticRegression].
                     Ignored if using 'retrain'.
@@ -64,6 +67,7 @@ from pyppi.base.constants import (
 from pyppi.base.log import create_logger
 from pyppi.base.io import generic_io, save_classifier, load_classifier
 from pyppi.base.file_paths import classifier_path, default_db_path
+from pyppi.base.file_paths import uniprot_map_cache_path
 
 from pyppi.model_selection.sampling import IterativeStratifiedKFold
 from pyppi.models.utilities import (
@@ -83,7 +87,7 @@ from pyppi.database.utilities import labels_from_interactions
 from pyppi.data_mining.tools import xy_from_interaction_frame
 from pyppi.data_mining.generic import edgelist_func, generic_to_dataframe
 from pyppi.data_mining.tools import map_network_accessions
-from pyppi.data_mining.uniprot import batch_map
+from pyppi.data_mining.dat_index import map_accessions
 from pyppi.data_mining.features import compute_interaction_features
 
 from pyppi.predict.utilities import interactions_to_Xy_format
@@ -119,6 +123,7 @@ if __name__ == "__main__":
     retrain = args['retrain']
     chain = args['chain']
     save = args['save']
+    remote_map = args['remote_map']
     folder = args['output_folder']
 
     # Set up the folder for each experiment run named after the current time
@@ -157,12 +162,14 @@ if __name__ == "__main__":
         sources = set(p for p in testing.source.values)
         targets = set(p for p in testing.target.values)
         accessions = list(sources | targets)
-        accession_mapping = batch_map(
+        accession_mapping = map_accessions(
             session=db_session,
             accessions=accessions,
             keep_unreviewed=True,
             match_taxon_id=9606,
             allow_download=True,
+            remote=remote_map,
+            map_cache_path=uniprot_map_cache_path,
             verbose=verbose,
         )
 
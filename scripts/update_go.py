@@ -0,0 +1,56 @@
+"""
+This script compares a new Gene Ontology release against the previous one
+and recomputes the induced GO features of only those interactions whose
+proteins carry terms affected by the changes.
+
+Usage:
+  update_go.py --old=FILE [--new=FILE] [--verbose]
+  update_go.py -h | --help
+
+Options:
+  -h --help     Show this screen.
+  --old=FILE    Gzipped obo file of the previous GO release.
+  --new=FILE    Gzipped obo file of the new GO release. Uses the default GO
+                file in the home cache directory ~/.pyppi/ if None.
+                [default: None]
+  --verbose     Log information and warning output to console.
+"""
+
+import logging
+from docopt import docopt
+
+from pyppi.base.log import create_logger
+from pyppi.base.file_paths import obo_file
+from pyppi.database import cleanup_module
+from pyppi.database.utilities import refresh_ulca_features
+from pyppi.data_mining.ontology import (
+    load_or_compile_snapshot, set_active_instance,
+    diff_go_dags, get_affected_terms
+)
+
+
+logger = create_logger("scripts", logging.INFO)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    old_path = args['--old']
+    new_path = obo_file if args['--new'] == 'None' else args['--new']
+    verbose = args['--verbose']
+
+    logger.info("Loading GO releases '{}' and '{}'.".format(
+        old_path, new_path))
+    old = load_or_compile_snapshot(old_path)
+    new = load_or_compile_snapshot(new_path)
+    set_active_instance(new)
+
+    diff = diff_go_dags(old, new)
+    for key in ('added', 'removed', 'obsoleted', 'reparented'):
+        logger.info("{} terms {}.".format(len(diff[key]), key))
+
+    affected = get_affected_terms(old, new, diff)
+    logger.info("{} accessions affected.".format(len(affected)))
+
+    updated = refresh_ulca_features(affected, dag=new, verbose=verbose)
+    logger.info("Updated {} interactions.".format(len(updated)))
+    cleanup_module()
@@ -67,7 +67,9 @@ from pyppi.models.binary_relevance import MixedBinaryRelevanceClassifier
 from pyppi.models.classifier_chain import KRandomClassifierChains
 from pyppi.models.utilities import make_gridsearch_clf
 
-from pyppi.data_mining.ontology import get_active_instance
+from pyppi.data_mining.ontology import (
+    get_active_instance, namespaces_for_selection
+)
 
 from pyppi.predict.utilities import load_validation_dataset
 from pyppi.predict.utilities import interactions_to_Xy_format
@@ -75,7 +77,6 @@ from pyppi.predict.plotting import plot_heatmaps
 
 
 from sklearn.exceptions import UndefinedMetricWarning, FitFailedWarning
-from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.base import clone
 from sklearn.metrics import (
     label_ranking_loss, hamming_loss,
@@ -130,12 +131,18 @@ if __name__ == "__main__":
     logger.info("Loading training and testing data.")
     ipr_map = ipr_name_map()
     pfam_map = pfam_name_map()
-    go_dag = get_active_instance()
+    go_dag = get_active_instance(
+        namespaces=namespaces_for_selection(selection)
+    )
 
     # Get the features into X, and multilabel y indicator format
     # -------------------------------------------------------------------- #
     logger.info("Preparing training and testing data.")
-    data = load_validation_dataset(selection=selection, taxon_id=9606)
+    # The count matrices are read from the design matrix cache when the
+    # database has not changed since they were last vectorised.
+    data = load_validation_dataset(
+        selection=selection, taxon_id=9606, vectorize=True, binary=use_binary
+    )
     labels = data['labels']
     X_train, y_train = data["training"]
     X_test, y_test = data["testing"]
@@ -218,8 +225,7 @@ if __name__ == "__main__":
             random_state=seeds_kfold[bs_iter],
             verbose=verbose
         )
-        vec = CountVectorizer(binary=use_binary, lowercase=False)
-        clf.fit(X_train, y_train, vectorizer=vec)
+        clf.fit(X_train, y_train)
 
         fp.write(f"\nBS {bs_iter}\n")
         for i, br in enumerate(clf.fold_estimators_):
@@ -339,9 +345,7 @@ if __name__ == "__main__":
     for idx, label in enumerate(mlb.classes_):
         selector = y_train[:, idx] == 1
         positive_cases = X_train[selector]
-        for feature_string in positive_cases:
-            unique = set(feature_string.split(','))
-            label_features[label] |= unique
+        label_features[label] |= set(positive_cases.indices.tolist())
 
     j_v_similarity_matrix = np.zeros((len(mlb.classes_), len(mlb.classes_)))
     d_v_similarity_matrix = np.zeros((len(mlb.classes_), len(mlb.classes_)))
@@ -391,9 +395,8 @@ if __name__ == "__main__":
         if label in holdout_labels:
             selector = y_test[:, idx] == 1
             positive_cases = X_test[selector]
-            for feature_string in positive_cases:
-                unique = set(feature_string.split(','))
-                holdout_label_features[label] |= unique
+            holdout_label_features[label] |= set(
+                positive_cases.indices.tolist())
 
     j_t_similarity_matrix = np.zeros((2, len(mlb.classes_)))
     d_t_similarity_matrix = np.zeros((2, len(mlb.classes_)))
@@ -3,10 +3,14 @@ from pyppi.tests import (
     test_database,
     test_database_utilities,
     test_features,
+    test_feature_cache,
+    test_feature_pool,
     test_uniprot,
     test_db_models,
     test_validators,
     test_ontology,
+    test_obo,
+    test_similarity,
     test_datamining_tools,
     test_generic,
     test_hprd,
@@ -17,8 +21,13 @@ from pyppi.tests import (
     test_kfold,
     test_predict,
     test_predict_utilities,
+    test_matrix_cache,
     test_base_utilities,
-    test_model_utilities
+    test_model_utilities,
+    test_feature_selection,
+    test_ingest,
+    test_dat_index,
+    test_async_download
 )
 
 if __name__ == "__main__":
@@ -37,6 +46,12 @@ if __name__ == "__main__":
     # tests = loader.discover(start_dir='./', pattern="test_features.py")
     # unittest.TextTestRunner().run(tests)
 
+    # tests = loader.discover(start_dir='./', pattern="test_feature_cache.py")
+    # unittest.TextTestRunner().run(tests)
+
+    # tests = loader.discover(start_dir='./', pattern="test_feature_pool.py")
+    # unittest.TextTestRunner().run(tests)
+
     # tests = loader.discover(start_dir='./', pattern="test_uniprot.py")
     # unittest.TextTestRunner().run(tests)
 
@@ -49,6 +64,12 @@ if __name__ == "__main__":
     # tests = loader.discover(start_dir='./', pattern="test_ontology.py")
     # unittest.TextTestRunner().run(tests)
 
+    # tests = loader.discover(start_dir='./', pattern="test_obo.py")
+    # unittest.TextTestRunner().run(tests)
+
+    # tests = loader.discover(start_dir='./', pattern="test_similarity.py")
+    # unittest.TextTestRunner().run(tests)
+
     # tests = loader.discover(
     #     start_dir='./', pattern="test_datamining_tools.py")
     # unittest.TextTestRunner().run(tests)
@@ -81,8 +102,25 @@ if __name__ == "__main__":
     #     start_dir='./', pattern="test_predict_utilities.py")
     # unittest.TextTestRunner().run(tests)
 
+    # tests = loader.discover(start_dir='./', pattern="test_matrix_cache.py")
+    # unittest.TextTestRunner().run(tests)
+
     # tests = loader.discover(start_dir='./', pattern="test_base_utilities.py")
     # unittest.TextTestRunner().run(tests)
 
     # tests = loader.discover(start_dir='./', pattern="test_model_utilities.py")
     # unittest.TextTestRunner().run(tests)
+
+    # tests = loader.discover(
+    #     start_dir='./', pattern="test_feature_selection.py")
+    # unittest.TextTestRunner().run(tests)
+
+    # tests = loader.discover(start_dir='./', pattern="test_ingest.py")
+    # unittest.TextTestRunner().run(tests)
+
+    # tests = loader.discover(start_dir='./', pattern="test_dat_index.py")
+    # unittest.TextTestRunner().run(tests)
+
+    # tests = loader.discover(
+    #     start_dir='./', pattern="test_async_download.py")
+    # unittest.TextTestRunner().run(tests)